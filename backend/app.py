@@ -1,15 +1,47 @@
-from fastapi import FastAPI, UploadFile, File
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, UploadFile, File, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
+import bisect
+import contextlib
+import csv
+import hashlib
+import json
 import shutil
 import os
+import queue
+import re
+import struct
+import subprocess
+import threading
+import time
+import uuid
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
 import cv2
 import numpy as np
-from collections import deque
+from collections import deque, OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
 import warnings
 warnings.filterwarnings('ignore')
 
-app = FastAPI()
+# Working directories of the server, relative to where it runs
+DATA_DIRS = ("uploads", "output", "cache")
+
+def ensure_data_dirs():
+    for name in DATA_DIRS:
+        os.makedirs(name, exist_ok=True)
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # Created when the server starts rather than on import, so batch.py and
+    # worker processes importing this module leave the working directory alone
+    ensure_data_dirs()
+    yield
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,36 +51,210 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-os.makedirs("uploads", exist_ok=True)
-os.makedirs("output", exist_ok=True)
+def scale_fit(fit, sx, sy):
+    """Re-express x = a*y^2 + b*y + c after scaling x by sx and y by sy"""
+    if fit is None:
+        return None
+    return np.array([fit[0] * sx / (sy * sy), fit[1] * sx / sy, fit[2] * sx])
+
+class GeometryCache:
+    """Small LRU of per-frame-size constants built on first use"""
+
+    def __init__(self, build, maxsize=4):
+        self.build = build
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+
+    def get(self, height, width):
+        key = (height, width)
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.build(height, width)
+            self.entries[key] = entry
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        else:
+            self.entries.move_to_end(key)
+        return entry
+
+class RingHistory:
+    """Fixed-capacity history of equal-shaped values in one preallocated array
+
+    Keeps the running sum and the rank-weighted sum of its items, so mean()
+    and weighted_mean() (weights rising linearly from 0.2 for the oldest to
+    1.0 for the newest, as np.linspace(0.2, 1.0, n)) cost O(1) per frame.
+    The sums are recomputed from the buffer each time it wraps so rounding
+    never accumulates.
+    """
+
+    def __init__(self, capacity, shape=()):
+        self.buffer = np.zeros((capacity,) + tuple(shape))
+        self.start = 0
+        self.count = 0
+        self._sum = np.zeros(shape)
+        self._ranked = np.zeros(shape)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        """Items oldest first"""
+        capacity = len(self.buffer)
+        return (self.buffer[(self.start + i) % capacity] for i in range(self.count))
+
+    def append(self, value):
+        capacity = len(self.buffer)
+        if self.count < capacity:
+            slot = (self.start + self.count) % capacity
+            self.buffer[slot] = value
+            self._ranked += self.count * self.buffer[slot]
+            self.count += 1
+        else:
+            # Dropping the oldest item lowers the rank of every other one by one
+            slot = self.start
+            self._sum -= self.buffer[slot]
+            self._ranked -= self._sum
+            self.buffer[slot] = value
+            self._ranked += (capacity - 1) * self.buffer[slot]
+            self.start = (self.start + 1) % capacity
+        self._sum += self.buffer[slot]
+        if self.count == capacity and self.start == 0:
+            self._resum()
+
+    def _resum(self):
+        ordered = np.roll(self.buffer, -self.start, axis=0)[:self.count]
+        ranks = np.arange(self.count).reshape((-1,) + (1,) * (self.buffer.ndim - 1))
+        self._sum = ordered.sum(axis=0)
+        self._ranked = (ordered * ranks).sum(axis=0)
+
+    def clear(self):
+        self.start = self.count = 0
+        self._sum[...] = 0
+        self._ranked[...] = 0
+
+    def scale(self, factors):
+        """Multiply every item by factors, in place"""
+        self.buffer *= factors
+        self._sum *= factors
+        self._ranked *= factors
+
+    def mean(self):
+        return self._sum / self.count
+
+    def weighted_mean(self):
+        n = self.count
+        if n == 1:
+            return self._sum.copy()
+        # sum of (0.2 + 0.8 * r / (n - 1)) * x_r over the total weight 0.6 * n
+        return (0.2 * self._sum + 0.8 / (n - 1) * self._ranked) / (0.6 * n)
+
+    def state(self):
+        """Items oldest first, as one array"""
+        return np.roll(self.buffer, -self.start, axis=0)[:self.count].copy()
+
+    def load(self, items):
+        """Replace the items with items, oldest first, as returned by state() or its tolist()"""
+        items = np.asarray(items, dtype=self.buffer.dtype).reshape((-1,) + self.buffer.shape[1:])[-len(self.buffer):]
+        self.start = 0
+        self.count = len(items)
+        self.buffer[:self.count] = items
+        self._resum()
+
+# Detection cost tiers, cheapest first. fast thresholds gradient and
+# brightness of the gray image only and fits by plain least squares;
+# accurate is the full chain over HLS, HSV and LAB with 5x5 Sobel kernels
+DETECTION_PROFILES = {
+    "fast": dict(single_channel=True, use_lab=False, sobel_ksize=3, nwindows=8, ransac_trials=0),
+    "balanced": dict(single_channel=False, use_lab=False, sobel_ksize=3, nwindows=10, ransac_trials=50),
+    "accurate": dict(single_channel=False, use_lab=True, sobel_ksize=5, nwindows=12, ransac_trials=100),
+}
+PROFILE_ORDER = tuple(DETECTION_PROFILES)
 
 class AdvancedLaneDetector:
-    def __init__(self):
-        self.left_fit_history = deque(maxlen=15)
-        self.right_fit_history = deque(maxlen=15)
+    def __init__(self, seed=0, detection_profile="accurate", auto_profile=False):
+        # Preallocated ring buffers keep per-detector state small and O(1) to smooth
+        self.left_fit_history = RingHistory(15, (3,))
+        self.right_fit_history = RingHistory(15, (3,))
 
-        self.offset_history = deque(maxlen=8)
+        self.offset_history = RingHistory(8)
         self.lane_departure_threshold = 0.3
         self.warning_active = False
         self.frame_count = 0
         self.lost_lane_count = 0
-        self.curvature_history = deque(maxlen=5)
-        
-    def adaptive_roi(self, img, perspective='car_pov'):
-        """Optimized ROI for better lane detection"""
-        height, width = img.shape[:2]
-        
+        self.curvature_history = RingHistory(5)
+        
+        # Seeded generator keeps RANSAC reproducible run to run
+        self.rng = np.random.default_rng(seed)
+        self.use_ransac = True
+        
+        # Search around the previous lanes while tracking is reliable
+        self.track_lanes = True
+        self.tracking = False
+        self.track_margin = 60
+        self.max_lost_frames = 5
+        self.prev_left_fit = None
+        self.prev_right_fit = None
+        
+        # With auto_profile the detector steps up from detection_profile while
+        # lanes are being lost and back down once tracking holds again
+        self.base_profile = detection_profile
+        self.auto_profile = auto_profile
+        self.escalate_lost_frames = 2
+        self.relax_stable_frames = 30
+        self.stable_frames = 0
+        self.lost_frames = 0
+        self.profile_switches = 0
+        self.set_detection_profile(detection_profile)
+        
+        # ROI masks, plot rows and scratch buffers depend only on the frame size
+        self._geometry = GeometryCache(self._build_geometry)
+        self._clahe = {}
+        # Frame brightness found by preprocess, reused when drawing
+        self.brightness = None
+        
+    def set_detection_profile(self, name):
+        """Switch preprocessing and fitting to one of DETECTION_PROFILES"""
+        for key, value in DETECTION_PROFILES[name].items():
+            setattr(self, key, value)
+        self.detection_profile = name
+    
+    def adapt_profile(self, found):
+        """Escalate after escalate_lost_frames lost frames, relax after relax_stable_frames good ones"""
+        level = PROFILE_ORDER.index(self.detection_profile)
+        if not found:
+            # Counts like lost_lane_count, but restarts at every switch so the
+            # heavier profile gets a few frames before escalating again
+            self.stable_frames = 0
+            self.lost_frames += 1
+            if self.lost_frames >= self.escalate_lost_frames and level < len(PROFILE_ORDER) - 1:
+                self.set_detection_profile(PROFILE_ORDER[level + 1])
+                self.profile_switches += 1
+                self.lost_frames = 0
+            return
+        self.lost_frames = 0
+        self.stable_frames += 1
+        if self.stable_frames >= self.relax_stable_frames and level > PROFILE_ORDER.index(self.base_profile):
+            self.set_detection_profile(PROFILE_ORDER[level - 1])
+            self.profile_switches += 1
+            self.stable_frames = 0
+    
+    def roi_vertices(self, height, width):
+        """ROI trapezoid shared by adaptive_roi and preprocess"""
         # Improved ROI for car dashboard perspective
-        vertices = np.array([
+        return np.array([
             [(width * 0.05, height),
              (width * 0.4, height * 0.6),
              (width * 0.6, height * 0.6),
              (width * 0.95, height)]
         ], dtype=np.int32)
-        
-        mask = np.zeros_like(img)
-        cv2.fillPoly(mask, vertices, 255)
-        return cv2.bitwise_and(img, mask)
+    
+    def adaptive_roi(self, img, perspective='car_pov'):
+        """Optimized ROI for better lane detection"""
+        height, width = img.shape[:2]
+        mask = self._geometry.get(height, width)['roi_mask']
+        if img.ndim == 2:
+            return cv2.bitwise_and(img, mask)
+        return cv2.bitwise_and(img, cv2.merge([mask] * img.shape[2]))
     
     def sliding_window(self, binary):
         """Advanced sliding window with history-based margin and RANSAC fitting"""
@@ -63,7 +269,7 @@ class AdvancedLaneDetector:
         rightx_base = np.argmax(histogram[midpoint:]) + midpoint
         
         # More windows for better precision in curves
-        nwindows = 12
+        nwindows = self.nwindows
         window_height = h // nwindows
         nonzero = binary.nonzero()
         nonzeroy = np.array(nonzero[0])
@@ -115,53 +321,147 @@ class AdvancedLaneDetector:
         rightx = nonzerox[right_lane_inds]
         righty = nonzeroy[right_lane_inds]
         
-        # RANSAC polynomial fitting to reject outliers
-        left_fit = self.ransac_polyfit(lefty, leftx) if len(leftx) > 80 else None
-        right_fit = self.ransac_polyfit(righty, rightx) if len(rightx) > 80 else None
+        # RANSAC polynomial fitting to reject outliers, or plain least squares when degraded
+        if self.use_ransac and self.ransac_trials > 0:
+            fit = lambda y, x: self.ransac_polyfit(y, x, max_trials=self.ransac_trials)
+        else:
+            fit = lambda y, x: np.polyfit(y, x, 2)
+        left_fit = fit(lefty, leftx) if len(leftx) > 80 else None
+        right_fit = fit(righty, rightx) if len(rightx) > 80 else None
+        
+        return left_fit, right_fit
+    
+    def search_around_fit(self, binary, left_prior, right_prior):
+        """Fit lanes from pixels inside a band around the previous polynomials"""
+        h, w = binary.shape
+        nonzeroy, nonzerox = binary.nonzero()
+        
+        # One vectorized pass: distance of every candidate pixel to both priors
+        y = nonzeroy.astype(np.float64)
+        y_sq = y * y
+        left_x = left_prior[0]*y_sq + left_prior[1]*y + left_prior[2]
+        right_x = right_prior[0]*y_sq + right_prior[1]*y + right_prior[2]
+        left_inds = np.abs(nonzerox - left_x) < self.track_margin
+        right_inds = np.abs(nonzerox - right_x) < self.track_margin
+        
+        leftx, lefty = nonzerox[left_inds], nonzeroy[left_inds]
+        rightx, righty = nonzerox[right_inds], nonzeroy[right_inds]
+        
+        # The band already rejects outliers, so plain least squares replaces RANSAC.
+        # Same pixel support sliding_window requires before fitting
+        left_fit = np.polyfit(lefty, leftx, 2) if len(leftx) > 80 else None
+        right_fit = np.polyfit(righty, rightx, 2) if len(rightx) > 80 else None
+        
+        # Lanes that cross inside the ROI mean the band latched onto the wrong marking;
+        # the prior is no longer trustworthy, so the next frame searches from scratch
+        if left_fit is not None and right_fit is not None:
+            check_y = np.array([h * 0.6, h - 1])
+            if np.any(np.polyval(left_fit, check_y) >= np.polyval(right_fit, check_y)):
+                self.tracking = False
+                return None, None
+        
+        return left_fit, right_fit
+    
+    def find_lanes(self, binary):
+        """Track around the previous fit, falling back to a full sliding-window search
+
+        A crossing in the tracked fits drops tracking at once, so the same frame
+        falls through to the sliding-window search instead of riding on history.
+        """
+        if self.track_lanes and self.tracking:
+            left_fit, right_fit = self.search_around_fit(binary, self.prev_left_fit, self.prev_right_fit)
+            if left_fit is not None and right_fit is not None:
+                self.lost_lane_count = 0
+                return left_fit, right_fit
+            
+            self.lost_lane_count += 1
+            if self.tracking and self.lost_lane_count <= self.max_lost_frames:
+                # Ride on the smoothed history for a few frames before searching again
+                return left_fit, right_fit
+            self.tracking = False
         
+        left_fit, right_fit = self.sliding_window(binary)
+        if left_fit is not None and right_fit is not None:
+            self.tracking = True
+            self.lost_lane_count = 0
+        else:
+            self.lost_lane_count += 1
         return left_fit, right_fit
     
-    def ransac_polyfit(self, y, x, max_trials=100, residual_threshold=50):
-        """RANSAC polynomial fitting to reject outliers"""
+    def ransac_polyfit(self, y, x, max_trials=100, residual_threshold=50,
+                       stop_inlier_ratio=0.9, batch_size=25):
+        """Batched RANSAC polynomial fitting to reject outliers"""
         if len(y) < 10:
             return None
-            
-        best_fit = None
-        best_inliers = 0
         
-        for _ in range(max_trials):
-            # Random sample
-            sample_indices = np.random.choice(len(y), min(10, len(y)//2), replace=False)
-            sample_y = y[sample_indices]
-            sample_x = x[sample_indices]
+        # Center and scale y so the 3x3 normal equations stay well conditioned
+        y = np.asarray(y, dtype=np.float64)
+        x = np.asarray(x, dtype=np.float64)
+        y_mean = y.mean()
+        y_scale = max(y.std(), 1.0)
+        t = (y - y_mean) / y_scale
+        design = np.stack([t * t, t, np.ones_like(t)])
+        sample_size = min(10, len(y)//2)
+        
+        best_coeffs = None
+        best_inliers = 0
+        for start in range(0, max_trials, batch_size):
+            trials = min(batch_size, max_trials - start)
             
-            try:
-                # Fit polynomial
-                fit = np.polyfit(sample_y, sample_x, 2)
-                
-                # Calculate residuals for all points
-                predicted_x = np.polyval(fit, y)
-                residuals = np.abs(x - predicted_x)
-                
-                # Count inliers
-                inliers = np.sum(residuals < residual_threshold)
-                
-                if inliers > best_inliers:
-                    best_inliers = inliers
-                    best_fit = fit
-                    
-            except:
+            # Solve every hypothesis of the batch at once
+            samples = self.rng.integers(0, len(y), size=(trials, sample_size))
+            coeffs = self._solve_quadratics(design[:, samples], x[samples])
+            if coeffs is None:
                 continue
+            
+            # Score all hypotheses against all points in one matrix operation
+            residuals = np.abs(x - coeffs @ design)
+            inliers = np.count_nonzero(residuals < residual_threshold, axis=1)
+            best = int(np.argmax(inliers))
+            if inliers[best] > best_inliers:
+                best_inliers = inliers[best]
+                best_coeffs = coeffs[best]
+            
+            # Good enough consensus, skip the remaining trials
+            if best_inliers >= stop_inlier_ratio * len(y):
+                break
+        
+        if best_coeffs is not None:
+            # Refit on the consensus set of the best hypothesis
+            mask = np.abs(x - best_coeffs @ design) < residual_threshold
+            refit = self._solve_quadratics(design[:, mask][:, None, :], x[mask][None, :])
+            if refit is not None:
+                best_coeffs = refit[0]
+            return self._unscale_fit(best_coeffs, y_mean, y_scale)
         
         # Fallback to regular polyfit if RANSAC fails
-        if best_fit is None:
-            try:
-                best_fit = np.polyfit(y, x, 2)
-            except:
-                return None
-                
-        return best_fit
+        try:
+            return np.polyfit(y, x, 2)
+        except:
+            return None
+    
+    @staticmethod
+    def _solve_quadratics(design, x):
+        """Least-squares quadratics for a batch of point sets
+
+        design has shape (3, batch, n) and x shape (batch, n). Sets whose normal
+        equations are singular are dropped; None when no set is solvable.
+        """
+        ata = np.einsum('ibn,jbn->bij', design, design)
+        atb = np.einsum('ibn,bn->bi', design, x)
+        solvable = np.abs(np.linalg.det(ata)) > 1e-9
+        if not np.any(solvable):
+            return None
+        return np.linalg.solve(ata[solvable], atb[solvable][..., None])[..., 0]
     
+    @staticmethod
+    def _unscale_fit(coeffs, y_mean, y_scale):
+        """Convert a fit in normalised t = (y - mean) / scale back to pixel y"""
+        a, b, c = coeffs
+        a_y = a / (y_scale * y_scale)
+        b_y = b / y_scale - 2 * a_y * y_mean
+        c_y = a_y * y_mean * y_mean - b * y_mean / y_scale + c
+        return np.array([a_y, b_y, c_y])    
 
     
 
@@ -171,10 +471,17 @@ class AdvancedLaneDetector:
         if left_fit is None or right_fit is None:
             return 0, False, 0
         
-        # Real-world conversions
+        # Real-world conversions, calibrated for frames AUTO_WORK_WIDTH wide
         ym_per_pix = 30/720  # meters per pixel in y dimension
         xm_per_pix = 3.7/700 # meters per pixel in x dimension
         
+        # Measure at the calibration width, so work_width does not change the metres
+        scale = AUTO_WORK_WIDTH / frame_width
+        if scale != 1:
+            left_fit = scale_fit(left_fit, scale, scale)
+            right_fit = scale_fit(right_fit, scale, scale)
+            frame_width, frame_height = AUTO_WORK_WIDTH, frame_height * scale
+        
         # Evaluation point at bottom of frame
         y_eval = frame_height
         
@@ -185,7 +492,7 @@ class AdvancedLaneDetector:
         # Average curvature
         curvature = (left_curverad + right_curverad) / 2
         self.curvature_history.append(curvature)
-        smooth_curvature = np.mean(self.curvature_history)
+        smooth_curvature = float(self.curvature_history.mean())
         
         # Calculate vehicle offset
         left_fitx = left_fit[0]*y_eval**2 + left_fit[1]*y_eval + left_fit[2]
@@ -197,7 +504,7 @@ class AdvancedLaneDetector:
         
         # Smooth offset using history
         self.offset_history.append(offset)
-        smooth_offset = np.mean(self.offset_history)
+        smooth_offset = float(self.offset_history.mean())
         
         # Adaptive threshold based on curvature
         if smooth_curvature > 1000:  # Straight road
@@ -217,41 +524,46 @@ class AdvancedLaneDetector:
             history.append(fit)
         if len(history) == 0:
             return None
-        weights = np.linspace(0.2, 1.0, len(history))
-        weights /= weights.sum()
-        return np.average(np.array(history), axis=0, weights=weights)
+        return history.weighted_mean()
     
     def draw_lane_with_dashes(self, frame, left_fit, right_fit, offset, lane_departure, curvature=0):
-        """Advanced drawing with adaptive dashes and curvature display"""
+        """Advanced drawing with adaptive dashes and curvature display
+
+        Draws onto frame in place: the lane area is blended only inside its
+        bounding box, all dashes go out in one polylines call and the static
+        part of the info panel comes from the per-frame-size cache.
+        """
         height, width = frame.shape[:2]
+        geometry = self._geometry.get(height, width)
         
-        # Detect if frame is dark for adaptive visualization
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        is_dark = np.mean(gray) < 100
+        # Brightness measured by preprocess, or of this frame when none ran yet
+        brightness = self.brightness
+        if brightness is None:
+            brightness = cv2.mean(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))[0]
+        is_dark = brightness < 100
+        line_thickness = 5 if is_dark else 4
+        line_color = (0, 255, 255)
         
         if left_fit is not None and right_fit is not None:
             # Dense points for smooth tracking
-            ploty = np.linspace(int(height * 0.5), height-5, 120)
-            left_fitx = left_fit[0]*ploty**2 + left_fit[1]*ploty + left_fit[2]
-            right_fitx = right_fit[0]*ploty**2 + right_fit[1]*ploty + right_fit[2]
+            ploty, ploty_sq = geometry['ploty_lane']
+            left_fitx = left_fit[0]*ploty_sq + left_fit[1]*ploty + left_fit[2]
+            right_fitx = right_fit[0]*ploty_sq + right_fit[1]*ploty + right_fit[2]
             
             left_fitx = np.clip(left_fitx, 0, width-1)
             right_fitx = np.clip(right_fitx, 0, width-1)
             
             # Draw lane area with enhanced visibility for night
-            overlay = np.zeros_like(frame)
-            pts_left = np.array([np.transpose(np.vstack([left_fitx, ploty]))])
-            pts_right = np.array([np.flipud(np.transpose(np.vstack([right_fitx, ploty])))])
-            pts = np.hstack((pts_left, pts_right))
+            pts = np.concatenate([np.stack([left_fitx, ploty], axis=1),
+                                  np.stack([right_fitx, ploty], axis=1)[::-1]]).astype(np.int32)
             
             if lane_departure:
                 color = (0, 0, 200) if not is_dark else (0, 0, 255)
             else:
                 color = (0, 180, 0) if not is_dark else (0, 255, 0)
             
-            cv2.fillPoly(overlay, pts.astype(np.int32), color)
             alpha = 0.15 if not is_dark else 0.25
-            frame = cv2.addWeighted(frame, 1-alpha, overlay, alpha, 0)
+            self._blend_polygon(frame, pts, color, alpha)
             
             # Adaptive dash length based on curvature
             if curvature > 1000:  # Straight road
@@ -264,22 +576,9 @@ class AdvancedLaneDetector:
                 dash_length = 2
                 gap_length = 1
             
-            # Enhanced line thickness for night videos
-            line_thickness = 5 if is_dark else 4
-            line_color = (0, 255, 255) if not is_dark else (0, 255, 255)
-            
-            for i in range(0, len(ploty)-dash_length, dash_length+gap_length):
-                if i+dash_length < len(ploty):
-                    y1 = int(ploty[i])
-                    y2 = int(ploty[i+dash_length])
-                    
-                    # Left lane dashes
-                    x1, x2 = int(left_fitx[i]), int(left_fitx[i+dash_length])
-                    cv2.line(frame, (x1, y1), (x2, y2), line_color, line_thickness)
-                    
-                    # Right lane dashes
-                    x1, x2 = int(right_fitx[i]), int(right_fitx[i+dash_length])
-                    cv2.line(frame, (x1, y1), (x2, y2), line_color, line_thickness)
+            dashes = [self._dash_segments(fitx, ploty, dash_length, gap_length)
+                      for fitx in (left_fitx, right_fitx)]
+            cv2.polylines(frame, np.concatenate(dashes), False, line_color, line_thickness)
             
             # Enhanced warnings for lane departure - left top corner
             if lane_departure:
@@ -290,59 +589,60 @@ class AdvancedLaneDetector:
                 cv2.putText(frame, 'RETURN TO LANE', (20, 75), 
                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, warning_color, 2)
         
-        elif left_fit is not None:
-            ploty = np.linspace(int(height * 0.5), height-5, 80)
-            left_fitx = np.clip(left_fit[0]*ploty**2 + left_fit[1]*ploty + left_fit[2], 0, width-1)
-            
-            line_thickness = 5 if is_dark else 4
-            for i in range(0, len(ploty)-3, 6):
-                if i+3 < len(ploty):
-                    y1, y2 = int(ploty[i]), int(ploty[i+3])
-                    x1, x2 = int(left_fitx[i]), int(left_fitx[i+3])
-                    cv2.line(frame, (x1, y1), (x2, y2), (0, 255, 255), line_thickness)
-        
-        elif right_fit is not None:
-            ploty = np.linspace(int(height * 0.5), height-5, 80)
-            right_fitx = np.clip(right_fit[0]*ploty**2 + right_fit[1]*ploty + right_fit[2], 0, width-1)
-            
-            line_thickness = 5 if is_dark else 4
-            for i in range(0, len(ploty)-3, 6):
-                if i+3 < len(ploty):
-                    y1, y2 = int(ploty[i]), int(ploty[i+3])
-                    x1, x2 = int(right_fitx[i]), int(right_fitx[i+3])
-                    cv2.line(frame, (x1, y1), (x2, y2), (0, 255, 255), line_thickness)
+        elif left_fit is not None or right_fit is not None:
+            fit = left_fit if left_fit is not None else right_fit
+            ploty, ploty_sq = geometry['ploty_single']
+            fitx = np.clip(fit[0]*ploty_sq + fit[1]*ploty + fit[2], 0, width-1)
+            cv2.polylines(frame, self._dash_segments(fitx, ploty, 3, 3), False, line_color, line_thickness)
         
         self._draw_professional_ui(frame, offset, lane_departure, curvature)
         return frame
     
+    @staticmethod
+    def _blend_polygon(frame, pts, color, alpha):
+        """Alpha-blend color into frame inside the polygon pts, touching only its bounding box"""
+        x, y, w, h = cv2.boundingRect(pts)
+        if w == 0 or h == 0:
+            return
+        roi = frame[y:y + h, x:x + w]
+        mask = np.zeros((h, w), dtype=np.uint8)
+        cv2.fillPoly(mask, [pts - (x, y)], 255)
+        # Scale then add the colour as a scalar; no solid colour image needed
+        tinted = cv2.add(cv2.convertScaleAbs(roi, alpha=1 - alpha), tuple(c * alpha for c in color) + (0,))
+        cv2.copyTo(tinted, mask, roi)
+    
+    @staticmethod
+    def _dash_segments(fitx, ploty, dash_length, gap_length):
+        """Dashes along a lane as an array of two-point polylines"""
+        starts = np.arange(0, len(ploty) - dash_length, dash_length + gap_length)
+        points = np.stack([fitx, ploty], axis=1).astype(np.int32)
+        return np.stack([points[starts], points[starts + dash_length]], axis=1)
+    
     def _draw_professional_ui(self, frame, offset, lane_departure, curvature=0):
         """Enhanced UI with curvature display and improved metrics"""
         height, width = frame.shape[:2]
         
         # Calculate accurate confidence
-        left_conf = min(len(self.left_fit_history), 10) / 10.0
-        right_conf = min(len(self.right_fit_history), 10) / 10.0
-        total_conf = (left_conf + right_conf) / 2.0
+        total_conf = self.confidence()
         
         # Expanded info box for curvature
-        box_width = 200
-        box_height = 70
-        box_x = width - box_width - 10
-        box_y = 10
-        
-        # Colors
-        bg_color = (25, 25, 35)
-        status_color = (220, 50, 50) if lane_departure else (50, 200, 50)
+        box_x, box_y = self._ui_box(width)
         text_color = (240, 240, 240)
+        status_color = (220, 50, 50) if lane_departure else (50, 200, 50)
         
-        # Draw main info box
-        cv2.rectangle(frame, (box_x, box_y), (box_x + box_width, box_y + box_height), bg_color, -1)
-        cv2.rectangle(frame, (box_x, box_y), (box_x + box_width, box_y + box_height), status_color, 2)
-        
-        # Status
-        status = 'DEPARTURE' if lane_departure else 'TRACKING'
-        cv2.putText(frame, status, (box_x + 8, box_y + 18), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.4, status_color, 1)
+        # Box, border and status line are static, stamped from the per-size cache
+        panels = self._geometry.get(height, width)['ui_panels']
+        panel = panels.get(lane_departure)
+        if panel is None:
+            panel = panels[lane_departure] = self._render_ui_panel(lane_departure)
+        image, mask = panel
+        pad = self.UI_PANEL_PAD
+        if box_x >= pad:
+            region = frame[box_y - pad:box_y - pad + image.shape[0], box_x - pad:box_x - pad + image.shape[1]]
+            cv2.copyTo(image, mask, region)
+        else:
+            # Frames too narrow for the whole panel draw it clipped
+            self._draw_ui_panel(frame, box_x, box_y, lane_departure)
         
         # Confidence
         cv2.putText(frame, f'Confidence: {total_conf:.0%}', (box_x + 8, box_y + 35), 
@@ -366,43 +666,78 @@ class AdvancedLaneDetector:
         cv2.circle(frame, (20, height - 20), 8, status_color, -1)
         cv2.circle(frame, (20, height - 20), 8, (255, 255, 255), 1)
     
+    UI_BOX_SIZE = (200, 70)
+    # The 2 px border reaches one pixel outside the box
+    UI_PANEL_PAD = 1
+    
+    def _ui_box(self, width):
+        """Top-left corner of the info box"""
+        return width - self.UI_BOX_SIZE[0] - 10, 10
+    
+    def _draw_ui_panel(self, img, box_x, box_y, lane_departure):
+        """Static part of the info box: background, border and status"""
+        box_width, box_height = self.UI_BOX_SIZE
+        bg_color = (25, 25, 35)
+        status_color = (220, 50, 50) if lane_departure else (50, 200, 50)
+        cv2.rectangle(img, (box_x, box_y), (box_x + box_width, box_y + box_height), bg_color, -1)
+        cv2.rectangle(img, (box_x, box_y), (box_x + box_width, box_y + box_height), status_color, 2)
+        status = 'DEPARTURE' if lane_departure else 'TRACKING'
+        cv2.putText(img, status, (box_x + 8, box_y + 18), 
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.4, status_color, 1)
+    
+    def _render_ui_panel(self, lane_departure):
+        """(image, mask) of the static info box, padded by UI_PANEL_PAD on every side"""
+        box_width, box_height = self.UI_BOX_SIZE
+        pad = self.UI_PANEL_PAD
+        shape = (box_height + 1 + 2 * pad, box_width + 1 + 2 * pad)
+        image = np.zeros(shape + (3,), dtype=np.uint8)
+        self._draw_ui_panel(image, pad, pad, lane_departure)
+        # Same drawing in white marks every pixel the panel covers
+        mask = np.zeros(shape + (3,), dtype=np.uint8)
+        box_x, box_y = pad, pad
+        cv2.rectangle(mask, (box_x, box_y), (box_x + box_width, box_y + box_height), (255, 255, 255), -1)
+        cv2.rectangle(mask, (box_x, box_y), (box_x + box_width, box_y + box_height), (255, 255, 255), 2)
+        return image, mask[..., 0]
+    
     def preprocess(self, frame):
-        """Advanced preprocessing with LAB, adaptive thresholds, and improved gradients"""
-        # Multiple color spaces for maximum robustness
-        hls = cv2.cvtColor(frame, cv2.COLOR_BGR2HLS)
-        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-        lab = cv2.cvtColor(frame, cv2.COLOR_BGR2LAB)
+        """Advanced preprocessing with LAB, adaptive thresholds, and improved gradients
+
+        Thresholds are evaluated only inside the ROI bounding box; everything
+        outside it stays zero because adaptive_roi discards it anyway. The
+        detection profile picks the Sobel kernel and the colour spaces used.
+        The returned mask is a per-frame-size buffer that the next call reuses.
+        """
+        height, width = frame.shape[:2]
+        buf = self._geometry.get(height, width)
+        y0, y1, x0, x1 = buf['roi_box']
         
         # Adaptive brightness detection
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        brightness = np.mean(gray)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=buf['gray'])
+        brightness = self.brightness = cv2.mean(gray)[0]
         is_dark = brightness < 100
         
-        # Enhanced contrast with adaptive CLAHE
-        l = hls[:,:,1]
+        # Enhanced contrast with adaptive CLAHE. CLAHE tiles cover the whole
+        # frame, so the L channel is converted at full size. Single-channel
+        # profiles work on the gray image instead
+        if self.single_channel:
+            l = gray
+        else:
+            hls = cv2.cvtColor(frame, cv2.COLOR_BGR2HLS, dst=buf['hls'])
+            l = cv2.extractChannel(hls, 1, dst=buf['l'])
         clahe_limit = 3.0 if is_dark else 2.0
-        clahe = cv2.createCLAHE(clipLimit=clahe_limit, tileGridSize=(8,8))
-        l_enhanced = clahe.apply(l)
+        clahe = self._clahe.get(clahe_limit)
+        if clahe is None:
+            clahe = self._clahe[clahe_limit] = cv2.createCLAHE(clipLimit=clahe_limit, tileGridSize=(8,8))
+        l_enhanced = clahe.apply(l, dst=buf['l_enhanced'])
         
         # Gaussian blur before Sobel to reduce noise
-        l_blurred = cv2.GaussianBlur(l_enhanced, (5, 5), 0)
+        l_blurred = cv2.GaussianBlur(l_enhanced, (5, 5), 0, dst=buf['l_blurred'])
         
-        # Advanced gradient detection with magnitude and direction
-        sobelx = cv2.Sobel(l_blurred, cv2.CV_64F, 1, 0, ksize=5)
-        sobely = cv2.Sobel(l_blurred, cv2.CV_64F, 0, 1, ksize=5)
-        grad_mag = np.sqrt(sobelx**2 + sobely**2)
-        grad_dir = np.arctan2(np.abs(sobely), np.abs(sobelx))
-        
-        # Normalize gradients
-        if np.max(grad_mag) > 0:
-            scaled_mag = np.uint8(255 * grad_mag / np.max(grad_mag))
-        else:
-            scaled_mag = np.zeros_like(grad_mag, dtype=np.uint8)
-            
-        if np.max(sobelx) > 0:
-            scaled_sobelx = np.uint8(255 * np.abs(sobelx) / np.max(np.abs(sobelx)))
-        else:
-            scaled_sobelx = np.zeros_like(sobelx, dtype=np.uint8)
+        # Exact integer gradients. Normalisation divides by whole-frame maxima,
+        # so those are still taken over the full frame
+        sobelx = cv2.Sobel(l_blurred, cv2.CV_16S, 1, 0, dst=buf['sobelx'], ksize=self.sobel_ksize)
+        min_x, max_x = cv2.minMaxLoc(sobelx)[:2]
+        max_abs_x = max(max_x, -min_x)
         
         # Adaptive thresholds based on brightness
         if is_dark:
@@ -413,52 +748,148 @@ class AdvancedLaneDetector:
             grad_thresh = (25, 255)
             s_thresh = (100, 255)
             l_thresh = (200, 255)
+        g_low, g_high = grad_thresh
         
-        # Gradient binaries with magnitude and direction
-        mag_binary = np.zeros_like(scaled_mag)
-        mag_binary[(scaled_mag >= grad_thresh[0]) & (scaled_mag <= grad_thresh[1])] = 1
-        
-        dir_binary = np.zeros_like(grad_dir)
-        dir_binary[(grad_dir >= 0.7) & (grad_dir <= 1.3)] = 1
-        
-        gradx_binary = np.zeros_like(scaled_sobelx)
-        gradx_binary[(scaled_sobelx >= grad_thresh[0]) & (scaled_sobelx <= grad_thresh[1])] = 1
+        # Work inside the ROI bounding box from here on
+        abs_x = np.abs(sobelx[y0:y1, x0:x1], out=buf['abs_x'])
         
-        # Color detection in multiple spaces
-        s = hls[:,:,2]
-        s_binary = np.zeros_like(s)
-        s_binary[(s >= s_thresh[0]) & (s <= s_thresh[1])] = 1
-        
-        # Enhanced yellow detection in HSV
-        yellow_lower = np.array([18, 80 if is_dark else 100, 80 if is_dark else 100])
-        yellow_upper = np.array([35, 255, 255])
-        yellow_mask = cv2.inRange(hsv, yellow_lower, yellow_upper)
-        
-        # White detection in HLS and LAB
-        white_hls = np.zeros_like(l)
-        white_hls[(l >= l_thresh[0]) & (s <= 40)] = 1
+        # Thresholds on the 0-255 scaled gradients become integer ranges on the raw values
+        gradx_binary = buf['gradx']
+        if max_x > 0:
+            max_abs_x = int(max_abs_x)
+            cv2.inRange(abs_x, self._scaled_threshold(g_low, max_abs_x),
+                        self._scaled_threshold(g_high + 1, max_abs_x) - 1, dst=gradx_binary)
+        else:
+            gradx_binary[:] = 0
         
-        # LAB color space for shadows and lighting variations
-        l_lab = lab[:,:,0]
-        white_lab = np.zeros_like(l_lab)
-        white_lab[l_lab >= (160 if is_dark else 180)] = 1
+        combined_roi = buf['combined']
+        if self.single_channel:
+            # x gradient plus bright gray pixels, no colour conversions at all
+            white = cv2.inRange(gray[y0:y1, x0:x1], l_thresh[0], l_thresh[1], dst=buf['white_hls'])
+            cv2.bitwise_or(gradx_binary, white, dst=combined_roi)
+        else:
+            sobely = cv2.Sobel(l_blurred, cv2.CV_16S, 0, 1, dst=buf['sobely'], ksize=self.sobel_ksize)
+            mag_sq = np.multiply(sobelx, sobelx, out=buf['mag_sq'], dtype=np.int32)
+            mag_sq += np.multiply(sobely, sobely, out=buf['mag_sq_tmp'], dtype=np.int32)
+            max_mag_sq = int(mag_sq.max())
+            abs_y = np.abs(sobely[y0:y1, x0:x1], out=buf['abs_y'])
+        
+            # Same test on the squared magnitude avoids the sqrt
+            mag_binary = buf['mag']
+            if max_mag_sq > 0:
+                cv2.inRange(mag_sq[y0:y1, x0:x1], self._scaled_threshold(g_low, max_mag_sq, squared=True),
+                            self._scaled_threshold(g_high + 1, max_mag_sq, squared=True) - 1, dst=mag_binary)
+            else:
+                mag_binary[:] = 0
+        
+            # arctan2(|sy|, |sx|) in [0.7, 1.3]  <=>  tan(0.7)|sx| <= |sy| <= tan(1.3)|sx|
+            abs_y_f = buf['abs_y_f']
+            abs_y_f[:] = abs_y
+            bound = np.multiply(abs_x, np.float32(np.tan(0.7)), out=buf['bound'], dtype=np.float32)
+            dir_binary = np.greater_equal(abs_y_f, bound, out=buf['dir'])
+            np.multiply(abs_x, np.float32(np.tan(1.3)), out=bound, dtype=np.float32)
+            np.logical_and(dir_binary, np.less_equal(abs_y_f, bound, out=buf['dir_tmp']), out=dir_binary)
+        
+            # Color detection in multiple spaces
+            hls_roi = hls[y0:y1, x0:x1]
+            frame_roi = frame[y0:y1, x0:x1]
+            s_binary = cv2.inRange(hls_roi, (0, 0, s_thresh[0]), (255, 255, s_thresh[1]), dst=buf['s'])
+        
+            # Enhanced yellow detection in HSV
+            hsv = cv2.cvtColor(frame_roi, cv2.COLOR_BGR2HSV, dst=buf['hsv'])
+            yellow_lower = (18, 80 if is_dark else 100, 80 if is_dark else 100)
+            yellow_upper = (35, 255, 255)
+            yellow_mask = cv2.inRange(hsv, yellow_lower, yellow_upper, dst=buf['yellow'])
+        
+            # White detection in HLS
+            white_hls = cv2.inRange(hls_roi, (0, l_thresh[0], 0), (255, 255, 40), dst=buf['white_hls'])
+        
+            # Combine all detection methods
+            cv2.bitwise_and(mag_binary, dir_binary.view(np.uint8), dst=combined_roi)
+            cv2.bitwise_or(combined_roi, gradx_binary, dst=combined_roi)
+            cv2.bitwise_or(combined_roi, s_binary, dst=combined_roi)
+            cv2.bitwise_or(combined_roi, yellow_mask, dst=combined_roi)
+            cv2.bitwise_or(combined_roi, white_hls, dst=combined_roi)
+        
+            # LAB color space for shadows and lighting variations
+            if self.use_lab:
+                lab = cv2.cvtColor(frame_roi, cv2.COLOR_BGR2LAB, dst=buf['lab'])
+                white_lab = cv2.inRange(lab, (160 if is_dark else 180, 0, 0), (255, 255, 255),
+                                        dst=buf['white_lab'])
+                cv2.bitwise_or(combined_roi, white_lab, dst=combined_roi)
+        
+        # Final combination with priority on color detection. Only the ROI box
+        # is ever written, so the cached mask stays zero everywhere else
+        combined = buf['binary']
+        cv2.compare(combined_roi, 0, cv2.CMP_NE, dst=combined[y0:y1, x0:x1])
         
-        # Combine all detection methods
-        gradient_combined = np.zeros_like(mag_binary)
-        gradient_combined[(gradx_binary == 1) | ((mag_binary == 1) & (dir_binary == 1))] = 1
+        return combined
+    
+    @staticmethod
+    def _scaled_threshold(t, max_value, squared=False):
+        """Smallest integer v with uint8(255 * v / max_value) >= t, rounded as float64 scaling does"""
+        def scaled(v):
+            if squared:
+                return 255 * np.sqrt(np.float64(v)) / np.sqrt(np.float64(max_value))
+            return 255 * np.float64(v) / np.float64(max_value)
+        
+        # Exact rational bound, then nudged onto the float64 result at ties
+        v = -(-t * t * max_value // 65025) if squared else -(-t * max_value // 255)
+        while v > 0 and scaled(v - 1) >= t:
+            v -= 1
+        while scaled(v) < t:
+            v += 1
+        return v
+    
+    def _build_geometry(self, height, width):
+        """Constants and scratch buffers that depend only on the frame size"""
+        vertices = self.roi_vertices(height, width)
+        roi_mask = np.zeros((height, width), dtype=np.uint8)
+        cv2.fillPoly(roi_mask, vertices, 255)
         
-        color_combined = np.zeros_like(s_binary)
-        color_combined[(s_binary == 1) | (yellow_mask > 0) | (white_hls == 1) | (white_lab == 1)] = 1
+        x0, y0 = np.clip(vertices[0].min(axis=0), 0, None)
+        x1 = min(int(vertices[0][:, 0].max()) + 1, width)
+        y1 = min(int(vertices[0][:, 1].max()) + 1, height)
+        roi = (y1 - y0, x1 - x0)
         
-        # Final combination with priority on color detection
-        combined = np.zeros_like(gradient_combined)
-        combined[(color_combined == 1) | (gradient_combined == 1)] = 255
+        ploty_lane = np.linspace(int(height * 0.5), height-5, 120)
+        ploty_single = np.linspace(int(height * 0.5), height-5, 80)
         
-        return combined
+        return {
+            'roi_mask': roi_mask,
+            'roi_box': (int(y0), int(y1), int(x0), int(x1)),
+            'ploty_lane': (ploty_lane, ploty_lane**2),
+            'ploty_single': (ploty_single, ploty_single**2),
+            'ui_panels': {},
+            'gray': np.empty((height, width), np.uint8),
+            'binary': np.zeros((height, width), np.uint8),
+            'hls': np.empty((height, width, 3), np.uint8),
+            'l': np.empty((height, width), np.uint8),
+            'l_enhanced': np.empty((height, width), np.uint8),
+            'l_blurred': np.empty((height, width), np.uint8),
+            'sobelx': np.empty((height, width), np.int16),
+            'sobely': np.empty((height, width), np.int16),
+            'mag_sq': np.empty((height, width), np.int32),
+            'mag_sq_tmp': np.empty((height, width), np.int32),
+            'abs_x': np.empty(roi, np.int16),
+            'abs_y': np.empty(roi, np.int16),
+            'abs_y_f': np.empty(roi, np.float32),
+            'bound': np.empty(roi, np.float32),
+            'dir': np.empty(roi, np.bool_),
+            'dir_tmp': np.empty(roi, np.bool_),
+            'gradx': np.empty(roi, np.uint8),
+            'mag': np.empty(roi, np.uint8),
+            's': np.empty(roi, np.uint8),
+            'hsv': np.empty(roi + (3,), np.uint8),
+            'yellow': np.empty(roi, np.uint8),
+            'white_hls': np.empty(roi, np.uint8),
+            'lab': np.empty(roi + (3,), np.uint8),
+            'white_lab': np.empty(roi, np.uint8),
+            'combined': np.empty(roi, np.uint8),
+        }
     
-    def process_frame(self, frame):
-        """Advanced frame processing with all improvements"""
-        self.frame_count += 1
+    def detect(self, frame):
+        """Run the detection chain and update temporal state without drawing"""
         height, width = frame.shape[:2]
         
         # Advanced preprocessing with LAB, adaptive thresholds
@@ -467,111 +898,2724 @@ class AdvancedLaneDetector:
         # Apply optimized ROI
         roi_binary = self.adaptive_roi(binary)
         
-        # Advanced sliding window with RANSAC
-        left_fit, right_fit = self.sliding_window(roi_binary)
+        return self.track(roi_binary, width, height)
+    
+    def track(self, roi_binary, width, height):
+        """Stateful half of detect: fit, smooth and measure lanes on a preprocessed ROI binary
+
+        preprocess and adaptive_roi depend only on the frame, so they may run
+        on another detector (see StreamServer).
+        """
+        self.frame_count += 1
+        
+        # Tracking around the last lanes, or the full sliding window with RANSAC
+        left_fit, right_fit = self.find_lanes(roi_binary)
+        if self.auto_profile:
+            self.adapt_profile(left_fit is not None and right_fit is not None)
         
         # Smooth using weighted history
         left_fit = self.average_fit(left_fit, self.left_fit_history)
         right_fit = self.average_fit(right_fit, self.right_fit_history)
+        self.prev_left_fit, self.prev_right_fit = left_fit, right_fit
+        if left_fit is None or right_fit is None:
+            self.tracking = False
         
         # Calculate curvature and offset with smoothing
         offset, lane_departure, curvature = self.calculate_curvature_and_offset(
             left_fit, right_fit, width, height)
         
+        return left_fit, right_fit, offset, lane_departure, curvature
+    
+    def rescale_history(self, sx, sy):
+        """Carry fit history over to a working resolution scaled by (sx, sy)
+
+        Offset and curvature histories are in metres measured at the
+        calibration width, so they carry over unchanged.
+        """
+        # scale_fit is linear in the coefficients, so the history scales in place
+        factors = scale_fit(np.ones(3), sx, sy)
+        self.left_fit_history.scale(factors)
+        self.right_fit_history.scale(factors)
+        self.prev_left_fit = scale_fit(self.prev_left_fit, sx, sy)
+        self.prev_right_fit = scale_fit(self.prev_right_fit, sx, sy)
+    
+    STATE_HISTORIES = ("left_fit_history", "right_fit_history", "offset_history", "curvature_history")
+
+    def state_dict(self):
+        """Temporal state as JSON-safe values (lists, ints, strings), for checkpoints (see load_state)"""
+        def as_list(fit):
+            return None if fit is None else np.asarray(fit, dtype=np.float64).tolist()
+
+        state = {name: getattr(self, name).state().tolist() for name in self.STATE_HISTORIES}
+        state.update(frame_count=int(self.frame_count), lost_lane_count=int(self.lost_lane_count),
+                     tracking=bool(self.tracking), prev_left_fit=as_list(self.prev_left_fit),
+                     prev_right_fit=as_list(self.prev_right_fit), rng=self.rng.bit_generator.state,
+                     use_ransac=bool(self.use_ransac), detection_profile=self.detection_profile,
+                     stable_frames=int(self.stable_frames), lost_frames=int(self.lost_frames),
+                     profile_switches=int(self.profile_switches))
+        return state
+
+    def load_state(self, state):
+        """Restore temporal state saved by state_dict, continuing where it left off"""
+        for name in self.STATE_HISTORIES:
+            getattr(self, name).load(state[name])
+        self.frame_count = state["frame_count"]
+        self.lost_lane_count = state["lost_lane_count"]
+        self.tracking = state["tracking"]
+        self.prev_left_fit = None if state["prev_left_fit"] is None else np.array(state["prev_left_fit"])
+        self.prev_right_fit = None if state["prev_right_fit"] is None else np.array(state["prev_right_fit"])
+        self.rng.bit_generator.state = state["rng"]
+        self.use_ransac = state["use_ransac"]
+        self.set_detection_profile(state["detection_profile"])
+        self.stable_frames = state["stable_frames"]
+        self.lost_frames = state["lost_frames"]
+        self.profile_switches = state["profile_switches"]
+        return self
+
+    def confidence(self):
+        """Confidence from how much fit history backs each lane"""
+        left_conf = min(len(self.left_fit_history), 10) / 10.0
+        right_conf = min(len(self.right_fit_history), 10) / 10.0
+        return (left_conf + right_conf) / 2.0
+    
+    def telemetry_record(self, left_fit, right_fit, offset, lane_departure, curvature):
+        """Compact per-frame record laid out as TELEMETRY_FIELDS"""
+        missing = (np.nan, np.nan, np.nan)
+        return (self.frame_count - 1,
+                *(missing if left_fit is None else (float(c) for c in left_fit)),
+                *(missing if right_fit is None else (float(c) for c in right_fit)),
+                float(offset), float(curvature), bool(lane_departure), self.confidence())
+    
+    def analyze(self, frame):
+        """Telemetry-only processing: detection without any drawing"""
+        return self.telemetry_record(*self.detect(frame))
+    
+    def process_frame(self, frame):
+        """Advanced frame processing with all improvements"""
+        left_fit, right_fit, offset, lane_departure, curvature = self.detect(frame)
+        
         # Advanced drawing with adaptive dashes and curvature display
         result_frame = self.draw_lane_with_dashes(frame, left_fit, right_fit, 
                                                  offset, lane_departure, curvature)
         
         return result_frame
 
-# Global detector instance
-detector = AdvancedLaneDetector()
+UPLOAD_BLOCK = 1 << 20
+# Largest accepted upload, and how long an upload may sit untouched before it is deleted
+UPLOAD_MAX_BYTES = int(float(os.environ.get("LANESIGHT_MAX_UPLOAD_MB", 8192)) * 1024 * 1024)
+UPLOAD_EXPIRE_SECONDS = float(os.environ.get("LANESIGHT_UPLOAD_EXPIRE_S", 24 * 3600))
+
+def safe_filename(filename):
+    """Basename of a client-supplied file name with anything unusual replaced"""
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", os.path.basename(filename or "")).lstrip(".")
+    return name or "video"
 
 @app.post("/upload-video")
-async def upload_video(file: UploadFile = File(...)):
-    file_path = f"uploads/{file.filename}"
+def upload_video(file: UploadFile = File(...)):
+    # A plain def runs in the threadpool, so copying and hashing a large file never blocks the event loop.
+    # Prefixed with an ID so uploads of the same name never overwrite each other
+    filename = f"{uuid.uuid4().hex[:12]}_{safe_filename(file.filename)}"
+    file_path = f"uploads/{filename}"
+    expire_uploads()
+    digest, size = hashlib.sha256(), 0
     with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    return {"filename": file.filename}
+        while block := file.file.read(UPLOAD_BLOCK):
+            size += len(block)
+            if size > UPLOAD_MAX_BYTES:
+                break
+            digest.update(block)
+            buffer.write(block)
+    if size > UPLOAD_MAX_BYTES:
+        os.remove(file_path)
+        return {"status": "error", "message": f"Upload exceeds {UPLOAD_MAX_BYTES >> 20} MB"}
+    remember_digest(file_path, digest.hexdigest())
+    return {"filename": filename}
 
-@app.get("/start-detection")
-def start_detection(filename: str):
+class UploadSession:
+    """Resumable upload written in place under uploads/ and hashed as it arrives
+
+    Bytes must arrive in order at the current offset. After a dropped
+    connection the client asks for the offset and resumes from there; a
+    sidecar file lets the session survive a server restart.
+    """
+
+    def __init__(self, upload_id, filename, size, offset=0, digest=None):
+        self.upload_id = upload_id
+        self.filename = filename
+        self.path = f"uploads/{filename}"
+        self.size = size
+        self.offset = offset
+        self.digest = digest or hashlib.sha256()
+        self.sha256 = None
+        self.receiving = False
+        self.progress = threading.Condition()
+
+    @staticmethod
+    def sidecar(upload_id):
+        return f"uploads/.{upload_id}.upload.json"
+
+    @classmethod
+    def create(cls, filename, size):
+        upload_id = uuid.uuid4().hex[:12]
+        session = cls(upload_id, f"{upload_id}_{safe_filename(filename)}", size)
+        open(session.path, "wb").close()
+        with open(cls.sidecar(upload_id), "w") as f:
+            json.dump({"filename": session.filename, "size": size}, f)
+        return session
+
+    @classmethod
+    def recover(cls, upload_id):
+        """Rebuild an unfinished session from its sidecar and the bytes already on disk"""
+        with open(cls.sidecar(upload_id)) as f:
+            meta = json.load(f)
+        path = f"uploads/{meta['filename']}"
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(UPLOAD_BLOCK), b""):
+                digest.update(block)
+        return cls(upload_id, meta["filename"], meta["size"], os.path.getsize(path), digest)
+
+    @property
+    def complete(self):
+        return self.offset >= self.size
+
+    def append(self, f, chunk):
+        """Write the next chunk at the end of the received data"""
+        chunk = chunk[:self.size - self.offset]
+        f.write(chunk)
+        self.digest.update(chunk)
+        with self.progress:
+            self.offset += len(chunk)
+            self.progress.notify_all()
+
+    def finish(self):
+        self.sha256 = self.digest.hexdigest()
+        remember_digest(self.path, self.sha256)
+        os.remove(self.sidecar(self.upload_id))
+
+    def wait(self, offset, timeout):
+        """Block until offset bytes have arrived or the upload is complete"""
+        with self.progress:
+            return self.progress.wait_for(lambda: self.offset >= offset or self.complete, timeout)
+
+    def to_dict(self):
+        return {
+            "upload_id": self.upload_id,
+            "filename": self.filename,
+            "size": self.size,
+            "offset": self.offset,
+            "complete": self.complete,
+            "sha256": self.sha256,
+        }
+
+# Unfinished uploads; a session leaves once its last byte arrives and only its
+# final status is kept, for clients that lost the response to the last PUT
+upload_sessions = {}
+finished_uploads = OrderedDict()
+FINISHED_UPLOADS_KEPT = 256
+# Upload ID of every unfinished upload by file name, see upload_index
+upload_files = None
+upload_sessions_lock = threading.Lock()
+SIDECAR_NAME = re.compile(r"\.([0-9a-f]{12})\.upload\.json")
+
+def upload_index():
+    """File name -> upload ID of unfinished uploads, read from the sidecars on first use; hold upload_sessions_lock"""
+    global upload_files
+    if upload_files is None:
+        # Sidecars outlive a restart, so the index covers uploads no client has resumed yet
+        upload_files = {}
+        for name in os.listdir("uploads"):
+            match = SIDECAR_NAME.fullmatch(name)
+            try:
+                if match is not None:
+                    with open(f"uploads/{name}") as f:
+                        upload_files[json.load(f)["filename"]] = match.group(1)
+            except (OSError, ValueError, KeyError):
+                continue
+    return upload_files
+
+def get_upload(upload_id):
+    """Upload session by ID, recovered from its sidecar if the server restarted"""
+    if not re.fullmatch(r"[0-9a-f]{12}", upload_id or ""):
+        return None
+    with upload_sessions_lock:
+        session = upload_sessions.get(upload_id)
+        if session is None and os.path.exists(UploadSession.sidecar(upload_id)):
+            session = upload_sessions[upload_id] = UploadSession.recover(upload_id)
+        return session
+
+def finish_upload(session):
+    """Hash and retire a complete session, keeping only its final status"""
+    session.finish()
+    with upload_sessions_lock:
+        upload_sessions.pop(session.upload_id, None)
+        upload_index().pop(session.filename, None)
+        finished_uploads[session.upload_id] = session.to_dict()
+        while len(finished_uploads) > FINISHED_UPLOADS_KEPT:
+            finished_uploads.popitem(last=False)
+
+def expire_uploads():
+    """Delete uploads untouched for UPLOAD_EXPIRE_SECONDS, abandoned resumable ones with their sidecars
+
+    Inputs of queued or running jobs and sessions receiving data are kept.
+    """
+    cutoff = time.time() - UPLOAD_EXPIRE_SECONDS
+    busy = {os.path.basename(job.input_path) for job in get_job_manager().list() if job.state in ("queued", "running")}
+    with upload_sessions_lock:
+        busy |= {session.filename for session in upload_sessions.values() if session.receiving}
+    for name in os.listdir("uploads"):
+        if name.startswith(".") or name in busy:
+            continue
+        try:
+            if os.path.getmtime(f"uploads/{name}") < cutoff:
+                os.remove(f"uploads/{name}")
+        except OSError:
+            continue
+
+    # A session whose file is gone can never complete
+    for name in os.listdir("uploads"):
+        match = SIDECAR_NAME.fullmatch(name)
+        if match is None:
+            continue
+        try:
+            with open(f"uploads/{name}") as f:
+                filename = json.load(f)["filename"]
+            if os.path.exists(f"uploads/{filename}"):
+                continue
+            os.remove(f"uploads/{name}")
+        except (OSError, ValueError, KeyError):
+            continue
+        with upload_sessions_lock:
+            upload_sessions.pop(match.group(1), None)
+            upload_index().pop(filename, None)
+
+def receiving_upload(filename):
+    """Unfinished upload session writing uploads/filename, if any"""
+    with upload_sessions_lock:
+        upload_id = upload_index().get(filename)
+    session = get_upload(upload_id) if upload_id is not None else None
+    if session is not None and not session.complete:
+        return session
+    return None
+
+@app.post("/uploads")
+def create_upload(filename: str, size: int):
+    """Start a resumable upload of size bytes, sent with PUT /uploads/{upload_id}"""
+    if size <= 0:
+        return {"status": "error", "message": "size must be positive"}
+    if size > UPLOAD_MAX_BYTES:
+        return {"status": "error", "message": f"Upload exceeds {UPLOAD_MAX_BYTES >> 20} MB"}
+    expire_uploads()
+    if shutil.disk_usage("uploads").free < size:
+        return {"status": "error", "message": "Not enough disk space for the upload"}
+    session = UploadSession.create(filename, size)
+    with upload_sessions_lock:
+        upload_sessions[session.upload_id] = session
+        upload_index()[session.filename] = session.upload_id
+    return session.to_dict()
+
+@app.get("/uploads/{upload_id}")
+def get_upload_status(upload_id: str):
+    session = get_upload(upload_id)
+    if session is None:
+        with upload_sessions_lock:
+            if upload_id in finished_uploads:
+                return finished_uploads[upload_id]
+        return {"status": "error", "message": "Upload not found"}
+    return session.to_dict()
+
+@app.put("/uploads/{upload_id}")
+async def upload_chunk(upload_id: str, offset: int, request: Request):
+    """Append the request body at offset, streaming it to disk without buffering the file
+
+    The body is read on the event loop; recovery, writes and hashing run in
+    the threadpool a block at a time, so other requests never wait on disk.
+    """
+    session = await run_in_threadpool(get_upload, upload_id)
+    if session is None:
+        with upload_sessions_lock:
+            if upload_id in finished_uploads:
+                return {"status": "error", "message": "Upload is already complete", **finished_uploads[upload_id]}
+        return {"status": "error", "message": "Upload not found"}
+    if session.receiving:
+        return {"status": "error", "message": "Upload is already receiving data", "offset": session.offset}
+    if offset != session.offset:
+        return {"status": "error", "message": "Offset does not match the received data", "offset": session.offset}
+
+    session.receiving = True
     try:
-        input_path = f"uploads/{filename}"
-        output_path = "output/processed.mp4"
-        
-        if not os.path.exists(input_path):
-            return {"status": "error", "message": "Video file not found"}
-        
-        cap = cv2.VideoCapture(input_path)
-        if not cap.isOpened():
-            return {"status": "error", "message": "Cannot open video file"}
-            
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        
-        # Optimized processing settings
-        if width > 720:
-            width = 720
-            height = int(height * (720 / int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))))
-        fps = min(fps, 20)  # Increased FPS for better quality
-        
-        # Use best codec for quality
-        fourcc = cv2.VideoWriter_fourcc(*'H264')
-        out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
-        
-        if not out.isOpened():
-            fourcc = cv2.VideoWriter_fourcc(*'XVID')
-            out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
-            
-        if not out.isOpened():
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-            out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
-        
-        frame_count = 0
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-                
-            frame = cv2.resize(frame, (width, height))
-            processed_frame = detector.process_frame(frame)
-            out.write(processed_frame)
-            
-            frame_count += 1
-            if frame_count % 30 == 0:
-                print(f"Processed {frame_count} frames")
-        
-        cap.release()
-        out.release()
-        
-        file_size_mb = os.path.getsize(output_path) / (1024 * 1024)
-        
+        # Unbuffered, so readers following the upload see every byte counted in offset
+        f = await run_in_threadpool(open, session.path, "r+b", buffering=0)
+        pending = bytearray()
+        try:
+            await run_in_threadpool(f.seek, session.offset)
+            async for chunk in request.stream():
+                pending += chunk
+                if len(pending) >= UPLOAD_BLOCK:
+                    block, pending = bytes(pending), bytearray()
+                    await run_in_threadpool(session.append, f, block)
+                if session.offset + len(pending) >= session.size:
+                    break
+        finally:
+            # Bytes received before a dropped connection still count towards the offset
+            if pending:
+                await run_in_threadpool(session.append, f, bytes(pending))
+            f.close()
+    finally:
+        session.receiving = False
+    if session.complete and session.sha256 is None:
+        await run_in_threadpool(finish_upload, session)
+    return session.to_dict()
+
+def job_output_path(job_id, ext=".mp4"):
+    """Output path for a job, or None for a malformed job ID"""
+    if not re.fullmatch(r"[0-9a-f]{12}", job_id or ""):
+        return None
+    return f"output/{job_id}{ext}"
+
+def remove_job_outputs(job_id):
+    """Delete every file a job wrote under output/: video, telemetry, metrics, HLS and chunk directories"""
+    prefix = job_output_path(job_id, "")
+    if prefix is None:
+        return
+    for name in os.listdir("output"):
+        if name.startswith(job_id):
+            path = os.path.join("output", name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+# Column order of telemetry records, see AdvancedLaneDetector.telemetry_record
+TELEMETRY_FIELDS = ("frame", "left_a", "left_b", "left_c", "right_a", "right_b", "right_c",
+                    "offset_m", "curvature_m", "departure", "confidence")
+TELEMETRY_FORMATS = {
+    "jsonl": (".jsonl", "application/x-ndjson"),
+    "csv": (".csv", "text/csv"),
+    "npz": (".npz", "application/octet-stream"),
+}
+
+def telemetry_dict(record):
+    """Telemetry record as a JSON-safe dict"""
+    # JSON has no NaN, missing lanes become null
+    return {field: None if isinstance(v, float) and np.isnan(v) else v
+            for field, v in zip(TELEMETRY_FIELDS, record)}
+
+class TelemetryWriter:
+    """Streams per-frame lane records to JSONL or CSV, or collects them into columnar .npz"""
+
+    def __init__(self, path, fmt):
+        self.path = path
+        self.fmt = fmt
+        if fmt == "npz":
+            self.columns = [[] for _ in TELEMETRY_FIELDS]
+            return
+        self.file = open(path, "w", newline="")
+        if fmt == "csv":
+            self.csv = csv.writer(self.file)
+            self.csv.writerow(TELEMETRY_FIELDS)
+
+    def write(self, record):
+        if self.fmt == "npz":
+            for column, value in zip(self.columns, record):
+                column.append(value)
+        elif self.fmt == "csv":
+            self.csv.writerow(["" if isinstance(v, float) and np.isnan(v) else v for v in record])
+        else:
+            self.file.write(json.dumps(telemetry_dict(record)) + "\n")
+
+    def write_many(self, records):
+        for record in records:
+            self.write(record)
+
+    def close(self):
+        if self.fmt != "npz":
+            self.file.close()
+            return
+        dtypes = {"frame": np.int32, "departure": np.bool_, "offset_m": np.float32,
+                  "curvature_m": np.float32, "confidence": np.float32}
+        np.savez_compressed(self.path, **{
+            field: np.array(column, dtype=dtypes.get(field, np.float64))
+            for field, column in zip(TELEMETRY_FIELDS, self.columns)
+        })
+
+# Upper bounds in seconds of the stage timing histogram buckets, plus +Inf
+STAGE_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.015, 0.02, 0.03, 0.05, 0.075, 0.1, 0.25, 0.5, 1.0)
+
+class StageHistogram:
+    """Bucketed durations of one pipeline stage"""
+    __slots__ = ("counts", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(STAGE_BUCKETS) + 1)
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(STAGE_BUCKETS, seconds)] += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def quantile(self, q):
+        """q-quantile interpolated within its bucket, as Prometheus histogram_quantile does"""
+        rank, seen, lower = q * self.count, 0, 0.0
+        for bound, n in zip(STAGE_BUCKETS, self.counts):
+            if n and seen + n >= rank:
+                return min(lower + (bound - lower) * (rank - seen) / n, self.max)
+            seen += n
+            lower = bound
+        return self.max
+
+    def to_dict(self):
+        count = self.count
         return {
-            "status": "completed",
-            "file_size_mb": round(file_size_mb, 2)
+            "count": count,
+            "mean_ms": round(1000 * self.total / count, 3) if count else None,
+            "p50_ms": round(1000 * self.quantile(0.5), 3) if count else None,
+            "p95_ms": round(1000 * self.quantile(0.95), 3) if count else None,
+            "max_ms": round(1000 * self.max, 3),
+            "total_s": round(self.total, 3),
         }
-        
-    except Exception as e:
-        print(f"Error: {str(e)}")
-        return {"status": "error", "message": str(e)}
 
-@app.get("/download-video")
-def download_video():
-    return FileResponse("output/processed.mp4", media_type="video/mp4", filename="lanesight_processed_video.mp4")
+class PipelineProfiler:
+    """Stage timing histograms and lane counters of one job
 
-@app.get("/stream-video")
-def stream_video():
-    return FileResponse("output/processed.mp4", media_type="video/mp4")
+    Only jobs started with profiling get one: instrument() swaps timed
+    wrappers onto a detector instance, so unprofiled jobs run the plain
+    methods with no bookkeeping at all.
+    """
+    DETECTOR_STAGES = ("detect", "preprocess", "adaptive_roi", "find_lanes", "sliding_window",
+                       "search_around_fit", "ransac_polyfit", "average_fit",
+                       "calculate_curvature_and_offset", "draw_lane_with_dashes")
+
+    def __init__(self):
+        self.stages = {}
+        self.detected = 0
+        self.lane_lost = 0
+
+    def timed(self, stage, fn):
+        histogram = self.stages.setdefault(stage, StageHistogram())
+
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+
+    def instrument(self, detector):
+        for stage in self.DETECTOR_STAGES:
+            setattr(detector, stage, self.timed(stage, getattr(detector, stage)))
+        detect = detector.detect
+
+        def counted(frame):
+            result = detect(frame)
+            self.detected += 1
+            if result[0] is None or result[1] is None:
+                self.lane_lost += 1
+            return result
+        detector.detect = counted
+        return detector
+
+    def merge(self, other):
+        for stage, histogram in other.stages.items():
+            self.stages.setdefault(stage, StageHistogram()).merge(histogram)
+        self.detected += other.detected
+        self.lane_lost += other.lane_lost
+
+    def to_dict(self):
+        return {
+            "detected_frames": self.detected,
+            "lane_lost_frames": self.lane_lost,
+            "lane_lost_rate": round(self.lane_lost / self.detected, 4) if self.detected else None,
+            "stages": {stage: histogram.to_dict() for stage, histogram in self.stages.items()},
+        }
+
+# Detection thresholds (window margins, minimum pixel counts) are tuned for
+# frames around this width, so auto mode never detects on anything wider
+AUTO_WORK_WIDTH = 720
+
+def scaled_size(width, height, target_width):
+    """(width, height) scaled down to target_width, never up"""
+    if not target_width or target_width >= width:
+        return width, height
+    return int(target_width), max(int(height * target_width / width), 1)
+
+def output_geometry(cap, work_width=None, output_width=None):
+    """Detection size, output size and output FPS for a capture
+
+    Detection runs at work_width (AUTO_WORK_WIDTH when unset) while the
+    overlay is drawn at output_width, full source resolution when unset.
+    """
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+
+    output_size = scaled_size(width, height, output_width)
+    work_size = scaled_size(*output_size, work_width or AUTO_WORK_WIDTH)
+    return work_size, output_size, fps
+
+def open_video_writer(output_path, fps, size):
+    """Open a VideoWriter with the best codec available"""
+    # Use best codec for quality, falling back when it is not built in
+    for codec in ('H264', 'XVID', 'mp4v'):
+        out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*codec), fps, size)
+        if out.isOpened():
+            break
+    return out
+
+class FrameSkipper:
+    """Runs full detection on key frames only and predicts the fits in between
+
+    Every `every`-th frame is a key frame. With adaptive=True a frame is also
+    a key frame when the scene changes (mean thumbnail difference from the
+    last key frame above diff_threshold) or the lanes are predicted to have
+    drifted more than max_shift px at the bottom of the frame. In-between
+    frames extrapolate each lane's fit linearly from the last two key frames
+    and reuse the last offset, departure and curvature.
+    """
+
+    def __init__(self, detector, every=3, adaptive=False, diff_threshold=6.0, max_shift=5.0):
+        self.detector = detector
+        self.every = max(int(every), 1)
+        self.adaptive = adaptive
+        self.diff_threshold = diff_threshold
+        self.max_shift = max_shift
+        # (frame index, detection result) of the last two key frames
+        self.keys = deque(maxlen=2)
+        self.thumbnail = None
+        self.height = None
+        self.detected = 0
+
+    @staticmethod
+    def _thumbnail(frame):
+        # Every 16th pixel: far cheaper than an area resize and enough to see a cut
+        return frame[::16, ::16].astype(np.int16)
+
+    def _velocities(self):
+        """Per-frame change of each lane's coefficients between the last two key frames"""
+        if len(self.keys) < 2:
+            return None, None
+        (prev_index, prev), (last_index, last) = self.keys
+        return tuple(None if a is None or b is None else (b - a) / (last_index - prev_index)
+                     for a, b in zip(prev[:2], last[:2]))
+
+    def is_key(self, frame):
+        """Whether the next frame needs full detection"""
+        if not self.keys or any(fit is None for fit in self.keys[-1][1][:2]):
+            return True
+        gap = self.detector.frame_count + 1 - self.keys[-1][0]
+        if gap >= self.every:
+            return True
+        if not self.adaptive:
+            return False
+        if np.mean(np.abs(self._thumbnail(frame) - self.thumbnail)) > self.diff_threshold:
+            return True
+        y = self.height - 1
+        return any(v is not None and abs(v[0] * y * y + v[1] * y + v[2]) * gap > self.max_shift
+                   for v in self._velocities())
+
+    def observe(self, frame, result, height):
+        """Record a key frame's detection result, height being that of the detection frame"""
+        self.keys.append((self.detector.frame_count, result))
+        self.height = height
+        self.detected += 1
+        if self.adaptive:
+            self.thumbnail = self._thumbnail(frame)
+
+    def predict(self):
+        """Detection result for an in-between frame"""
+        self.detector.frame_count += 1
+        last_index, last = self.keys[-1]
+        gap = self.detector.frame_count - last_index
+        fits = [fit if fit is None or v is None else fit + v * gap
+                for fit, v in zip(last[:2], self._velocities())]
+        return (*fits, *last[2:])
+
+# Target length of HLS segments; boundaries fall on whole frames
+HLS_SEGMENT_SECONDS = 2.0
+SEGMENT_NAME = re.compile(r"seg_(\d{7})_(\d+)\.m4s")
+HLS_INIT_NAME = "init.mp4"
+
+def hls_segment_frames(fps):
+    """Frames per HLS segment at fps"""
+    return max(int(round(fps * HLS_SEGMENT_SECONDS)), 1)
+
+class SegmentWriter:
+    """VideoWriter stand-in that cuts the output into fragmented MP4 (fMP4) HLS segments
+
+    Segments start on multiples of segment_frames of the global frame index;
+    chunk workers get ranges aligned to them (see plan_chunks), so they cut
+    exactly the segments a sequential run would. Each segment is encoded to
+    a hidden MP4 and, once closed, repackaged as seg_<first frame>_<frames>.m4s
+    against the shared init.mp4 (see write_fragment), so readers only ever
+    see complete segments.
+    """
+
+    def __init__(self, directory, fps, size, first_frame=0, on_segment=None):
+        self.directory = directory
+        self.fps = fps
+        self.size = size
+        self.segment_frames = hls_segment_frames(fps)
+        self.index = first_frame
+        self.on_segment = on_segment
+        self.out = None
+
+    def write(self, frame):
+        if self.out is None or self.index % self.segment_frames == 0:
+            self._close()
+            self.start = self.index
+            self.partial = os.path.join(self.directory, f".seg_{self.start:07d}.mp4")
+            self.out = open_video_writer(self.partial, self.fps, self.size)
+        self.out.write(frame)
+        self.index += 1
+
+    def _close(self):
+        if self.out is None:
+            return
+        self.out.release()
+        self.out = None
+        write_fragment(self.partial, self.directory, f"seg_{self.start:07d}_{self.index - self.start}.m4s",
+                       self.start // self.segment_frames + 1, self.start)
+        os.remove(self.partial)
+        if self.on_segment is not None:
+            self.on_segment()
+
+    def release(self):
+        self._close()
+
+def write_playlist(directory, fps, ended=False):
+    """(Re)write index.m3u8 over the segments that play on without a gap from frame 0"""
+    segments = sorted((int(m.group(1)), int(m.group(2)), name) for name in os.listdir(directory)
+                      if (m := SEGMENT_NAME.fullmatch(name)))
+    entries, expected = [], 0
+    for start, frames, name in segments:
+        # A later chunk's segments wait until every earlier frame is published
+        if start != expected:
+            break
+        entries.append((frames / fps, name))
+        expected = start + frames
+
+    lines = ["#EXTM3U", "#EXT-X-VERSION:7",
+             f"#EXT-X-TARGETDURATION:{int(np.ceil(max((d for d, _ in entries), default=HLS_SEGMENT_SECONDS)))}",
+             "#EXT-X-PLAYLIST-TYPE:EVENT", "#EXT-X-MEDIA-SEQUENCE:0", "#EXT-X-INDEPENDENT-SEGMENTS",
+             f'#EXT-X-MAP:URI="{HLS_INIT_NAME}"']
+    for duration, name in entries:
+        lines += [f"#EXTINF:{duration:.3f},", name]
+    if ended:
+        lines.append("#EXT-X-ENDLIST")
+    playlist = os.path.join(directory, "index.m3u8")
+    with open(playlist + ".tmp", "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(playlist + ".tmp", playlist)
+    return playlist
+
+def frame_processor(detector, render=True, record=False, work_size=None, output_size=None, skipper=None):
+    """Per-frame work of a job: (rendered frame or None, telemetry record or None)
+
+    Detection runs on the frame downscaled to work_size and the fits are
+    scaled up to output_size (the frame's own size by default), so overlay
+    and telemetry are in output coordinates whatever resolution detected them.
+    With a FrameSkipper only its key frames run the detector.
+    """
+    def process(frame):
+        height, width = frame.shape[:2]
+        detect_size = work_size or (width, height)
+        target_size = output_size or (width, height)
+        if skipper is not None and not skipper.is_key(frame):
+            result = skipper.predict()
+        else:
+            result = detector.detect(frame if detect_size == (width, height)
+                                     else cv2.resize(frame, detect_size))
+            if skipper is not None:
+                skipper.observe(frame, result, detect_size[1])
+        if target_size != detect_size:
+            left_fit, right_fit, *rest = result
+            sx, sy = target_size[0] / detect_size[0], target_size[1] / detect_size[1]
+            result = (scale_fit(left_fit, sx, sy), scale_fit(right_fit, sx, sy), *rest)
+        telemetry = detector.telemetry_record(*result) if record else None
+        rendered = detector.draw_lane_with_dashes(frame, *result) if render else None
+        return rendered, telemetry
+    return process
+
+def job_detector(options):
+    """Fresh detector for a job's detection_profile/auto_profile options"""
+    return AdvancedLaneDetector(detection_profile=options.get("detection_profile", "accurate"),
+                                auto_profile=options.get("auto_profile", False))
+
+# Job options a chunk worker needs to build its detector and skipper
+DETECTOR_OPTIONS = ("detect_every", "adaptive_skip", "detection_profile", "auto_profile")
+
+def frame_skipper(detector, options):
+    """FrameSkipper for a job's detect_every/adaptive_skip options, or None to detect every frame"""
+    every = options.get("detect_every", 1)
+    if every <= 1:
+        return None
+    return FrameSkipper(detector, every, adaptive=options.get("adaptive_skip", False))
+
+def run_detection(job):
+    """Decode, detect and encode one uploaded video, reporting progress on the job
+
+    Returns the path of the job's main output: the rendered video, or the
+    telemetry file for analytics-only jobs.
+    """
+    input_path = job.input_path
+    render = job.options.get("mode", "render") == "render"
+    # output=hls writes playable segments and a playlist as frames are processed
+    segment_dir = job_output_path(job.job_id, "_hls") if render and job.options.get("output") == "hls" else None
+    telemetry_format = job.options.get("telemetry")
+    video_path = job_output_path(job.job_id) if render and segment_dir is None else None
+    telemetry_path = (job_output_path(job.job_id, TELEMETRY_FORMATS[telemetry_format][0])
+                      if telemetry_format else None)
+    os.makedirs(segment_dir or "output", exist_ok=True)
+
+    # An upload still being received is followed as it grows
+    upload = get_upload(job.options["upload_id"]) if job.options.get("upload_id") else None
+    if upload is not None and not upload.complete:
+        cap = GrowingCapture(upload, job.cancel_event)
+    else:
+        cap = cv2.VideoCapture(input_path)
+    if not cap.isOpened():
+        raise RuntimeError("Cannot open video file")
+
+    work_size, output_size, fps = output_geometry(cap, job.options.get("work_width"),
+                                                  job.options.get("output_width"))
+    # Without an overlay there is nothing to draw at full size, so frames are
+    # decoded straight to the detection size
+    frame_size = output_size if render else work_size
+    job.stats.update({"work_size": list(work_size), "output_size": list(output_size), "output_fps": fps})
+    job.frames_total = max(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), 0)
+
+    if job.options.get("workers", 1) > 1 and job.frames_total > 0:
+        cap.release()
+        if not run_detection_chunked(job, input_path, video_path, segment_dir, telemetry_path,
+                                     telemetry_format, work_size, frame_size, output_size, fps):
+            # Cancelled before anything was stitched or written
+            return None
+        if video_path and os.path.exists(video_path):
+            faststart(video_path)
+        if segment_dir is not None:
+            return write_playlist(segment_dir, fps, ended=not job.cancel_event.is_set())
+        return video_path or telemetry_path
+
+    # Fresh detector per job so smoothing history never leaks between videos
+    detector = job_detector(job.options)
+    if job.profiler is not None:
+        job.profiler.instrument(detector)
+    skipper = frame_skipper(detector, job.options)
+    # Analytics-only jobs skip drawing and encoding entirely
+    if segment_dir is not None:
+        write_playlist(segment_dir, fps)
+        out = SegmentWriter(segment_dir, fps, output_size, on_segment=lambda: write_playlist(segment_dir, fps))
+    else:
+        out = open_video_writer(video_path, fps, output_size) if render else None
+    writer = TelemetryWriter(telemetry_path, telemetry_format) if telemetry_format else None
+
+    def sink(item):
+        rendered, record = item
+        if out is not None:
+            out.write(rendered)
+        if writer is not None:
+            writer.write(record)
+        job.live.publish(rendered, record)
+
+    try:
+        process = frame_processor(detector, render, record=True, work_size=work_size, output_size=output_size,
+                                  skipper=skipper)
+        run_pipeline(cap, frame_size, job, process, sink)
+        job.stats["detected_frames"] = job.frames_done if skipper is None else skipper.detected
+        if detector.auto_profile:
+            job.stats.update(detection_profile=detector.detection_profile,
+                             profile_switches=detector.profile_switches)
+    finally:
+        cap.release()
+        if out is not None:
+            out.release()
+        if writer is not None:
+            writer.close()
+
+    if video_path:
+        faststart(video_path)
+    if segment_dir is not None:
+        return write_playlist(segment_dir, fps, ended=not job.cancel_event.is_set())
+    return video_path or telemetry_path
+
+class FramePool:
+    """Fixed set of preallocated frame buffers recycled between pipeline stages"""
+
+    def __init__(self, shape, count):
+        self.free = queue.Queue()
+        for _ in range(count):
+            self.free.put(np.empty(shape, dtype=np.uint8))
+
+    def acquire(self, stop):
+        while not stop.is_set():
+            try:
+                return self.free.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return None
+
+    def release(self, buffer):
+        self.free.put(buffer)
+
+def _queue_put(q, item, stop):
+    """Blocking put that gives up once the pipeline is stopped"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _queue_get(q, stop):
+    """Blocking get that returns None once the pipeline is stopped"""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return None
+
+def run_pipeline(cap, size, job, process, sink, depth=4):
+    """Overlap decode, process(frame) and sink(result) in separate threads joined by bounded queues"""
+    width, height = size
+    # Every buffer is either queued or held by exactly one stage, so a full
+    # pool means the encoder is behind and decoding waits for it
+    pool = FramePool((height, width, 3), 2 * depth + 3)
+    decoded = queue.Queue(maxsize=depth)
+    processed = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    errors = []
+    read = cap.read
+    if job.profiler is not None:
+        read = job.profiler.timed("decode", read)
+        process = job.profiler.timed("process", process)
+        sink = job.profiler.timed("sink", sink)
+
+    def decode():
+        raw = None
+        try:
+            while not job.cancel_event.is_set():
+                ret, raw = read(raw)
+                if not ret:
+                    break
+                buffer = pool.acquire(stop)
+                if buffer is None:
+                    return
+                if raw.shape[:2] == (height, width):
+                    buffer[...] = raw
+                else:
+                    cv2.resize(raw, size, dst=buffer)
+                if not _queue_put(decoded, buffer, stop):
+                    return
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            _queue_put(decoded, None, stop)
+
+    def detect():
+        try:
+            while True:
+                buffer = _queue_get(decoded, stop)
+                if buffer is None:
+                    break
+                # Drawing may happen in place, so the buffer stays checked out until encoded
+                result = process(buffer)
+                if not _queue_put(processed, (buffer, result), stop):
+                    return
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            _queue_put(processed, None, stop)
+
+    stages = [threading.Thread(target=decode, name="lanesight-decode", daemon=True),
+              threading.Thread(target=detect, name="lanesight-detect", daemon=True)]
+    for stage in stages:
+        stage.start()
+
+    # Encode on the calling thread
+    try:
+        while True:
+            item = _queue_get(processed, stop)
+            if item is None:
+                break
+            buffer, result = item
+            sink(result)
+            pool.release(buffer)
+            job.advance()
+    except Exception as e:
+        errors.append(e)
+    finally:
+        stop.set()
+        for stage in stages:
+            stage.join()
+
+    if errors:
+        raise errors[0]
+
+# Frames each chunk replays before its range so average_fit history converges
+CHUNK_WARMUP_FRAMES = 15
+# How often a chunk worker checks for cancellation and publishes its progress;
+# both are round trips to the Manager process, too slow to make every frame
+CHUNK_REPORT_SECONDS = 0.1
+MAX_CHUNK_PROCESSES = int(os.environ.get("LANESIGHT_CHUNK_PROCESSES", os.cpu_count() or 1))
+
+_process_pool = None
+_chunk_manager = None
+_process_pool_lock = threading.Lock()
+
+def get_process_pool():
+    """Shared process pool for chunked detection and the manager its jobs share state through"""
+    global _process_pool, _chunk_manager
+    with _process_pool_lock:
+        if _process_pool is None:
+            # Spawn rather than fork: the server process is multi-threaded
+            context = multiprocessing.get_context("spawn")
+            _process_pool = ProcessPoolExecutor(max_workers=MAX_CHUNK_PROCESSES, mp_context=context)
+            if _chunk_manager is None:
+                _chunk_manager = context.Manager()
+        return _process_pool, _chunk_manager
+
+def reset_process_pool(pool):
+    """Drop a pool a dead worker broke, so the next chunked job starts a fresh one"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is pool:
+            _process_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def plan_chunks(frame_total, chunks, align=1):
+    """Split [0, frame_total) into contiguous, near-equal frame ranges
+
+    Inner boundaries are rounded to multiples of align, such as the HLS
+    segment length, so no segment straddles two chunks.
+    """
+    chunks = max(1, min(chunks, frame_total))
+    bounds = np.linspace(0, frame_total, chunks + 1)
+    bounds[1:-1] = np.minimum(np.round(bounds[1:-1] / align) * align, frame_total)
+    bounds = bounds.astype(int)
+    return [(int(start), int(end)) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+def process_chunk(input_path, chunk_path, start, end, work_size, size, output_size, fps, record=False,
+                  detector_options=None, profile=False, segments=False, cancel=None, progress=None, slot=0,
+                  warmup=CHUNK_WARMUP_FRAMES):
+    """Detect lanes on frames [start, end) in a worker process
+
+    Decodes at size, detects at work_size and renders into chunk_path unless
+    it is None; with segments=True chunk_path is a directory of HLS segments.
+    Frames done so far are published in progress[slot], and the cancel event
+    checked, every CHUNK_REPORT_SECONDS and once more at the end; the chunk
+    stops early once the event is set. Returns (frames
+    done, telemetry records or None, frames that ran full detection,
+    PipelineProfiler or None).
+    """
+    first = max(start - warmup, 0)
+    cap = cv2.VideoCapture(input_path)
+    # OpenCV decodes forward from the preceding keyframe to land on the exact frame
+    cap.set(cv2.CAP_PROP_POS_FRAMES, first)
+
+    detector = job_detector(detector_options or {})
+    # Keep the departure-warning flash in phase with a sequential run
+    detector.frame_count = first
+    profiler = PipelineProfiler() if profile else None
+    skipper = frame_skipper(detector, detector_options or {})
+    if chunk_path is None:
+        out = None
+    elif segments:
+        out = SegmentWriter(chunk_path, fps, size, first_frame=start)
+    else:
+        out = open_video_writer(chunk_path, fps, size)
+    process = frame_processor(detector, render=out is not None, record=record, work_size=work_size,
+                              output_size=output_size, skipper=skipper)
+    records = [] if record else None
+
+    done = 0
+    next_report = time.monotonic()
+    try:
+        for index in range(first, end):
+            now = time.monotonic()
+            if now >= next_report:
+                next_report = now + CHUNK_REPORT_SECONDS
+                if cancel is not None and cancel.is_set():
+                    break
+                if progress is not None:
+                    progress[slot] = done
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if index < start:
+                # Warm-up frames only feed the smoothing history
+                detector.detect(cv2.resize(frame, work_size))
+                continue
+            if profiler is not None and index == start:
+                profiler.instrument(detector)
+            if frame.shape[1::-1] != size:
+                frame = cv2.resize(frame, size)
+            rendered, telemetry = process(frame)
+            if out is not None:
+                out.write(rendered)
+            if record:
+                records.append(telemetry)
+            done += 1
+        if progress is not None:
+            progress[slot] = done
+    finally:
+        cap.release()
+        if out is not None:
+            out.release()
+    return done, records, done if skipper is None else skipper.detected, profiler
+
+def stitch_chunks(chunk_paths, output_path, fps, size):
+    """Concatenate chunk videos in order into a single output file"""
+    if shutil.which("ffmpeg"):
+        list_path = output_path + ".txt"
+        with open(list_path, "w") as f:
+            for path in chunk_paths:
+                f.write(f"file '{os.path.abspath(path)}'\n")
+        try:
+            result = subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+                                     "-i", list_path, "-c", "copy", output_path], capture_output=True)
+            if result.returncode == 0:
+                return
+        finally:
+            os.remove(list_path)
+
+    # No ffmpeg (or concat failed): re-encode the chunks through OpenCV
+    out = open_video_writer(output_path, fps, size)
+    try:
+        for path in chunk_paths:
+            cap = cv2.VideoCapture(path)
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                out.write(frame)
+            cap.release()
+    finally:
+        out.release()
+
+# Boxes that only contain other boxes on the way down to the chunk offset tables
+MP4_CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+
+def _mp4_boxes(f, end):
+    """(type, offset, size) of the top-level boxes of an MP4 file"""
+    boxes, offset = [], 0
+    while offset + 8 <= end:
+        f.seek(offset)
+        size, kind = struct.unpack(">I4s", f.read(8))
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+        elif size == 0:
+            size = end - offset
+        if size < 8:
+            break
+        boxes.append((kind, offset, size))
+        offset += size
+    return boxes
+
+def _shift_chunk_offsets(moov, delta, start, end):
+    """Add delta to every stco/co64 entry within moov[start:end], False if a 32-bit offset overflows"""
+    offset = start
+    while offset + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", moov, offset)
+        header = 8
+        if size == 1:
+            size, header = struct.unpack_from(">Q", moov, offset + 8)[0], 16
+        if size < header:
+            return False
+        if kind in MP4_CONTAINERS:
+            if not _shift_chunk_offsets(moov, delta, offset + header, offset + size):
+                return False
+        elif kind in (b"stco", b"co64"):
+            dtype = ">u4" if kind == b"stco" else ">u8"
+            count = struct.unpack_from(">I", moov, offset + header + 4)[0]
+            first = offset + header + 8
+            entries = np.frombuffer(moov, dtype=dtype, count=count, offset=first).astype(np.uint64) + delta
+            if kind == b"stco" and entries.max(initial=0) > 0xFFFFFFFF:
+                return False
+            moov[first:first + count * np.dtype(dtype).itemsize] = entries.astype(dtype).tobytes()
+        offset += size
+    return True
+
+def faststart(path):
+    """Move the moov box ahead of mdat so players can start before the whole file arrives
+
+    OpenCV writes moov last. Returns False when the file is left as it was.
+    """
+    with open(path, "rb") as f:
+        boxes = _mp4_boxes(f, os.path.getsize(path))
+        kinds = [kind for kind, _, _ in boxes]
+        if b"moov" not in kinds or b"mdat" not in kinds:
+            return False
+        moov_index, mdat_index = kinds.index(b"moov"), kinds.index(b"mdat")
+        # Only the usual layout, with every mdat before moov, is rewritten
+        if moov_index < mdat_index or b"mdat" in kinds[moov_index:]:
+            return False
+        _, moov_offset, moov_size = boxes[moov_index]
+        f.seek(moov_offset)
+        moov = bytearray(f.read(moov_size))
+        if not _shift_chunk_offsets(moov, moov_size, 8, moov_size):
+            return False
+
+        rewritten = path + ".faststart"
+        with open(rewritten, "wb") as out:
+            for index, (kind, offset, size) in enumerate(boxes):
+                if index == mdat_index:
+                    out.write(moov)
+                if kind == b"moov":
+                    continue
+                f.seek(offset)
+                while size > 0:
+                    block = f.read(min(size, 1 << 20))
+                    if not block:
+                        break
+                    out.write(block)
+                    size -= len(block)
+    os.replace(rewritten, path)
+    return True
+
+# stsd header, sample entry header and the fixed fields of a visual sample entry
+STSD_VISUAL_ENTRY = 8 + 8 + 78
+
+def _box(kind, *payload):
+    """Serialise an MP4 box"""
+    body = b"".join(payload)
+    return struct.pack(">I4s", 8 + len(body), kind) + body
+
+def _full_box(kind, version, flags, *payload):
+    return _box(kind, struct.pack(">I", version << 24 | flags), *payload)
+
+def _parse_boxes(data):
+    """[(type, payload)] of the boxes laid end to end in data"""
+    boxes, offset = [], 0
+    while offset + 8 <= len(data):
+        size, kind = struct.unpack_from(">I4s", data, offset)
+        header = 8
+        if size == 1:
+            size, header = struct.unpack_from(">Q", data, offset + 8)[0], 16
+        elif size == 0:
+            size = len(data) - offset
+        if size < header:
+            break
+        boxes.append((kind, data[offset + header:offset + size]))
+        offset += size
+    return boxes
+
+def _find_box(data, *path):
+    """Payload of the first box along path, or None"""
+    for kind in path:
+        data = next((payload for k, payload in _parse_boxes(data) if k == kind), None)
+        if data is None:
+            return None
+    return data
+
+def _zero_duration(kind, payload):
+    """mvhd, tkhd or mdhd payload with its duration cleared, as fragments carry the timing"""
+    # Duration offset in the version 0 and version 1 layouts
+    offset = {b"mvhd": (16, 24), b"tkhd": (20, 28), b"mdhd": (16, 24)}[kind][payload[0] == 1]
+    width = 8 if payload[0] == 1 else 4
+    return payload[:offset] + bytes(width) + payload[offset + width:]
+
+def _init_boxes(boxes, track_id):
+    """moov children with the sample tables emptied and mvex added, for an fMP4 init segment"""
+    rebuilt = []
+    for kind, payload in boxes:
+        if kind in (b"mvhd", b"tkhd", b"mdhd"):
+            rebuilt.append(_box(kind, _zero_duration(kind, payload)))
+        elif kind in (b"trak", b"mdia", b"minf"):
+            rebuilt.append(_box(kind, *_init_boxes(_parse_boxes(payload), track_id)))
+        elif kind == b"stbl":
+            # Only the codec configuration stays; samples live in the fragments
+            rebuilt.append(_box(b"stbl", _box(b"stsd", _find_box(payload, b"stsd")),
+                                _full_box(b"stts", 0, 0, bytes(4)), _full_box(b"stsc", 0, 0, bytes(4)),
+                                _full_box(b"stsz", 0, 0, bytes(8)), _full_box(b"stco", 0, 0, bytes(4))))
+        elif kind != b"edts":
+            rebuilt.append(_box(kind, payload))
+    if any(kind == b"mvhd" for kind, _ in boxes):
+        rebuilt.append(_box(b"mvex", _full_box(b"trex", 0, 0, struct.pack(">5I", track_id, 1, 0, 0, 0))))
+    return rebuilt
+
+def _sample_table(stbl):
+    """(offset, size, duration, sync, composition offset) of every sample described by stbl"""
+    def table(kind, dtype, columns=1):
+        payload = _find_box(stbl, kind)
+        if payload is None:
+            return None
+        count = struct.unpack_from(">I", payload, 4)[0]
+        return np.frombuffer(payload, dtype=dtype, count=count * columns, offset=8).astype(np.int64).reshape(count, columns)
+
+    stsz = _find_box(stbl, b"stsz")
+    sample_size, count = struct.unpack_from(">II", stsz, 4)
+    sizes = (np.full(count, sample_size) if sample_size else
+             np.frombuffer(stsz, dtype=">u4", count=count, offset=12)).astype(np.int64)
+    stts = table(b"stts", ">u4", 2)
+    durations = np.repeat(stts[:, 1], stts[:, 0])
+    stss = table(b"stss", ">u4")
+    sync = np.ones(count, bool) if stss is None else np.isin(np.arange(1, count + 1), stss[:, 0])
+    ctts = table(b"ctts", ">i4", 2)
+    composition = None if ctts is None else np.repeat(ctts[:, 1], ctts[:, 0])
+
+    # Samples are stored in runs (chunks) at the stco/co64 offsets; stsc gives each run's length
+    chunk_offsets = table(b"stco", ">u4")
+    if chunk_offsets is None:
+        chunk_offsets = table(b"co64", ">u8")
+    stsc = table(b"stsc", ">u4", 3)
+    runs = np.diff(np.append(stsc[:, 0], len(chunk_offsets) + 1))
+    per_chunk = np.repeat(stsc[:, 1], runs)
+    chunk_of_sample = np.repeat(np.arange(len(per_chunk)), per_chunk)[:count]
+    starts = np.cumsum(sizes) - sizes
+    chunk_starts = (np.cumsum(per_chunk) - per_chunk)[chunk_of_sample]
+    offsets = chunk_offsets[chunk_of_sample, 0] + starts - starts[chunk_starts]
+    return offsets, sizes, durations, sync, composition
+
+def write_fragment(source, directory, name, sequence, first_frame):
+    """Repackage a single-track MP4 written by OpenCV as an fMP4 media segment of an HLS stream
+
+    The segment is one moof + mdat whose decode time starts first_frame
+    sample durations in, so segments written by different processes line
+    up. The first segment of a stream also writes the shared init.mp4;
+    later ones must use the same codec and frame size, since every segment
+    is decoded against it.
+    """
+    with open(source, "rb") as f:
+        data = f.read()
+    moov = _find_box(data, b"moov")
+    tkhd = _find_box(moov, b"trak", b"tkhd")
+    track_id = struct.unpack_from(">I", tkhd, 20 if tkhd[0] == 1 else 12)[0]
+    stbl = _find_box(moov, b"trak", b"mdia", b"minf", b"stbl")
+    offsets, sizes, durations, sync, composition = _sample_table(stbl)
+
+    init_path = os.path.join(directory, HLS_INIT_NAME)
+    if not os.path.exists(init_path):
+        # Chunk workers may race to write it; any of their versions will do
+        partial = os.path.join(directory, f".init_{os.getpid()}.mp4")
+        with open(partial, "wb") as f:
+            f.write(_box(b"ftyp", b"iso6", bytes(4), b"iso6mp41"))
+            f.write(_box(b"moov", *_init_boxes(_parse_boxes(moov), track_id)))
+        os.replace(partial, init_path)
+    else:
+        with open(init_path, "rb") as f:
+            stsd = _find_box(f.read(), b"moov", b"trak", b"mdia", b"minf", b"stbl", b"stsd")
+        # Encoders note each file's bitrate in its codec configuration, so only the
+        # sample entry up to the codec, frame size and depth has to match
+        if stsd[:STSD_VISUAL_ENTRY] != _find_box(stbl, b"stsd")[:STSD_VISUAL_ENTRY]:
+            raise RuntimeError("HLS segment codec configuration changed mid-stream")
+
+    # Keyframes depend on nothing; other samples depend on others and are not sync samples
+    flags = np.where(sync, 0x02000000, 0x01010000)
+    columns = [durations, sizes, flags] + ([] if composition is None else [composition])
+    samples = np.stack([np.asarray(c, np.int64) for c in columns], axis=1).astype(">u4").tobytes()
+    trun_flags = 0x001 | 0x100 | 0x200 | 0x400 | (0x800 if composition is not None else 0)
+
+    def moof(data_offset):
+        return _box(b"moof", _full_box(b"mfhd", 0, 0, struct.pack(">I", sequence)),
+                    _box(b"traf",
+                         # default-base-is-moof: data offsets count from the start of moof
+                         _full_box(b"tfhd", 0, 0x020000, struct.pack(">I", track_id)),
+                         _full_box(b"tfdt", 1, 0, struct.pack(">Q", first_frame * int(durations[0]))),
+                         _full_box(b"trun", 1, trun_flags, struct.pack(">Ii", len(sizes), data_offset), samples)))
+
+    header = moof(0)
+    partial = os.path.join(directory, "." + name)
+    with open(partial, "wb") as f:
+        f.write(moof(len(header) + 8))
+        f.write(struct.pack(">I4s", 8 + int(sizes.sum()), b"mdat"))
+        for offset, size in zip(offsets, sizes):
+            f.write(data[offset:offset + size])
+    os.replace(partial, os.path.join(directory, name))
+
+def run_detection_chunked(job, input_path, video_path, segment_dir, telemetry_path, telemetry_format,
+                          work_size, size, output_size, fps):
+    """Split a video into frame ranges, detect each in its own process and stitch the results
+
+    With a segment_dir every worker writes its own HLS segments there and
+    the playlist grows as they land, so nothing needs stitching. Returns
+    False when the job was cancelled, after its workers have stopped.
+    """
+    workers = min(job.options["workers"], MAX_CHUNK_PROCESSES)
+    chunk_dir = f"output/{job.job_id}_chunks"
+    os.makedirs(chunk_dir, exist_ok=True)
+
+    pool, manager = get_process_pool()
+    chunks = plan_chunks(job.frames_total, workers, align=hls_segment_frames(fps) if segment_dir else 1)
+    if segment_dir is not None:
+        chunk_paths = [segment_dir] * len(chunks)
+    else:
+        chunk_paths = [f"{chunk_dir}/{i:04d}.mp4" if video_path else None for i in range(len(chunks))]
+    detector_options = {key: job.options[key] for key in DETECTOR_OPTIONS if key in job.options}
+    # Workers report frames as they go and poll the cancel flag between frames
+    cancel = manager.Event()
+    progress = manager.list([0] * len(chunks))
+    futures = []
+    try:
+        futures = [pool.submit(process_chunk, input_path, path, start, end, work_size, size, output_size, fps,
+                               telemetry_path is not None, detector_options, job.profiler is not None,
+                               segment_dir is not None, cancel, progress, slot)
+                   for slot, (path, (start, end)) in enumerate(zip(chunk_paths, chunks))]
+
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=0.25, return_when=FIRST_COMPLETED)
+            for future in done:
+                future.result()
+            # One slice fetches every worker's count in a single round trip
+            job.advance(sum(progress[:]) - job.frames_done)
+            if job.cancel_event.is_set():
+                cancel.set()
+                return False
+            if segment_dir is not None:
+                write_playlist(segment_dir, fps)
+        job.advance(sum(future.result()[0] for future in futures) - job.frames_done)
+        job.stats["detected_frames"] = sum(future.result()[2] for future in futures)
+        if job.profiler is not None:
+            for future in futures:
+                job.profiler.merge(future.result()[3])
+        if video_path:
+            stitch_chunks(chunk_paths, video_path, fps, size)
+        if telemetry_path:
+            writer = TelemetryWriter(telemetry_path, telemetry_format)
+            try:
+                for future in futures:
+                    writer.write_many(future.result()[1])
+            finally:
+                writer.close()
+        return True
+    except BrokenProcessPool:
+        # A worker died (crash or OOM kill); later jobs get a fresh pool
+        reset_process_pool(pool)
+        raise RuntimeError("A detection worker process died")
+    finally:
+        cancel.set()
+        wait(futures)
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+
+
+# Bytes an unfinished upload must grow by before a stalled reader reopens it
+UPLOAD_REOPEN_BYTES = 4 << 20
+UPLOAD_STALL_SECONDS = 300
+
+def moov_after_mdat(path, end):
+    """Whether the first end bytes of an MP4 hold media data ahead of any moov box"""
+    with open(path, "rb") as f:
+        kinds = [kind for kind, _, _ in _mp4_boxes(f, end)]
+    return b"mdat" in kinds and b"moov" not in kinds[:kinds.index(b"mdat")]
+
+class GrowingCapture:
+    """VideoCapture over an upload still being received, so detection overlaps the upload
+
+    When decoding runs into the end of the received data it waits for more,
+    reopens the file and seeks back to the first frame not yet returned.
+    The frame just before the end is held back, since its bytes may have
+    been cut short, and decoded again after the reopen. An MP4 whose index
+    (moov) follows the media data cannot be decoded until it is complete,
+    so such an upload is simply waited for and read as a whole.
+    """
+
+    def __init__(self, session, cancel_event):
+        self.session = session
+        self.cancel_event = cancel_event
+        self.frames_read = 0
+        self.pending = None
+        self.cap = None
+        self.complete_at_open = False
+        self.moov_at_end = False
+        if not self._reopen():
+            raise RuntimeError("Cannot open video file")
+
+    def _reopen(self):
+        """Open the file as received so far at frames_read, waiting for more data as needed"""
+        waited = 0.0
+        while not self.cancel_event.is_set():
+            offset = self.session.offset
+            complete = self.session.complete
+            if complete or not self.moov_at_end:
+                cap = cv2.VideoCapture(self.session.path)
+                if cap.isOpened():
+                    if self.frames_read:
+                        cap.set(cv2.CAP_PROP_POS_FRAMES, self.frames_read)
+                    if self.cap is not None:
+                        self.cap.release()
+                    self.cap, self.complete_at_open = cap, complete
+                    return True
+                cap.release()
+                if complete:
+                    return False
+                self.moov_at_end = moov_after_mdat(self.session.path, offset)
+            if self.session.wait(offset + UPLOAD_REOPEN_BYTES, 1.0):
+                waited = 0.0
+            else:
+                waited += 1.0
+                if waited > UPLOAD_STALL_SECONDS:
+                    raise RuntimeError("Upload stalled")
+        return False
+
+    def _wait_for_more(self):
+        """Wait for the upload to grow, then reopen; False once there is nothing more to read"""
+        if self.complete_at_open:
+            return False
+        offset, waited = self.session.offset, 0.0
+        while not self.session.wait(offset + UPLOAD_REOPEN_BYTES, 1.0):
+            if self.cancel_event.is_set():
+                return False
+            waited += 1.0
+            if waited > UPLOAD_STALL_SECONDS:
+                raise RuntimeError("Upload stalled")
+        return self._reopen()
+
+    def read(self, image=None):
+        while True:
+            if self.pending is None:
+                ok, self.pending = self.cap.read()
+                if not ok:
+                    self.pending = None
+                    if not self._wait_for_more():
+                        return False, None
+                    continue
+            ok, following = self.cap.read()
+            if ok or self.complete_at_open:
+                frame, self.pending = self.pending, following if ok else None
+                self.frames_read += 1
+                return True, frame
+            # Data ran out right after the pending frame, which may be cut short
+            self.pending = None
+            if not self._wait_for_more():
+                return False, None
+
+    def get(self, prop):
+        # The frame count of a partial file is not known yet
+        if prop == cv2.CAP_PROP_FRAME_COUNT and not self.complete_at_open:
+            return 0
+        return self.cap.get(prop)
+
+    def isOpened(self):
+        return self.cap is not None and self.cap.isOpened()
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+
+
+class LiveSource:
+    """Newest-frame reader for a camera, network stream or a file replayed at wall-clock rate
+
+    A background thread keeps reading so that only the most recent frame is
+    ever handed out; frames the consumer was too slow for are dropped.
+    on_frame, when given, is called after every stored frame and at the end
+    of the stream, so a consumer of many sources need not poll them.
+    """
+
+    def __init__(self, source, replay=False, on_frame=None):
+        self.cap = cv2.VideoCapture(int(source) if str(source).isdigit() else source)
+        if not self.cap.isOpened():
+            raise RuntimeError(f"Cannot open live source {source}")
+        # Don't let the driver queue frames up behind our back
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.replay = replay
+        self.on_frame = on_frame
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 25.0
+        self.cond = threading.Condition()
+        self.frame = None
+        self.captured_at = None
+        self.frames_read = 0
+        self.dropped = 0
+        self.ended = False
+        self.stopped = False
+        self.thread = threading.Thread(target=self._grab, name="lanesight-ingest", daemon=True)
+        self.thread.start()
+
+    def _grab(self):
+        start = time.monotonic()
+        while not self.stopped:
+            ret, frame = self.cap.read()
+            if not ret:
+                break
+            if self.replay:
+                # Pace the file like a camera: frame i arrives at start + i / fps
+                delay = start + self.frames_read / self.fps - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            with self.cond:
+                if self.frame is not None:
+                    self.dropped += 1
+                self.frame = frame
+                self.captured_at = time.monotonic()
+                self.frames_read += 1
+                self.cond.notify()
+            if self.on_frame is not None:
+                self.on_frame()
+        with self.cond:
+            self.ended = True
+            self.cond.notify()
+        if self.on_frame is not None:
+            self.on_frame()
+
+    def read(self, timeout=1.0):
+        """Newest unread frame and its capture time, or (None, None) on timeout or end of stream"""
+        with self.cond:
+            if self.frame is None and not self.ended:
+                self.cond.wait(timeout)
+            frame, captured_at = self.frame, self.captured_at
+            self.frame = None
+            return frame, captured_at
+
+    def release(self):
+        self.stopped = True
+        self.thread.join(timeout=2.0)
+        self.cap.release()
+
+
+class LatencyGovernor:
+    """Steps processing quality down when latency exceeds the budget and back up when it recovers
+
+    Level 0 is full processing, level 1 skips RANSAC, level 2 also halves the
+    working resolution.
+    """
+
+    MAX_LEVEL = 2
+
+    def __init__(self, budget, hold_frames=15, recover_ratio=0.6):
+        self.budget = budget
+        self.hold_frames = hold_frames
+        self.recover_ratio = recover_ratio
+        self.level = 0
+        self.smoothed = None
+        self.frames_at_level = 0
+
+    def update(self, latency):
+        self.smoothed = latency if self.smoothed is None else 0.8 * self.smoothed + 0.2 * latency
+        self.frames_at_level += 1
+        # Hold each level for a while so quality does not flap frame to frame
+        if self.frames_at_level < self.hold_frames:
+            return self.level
+        if self.smoothed > self.budget and self.level < self.MAX_LEVEL:
+            self.level += 1
+            self.frames_at_level = 0
+        elif self.smoothed < self.recover_ratio * self.budget and self.level > 0:
+            self.level -= 1
+            self.frames_at_level = 0
+        return self.level
+
+
+def latency_percentiles(latencies):
+    """p50/p90/p99 of latencies in seconds, reported in milliseconds"""
+    if not latencies:
+        return None
+    p50, p90, p99 = np.percentile(np.array(latencies) * 1000, [50, 90, 99])
+    return {"p50": round(float(p50), 1), "p90": round(float(p90), 1), "p99": round(float(p99), 1)}
+
+
+def run_live(job):
+    """Detect lanes on a live source within a per-frame latency budget until it ends or is cancelled"""
+    source = LiveSource(job.input_path, replay=job.options.get("replay", False))
+    governor = LatencyGovernor(job.options.get("budget_ms", 100) / 1000)
+    duration = job.options.get("duration")
+    render = job.options.get("mode", "render") == "render"
+    telemetry_format = job.options.get("telemetry")
+    telemetry_path = (job_output_path(job.job_id, TELEMETRY_FORMATS[telemetry_format][0])
+                      if telemetry_format else None)
+    writer = TelemetryWriter(telemetry_path, telemetry_format) if telemetry_format else None
+
+    detector = job_detector(job.options)
+    if job.profiler is not None:
+        job.profiler.instrument(detector)
+    process = frame_processor(detector, render, record=True)
+    latencies = deque(maxlen=2000)
+    size = None
+    started = time.monotonic()
+
+    try:
+        while not job.cancel_event.is_set():
+            if duration is not None and time.monotonic() - started > duration:
+                break
+            frame, captured_at = source.read()
+            if frame is None:
+                if source.ended:
+                    break
+                continue
+
+            # Working size for the current quality level
+            height, width = frame.shape[:2]
+            scale = min(1.0, AUTO_WORK_WIDTH / width) * (0.5 if governor.level >= 2 else 1.0)
+            new_size = (int(width * scale), int(height * scale))
+            if size is not None and new_size != size:
+                # Pixel fits follow the new size; the metric histories are size independent
+                detector.rescale_history(new_size[0] / size[0], new_size[1] / size[1])
+            size = new_size
+            detector.use_ransac = governor.level < 1
+
+            rendered, record = process(cv2.resize(frame, size))
+            if writer is not None:
+                writer.write(record)
+            job.live.publish(rendered, record)
+
+            # Glass-to-result: from the frame leaving the source to its result being published
+            latency = time.monotonic() - captured_at
+            latencies.append(latency)
+            governor.update(latency)
+            job.advance()
+            job.stats.update({
+                "latency_ms": latency_percentiles(latencies),
+                "dropped_frames": source.dropped,
+                "degrade_level": governor.level,
+                "detection_profile": detector.detection_profile,
+            })
+    finally:
+        source.release()
+        if writer is not None:
+            writer.close()
+
+    return telemetry_path
+
+
+class LiveFeed:
+    """Latest annotated frame and telemetry of a running job, for live viewers
+
+    Only the newest frame is kept: a viewer that falls behind skips straight
+    to it, and publishing never waits on any viewer.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.encode_lock = threading.Lock()
+        self.seq = 0
+        self.frame = None
+        self.record = None
+        self.closed = False
+        self.waiters = set()
+        self.jpeg_seq = -1
+        self.jpeg_bytes = None
+
+    def publish(self, frame, record):
+        # Frames are only copied out of the pipeline while someone is watching
+        frame = frame.copy() if frame is not None and self.waiters else None
+        with self.lock:
+            self.seq += 1
+            self.frame = frame
+            self.record = record
+            waiters = list(self.waiters)
+        self._wake(waiters)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            waiters = list(self.waiters)
+        self._wake(waiters)
+
+    def _wake(self, waiters):
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def latest(self):
+        with self.lock:
+            return self.seq, self.record
+
+    def jpeg(self):
+        """JPEG of the newest frame, encoded at most once however many viewers ask"""
+        with self.encode_lock:
+            with self.lock:
+                seq, frame = self.seq, self.frame
+            if seq != self.jpeg_seq:
+                ok, data = (cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
+                            if frame is not None else (False, None))
+                self.jpeg_seq = seq
+                self.jpeg_bytes = data.tobytes() if ok else None
+            return self.jpeg_bytes
+
+    async def updates(self):
+        """Yield the newest sequence number each time something new is published"""
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        with self.lock:
+            self.waiters.add(waiter)
+        last = 0
+        try:
+            while True:
+                with self.lock:
+                    seq, closed = self.seq, self.closed
+                if seq > last:
+                    last = seq
+                    yield seq
+                elif closed:
+                    return
+                else:
+                    await event.wait()
+                    event.clear()
+        finally:
+            with self.lock:
+                self.waiters.discard(waiter)
+
+
+STREAM_ID = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+class DetectorStream:
+    """One feed of the stream server: its source, detector state and live feed"""
+
+    def __init__(self, stream_id, name, source, render=True, options=None):
+        self.stream_id = stream_id
+        self.name = name
+        self.source = source
+        self.render = render
+        self.detector = job_detector(options or {})
+        self.live = LiveFeed()
+        # At most one frame of a stream is in flight, which keeps its state sequential
+        self.busy = False
+        self.frames_done = 0
+        self.latencies = deque(maxlen=500)
+        self.created_at = time.time()
+        self.last_frame_at = time.monotonic()
+
+    def to_dict(self):
+        return {
+            "stream_id": self.stream_id,
+            "source": self.name,
+            "mode": "render" if self.render else "analytics",
+            "detection_profile": self.detector.detection_profile,
+            "frames_done": self.frames_done,
+            "dropped_frames": self.source.dropped,
+            "latency_ms": latency_percentiles(self.latencies),
+            "created_at": self.created_at,
+        }
+
+
+class StreamServer:
+    """Detects lanes on many live streams at once over one shared worker pool
+
+    Each stream keeps its own AdvancedLaneDetector temporal state, keyed by
+    stream ID. A scheduler thread takes the newest frame of every idle
+    stream in turn, so no feed can starve another, and hands frames of equal
+    size to a worker in batches of up to batch_size. Workers run the
+    stateless preprocess and adaptive_roi stages on a detector of their own,
+    whose scratch buffers are reused for every frame of that size, and only
+    the stateful track step on the stream's detector. Streams whose source
+    ended or sent nothing for idle_seconds are evicted.
+    """
+
+    def __init__(self, max_workers=1, max_streams=64, idle_seconds=30.0, batch_size=4, fps_window=5.0):
+        self.max_workers = max_workers
+        self.max_streams = max_streams
+        self.idle_seconds = idle_seconds
+        self.batch_size = batch_size
+        self.fps_window = fps_window
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="lanesight-stream")
+        self.cond = threading.Condition()
+        self.streams = OrderedDict()
+        self.local = threading.local()
+        self.frames_done = 0
+        self.evicted = 0
+        self.completed = deque(maxlen=100000)
+        # Set when a source stored a frame or a worker freed a stream, see _wake
+        self.ready = False
+        self.thread = None
+
+    def add(self, name, input_path, replay=False, render=True, stream_id=None, options=None):
+        """Open a source and start detecting on it; None when the server is full or the ID is taken
+
+        options holds the stream's detection_profile/auto_profile settings.
+        """
+        stream_id = stream_id or uuid.uuid4().hex[:12]
+        with self.cond:
+            if len(self.streams) >= self.max_streams or stream_id in self.streams:
+                return None
+        stream = DetectorStream(stream_id, name, LiveSource(input_path, replay=replay, on_frame=self._wake),
+                                render, options)
+        with self.cond:
+            if len(self.streams) >= self.max_streams or stream_id in self.streams:
+                stream.source.release()
+                return None
+            self.streams[stream_id] = stream
+            self.ready = True
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._schedule, name="lanesight-streams", daemon=True)
+                self.thread.start()
+            self.cond.notify_all()
+        return stream
+
+    def get(self, stream_id):
+        with self.cond:
+            return self.streams.get(stream_id)
+
+    def list(self):
+        with self.cond:
+            return list(self.streams.values())
+
+    def remove(self, stream_id, wait=True):
+        """Stop a stream; with wait=False its source is released on a thread of its own
+
+        Releasing joins the source's reader thread, which a stuck camera or
+        network stream can hold for seconds.
+        """
+        with self.cond:
+            stream = self.streams.pop(stream_id, None)
+        if stream is not None:
+            stream.live.close()
+            if wait:
+                stream.source.release()
+            else:
+                threading.Thread(target=stream.source.release, name="lanesight-release", daemon=True).start()
+        return stream
+
+    def stats(self):
+        """Aggregate throughput; fps_per_core is the headline figure for sizing a host"""
+        now = time.monotonic()
+        with self.cond:
+            recent = len(self.completed) - bisect.bisect_left(self.completed, now - self.fps_window)
+            streams, frames_done, evicted = len(self.streams), self.frames_done, self.evicted
+        fps = recent / self.fps_window
+        cores = min(self.max_workers, os.cpu_count() or 1)
+        return {
+            "streams": streams,
+            "workers": self.max_workers,
+            "frames_done": frames_done,
+            "evicted_streams": evicted,
+            "aggregate_fps": round(fps, 2),
+            "fps_per_core": round(fps / cores, 2),
+        }
+
+    def _preprocessor(self):
+        # Each worker thread owns one detector for the stateless stages
+        detector = getattr(self.local, "detector", None)
+        if detector is None:
+            detector = self.local.detector = AdvancedLaneDetector()
+        return detector
+
+    def _wake(self):
+        with self.cond:
+            self.ready = True
+            self.cond.notify_all()
+
+    def _schedule(self):
+        turn = 0
+        while True:
+            with self.cond:
+                while not self.streams:
+                    self.cond.wait()
+                # Cleared before the sources are read, so a frame stored meanwhile wakes the next wait
+                self.ready = False
+                streams = list(self.streams.values())
+                in_flight = sum(stream.busy for stream in streams)
+            self._evict(streams)
+
+            # Round robin from a rotating start so a capped round favours nobody
+            turn = (turn + 1) % len(streams)
+            capacity = self.max_workers * self.batch_size - in_flight
+            groups = {}
+            for stream in streams[turn:] + streams[:turn]:
+                if capacity <= 0:
+                    break
+                if stream.busy:
+                    continue
+                frame, captured_at = stream.source.read(timeout=0)
+                if frame is None:
+                    continue
+                stream.busy = True
+                stream.last_frame_at = time.monotonic()
+                groups.setdefault(frame.shape, []).append((stream, frame, captured_at))
+                capacity -= 1
+
+            if not groups:
+                # Sleep until a source stores a frame or a worker frees a stream; the
+                # timeout only bounds how late idle streams are evicted
+                with self.cond:
+                    if not self.ready:
+                        self.cond.wait(1.0)
+                continue
+            try:
+                for batch in groups.values():
+                    for i in range(0, len(batch), self.batch_size):
+                        self.pool.submit(self._run_batch, batch[i:i + self.batch_size])
+            except RuntimeError:
+                # The pool shuts down with the interpreter
+                return
+
+    def _evict(self, streams):
+        now = time.monotonic()
+        for stream in streams:
+            if not stream.busy and (stream.source.ended or now - stream.last_frame_at > self.idle_seconds):
+                # Never wait on a source here, the scheduler serves every other stream
+                if self.remove(stream.stream_id, wait=False) is not None:
+                    with self.cond:
+                        self.evicted += 1
+
+    def _run_batch(self, batch):
+        preprocessor = self._preprocessor()
+        for stream, frame, captured_at in batch:
+            try:
+                height, width = frame.shape[:2]
+                if width > AUTO_WORK_WIDTH:
+                    width, height = scaled_size(width, height, AUTO_WORK_WIDTH)
+                    frame = cv2.resize(frame, (width, height))
+                detector = stream.detector
+                # The shared preprocessor runs whatever profile the stream is on
+                preprocessor.set_detection_profile(detector.detection_profile)
+                roi_binary = preprocessor.adaptive_roi(preprocessor.preprocess(frame))
+                detector.brightness = preprocessor.brightness
+                result = detector.track(roi_binary, width, height)
+                rendered = detector.draw_lane_with_dashes(frame, *result) if stream.render else None
+                stream.live.publish(rendered, detector.telemetry_record(*result))
+                stream.latencies.append(time.monotonic() - captured_at)
+                stream.frames_done += 1
+                with self.cond:
+                    self.frames_done += 1
+                    self.completed.append(time.monotonic())
+            except Exception as e:
+                print(f"Stream {stream.stream_id} error: {str(e)}")
+            finally:
+                stream.busy = False
+        self._wake()
+
+
+# Bump whenever detection or rendering changes what a job outputs, so cached results go stale
+DETECTOR_VERSION = 3
+# Job options that change a job's outputs and therefore key the result cache
+CACHE_KEY_OPTIONS = ("mode", "telemetry", "work_width", "output_width", "detect_every", "adaptive_skip", "workers",
+                     "detection_profile", "auto_profile")
+# Digests by (path, size, mtime), least recently used first; old entries only cost a rehash
+_digests = OrderedDict()
+_digests_lock = threading.Lock()
+DIGESTS_KEPT = 1024
+
+def _remember(memo, digest):
+    with _digests_lock:
+        _digests[memo] = digest
+        _digests.move_to_end(memo)
+        while len(_digests) > DIGESTS_KEPT:
+            _digests.popitem(last=False)
+
+def remember_digest(path, digest):
+    """Record a digest computed while the file was written, so file_digest need not reread it"""
+    stat = os.stat(path)
+    _remember((os.path.abspath(path), stat.st_size, stat.st_mtime_ns), digest)
+
+def file_digest(path):
+    """SHA-256 of a file's contents, remembered while its size and mtime stay the same"""
+    stat = os.stat(path)
+    memo = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _digests_lock:
+        if memo in _digests:
+            _digests.move_to_end(memo)
+            return _digests[memo]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    _remember(memo, digest.hexdigest())
+    return digest.hexdigest()
+
+class ResultCache:
+    """Finished job outputs keyed by input content and detector configuration
+
+    Each entry is a directory of result files plus meta.json, whose mtime
+    marks the last use. Once the entries exceed max_bytes the least recently
+    used are evicted.
+    """
+
+    # Every file a job can output, by extension
+    EXTENSIONS = (".mp4", ".jsonl", ".csv", ".npz")
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def key(self, digest, options):
+        config = {name: options.get(name) for name in CACHE_KEY_OPTIONS}
+        blob = json.dumps({"input": digest, "config": config, "version": DETECTOR_VERSION}, sort_keys=True)
+        return hashlib.sha256(blob.encode()).hexdigest()[:32]
+
+    def restore(self, key, job):
+        """Fill a job from the entry for key, returning False on a miss"""
+        entry = os.path.join(self.root, key)
+        with self.lock:
+            try:
+                with open(os.path.join(entry, "meta.json")) as f:
+                    meta = json.load(f)
+                for ext in self.EXTENSIONS:
+                    cached = os.path.join(entry, "result" + ext)
+                    if os.path.exists(cached):
+                        _link_or_copy(cached, job_output_path(job.job_id, ext))
+                # Touching meta.json makes this the most recently used entry
+                os.utime(os.path.join(entry, "meta.json"))
+            except OSError:
+                return False
+        job.frames_done = job.frames_total = meta["frames"]
+        job.file_size_mb = meta["file_size_mb"]
+        job.stats.update(meta["stats"], cache="hit")
+        return True
+
+    def store(self, key, job):
+        """Copy a finished job's outputs in as the entry for key"""
+        staging = os.path.join(self.root, f".{key}.{job.job_id}")
+        os.makedirs(staging)
+        size = 0
+        for ext in self.EXTENSIONS:
+            output = job_output_path(job.job_id, ext)
+            if os.path.exists(output):
+                _link_or_copy(output, os.path.join(staging, "result" + ext))
+                size += os.path.getsize(output)
+        with open(os.path.join(staging, "meta.json"), "w") as f:
+            json.dump({"frames": job.frames_done, "file_size_mb": job.file_size_mb, "size": size,
+                       "stats": {k: v for k, v in job.stats.items() if k != "cache"}}, f)
+
+        with self.lock:
+            entry = os.path.join(self.root, key)
+            if os.path.exists(entry) or size > self.max_bytes:
+                shutil.rmtree(staging, ignore_errors=True)
+                return
+            os.rename(staging, entry)
+            self._evict()
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.root):
+            meta_path = os.path.join(self.root, name, "meta.json")
+            if name.startswith(".") or not os.path.exists(meta_path):
+                continue
+            with open(meta_path) as f:
+                entries.append((os.path.getmtime(meta_path), json.load(f)["size"], name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+            total -= size
+
+def _link_or_copy(src, dst):
+    """Hard-link src to dst, copying when the filesystem cannot link"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+# Disk budget of the result cache in MB, 0 disables caching
+CACHE_BUDGET_MB = float(os.environ.get("LANESIGHT_CACHE_MB", 2048))
+_result_cache = None
+_job_manager = None
+_stream_server = None
+# Guards the three services above, each built on first use so importing this module starts nothing
+_services_lock = threading.Lock()
+
+def get_result_cache():
+    """Shared result cache, or None when LANESIGHT_CACHE_MB is 0"""
+    global _result_cache
+    if CACHE_BUDGET_MB <= 0:
+        return None
+    with _services_lock:
+        if _result_cache is None:
+            _result_cache = ResultCache("cache", int(CACHE_BUDGET_MB * 1024 * 1024))
+        return _result_cache
+
+
+class DetectionJob:
+    """State and progress of one queued detection run"""
+
+    def __init__(self, filename, options=None, input_path=None):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.filename = filename
+        self.input_path = input_path or f"uploads/{filename}"
+        self.options = options or {}
+        self.state = "queued"
+        self.message = None
+        self.frames_done = 0
+        self.frames_total = 0
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.file_size_mb = None
+        self.cancel_event = threading.Event()
+        self.future = None
+        self.live = LiveFeed()
+        self.stats = {}
+        # Stage timings are only collected for jobs started with profiling on
+        self.profiler = PipelineProfiler() if self.options.get("profile") else None
+        # Result cache entry this job's outputs are stored under, see ResultCache
+        self.cache_key = None
+
+    def advance(self, frames=1):
+        """Record processed frames"""
+        previous = self.frames_done
+        self.frames_done += frames
+        if self.frames_done // 30 > previous // 30:
+            print(f"[{self.job_id}] Processed {self.frames_done} frames")
+
+    def fps(self):
+        if self.started_at is None or self.frames_done == 0:
+            return 0.0
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return self.frames_done / elapsed if elapsed > 0 else 0.0
+
+    def eta_seconds(self):
+        fps = self.fps()
+        if self.state != "running" or fps == 0 or self.frames_total == 0:
+            return None
+        return max(self.frames_total - self.frames_done, 0) / fps
+
+    def to_dict(self):
+        eta = self.eta_seconds()
+        progress = (self.frames_done / self.frames_total) if self.frames_total else 0.0
+        return {
+            "job_id": self.job_id,
+            "filename": self.filename,
+            "mode": self.options.get("mode", "render"),
+            "telemetry": self.options.get("telemetry"),
+            "status": self.state,
+            "message": self.message,
+            "frames_done": self.frames_done,
+            "frames_total": self.frames_total,
+            "progress": round(min(progress, 1.0), 4),
+            "fps": round(self.fps(), 2),
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            "file_size_mb": self.file_size_mb,
+            **self.stats,
+        }
+
+    def metrics(self):
+        """Per-job performance report: throughput, drops, lane losses and stage timings"""
+        report = {
+            "job_id": self.job_id,
+            "status": self.state,
+            "frames_done": self.frames_done,
+            "fps": round(self.fps(), 2),
+            "dropped_frames": self.stats.get("dropped_frames", 0),
+            "profiled": self.profiler is not None,
+        }
+        if self.profiler is not None:
+            report.update(self.profiler.to_dict())
+        return report
+
+
+class JobManager:
+    """Bounded worker pool running detection jobs in the background"""
+
+    def __init__(self, max_workers=1, max_pending=16, max_history=100):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="lanesight-job")
+        self.max_pending = max_pending
+        self.max_history = max_history
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def pending_count(self):
+        return sum(1 for job in self.jobs.values() if job.state in ("queued", "running"))
+
+    def submit(self, filename, input_path=None, cache_key=None, **options):
+        job = DetectionJob(filename, options, input_path)
+        job.cache_key = cache_key
+        # A cached result finishes the job on arrival, without taking a worker
+        if cache_key is not None and get_result_cache().restore(cache_key, job):
+            job.state = "completed"
+            job.started_at = job.finished_at = time.time()
+            job.live.close()
+            with self.lock:
+                self.jobs[job.job_id] = job
+                trimmed = self._trim_history()
+            self._remove_outputs(trimmed)
+            return job
+
+        with self.lock:
+            if self.pending_count() >= self.max_pending:
+                return None
+            self.jobs[job.job_id] = job
+            trimmed = self._trim_history()
+        self._remove_outputs(trimmed)
+        job.future = self.executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            return list(self.jobs.values())
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            job.state = "cancelled"
+            job.finished_at = time.time()
+            job.live.close()
+        return job
+
+    def _trim_history(self):
+        """Forget the oldest finished jobs so the registry stays bounded; returns their IDs"""
+        # finished_at is set once a job has written its last file
+        finished = [jid for jid, job in self.jobs.items()
+                    if job.state in ("completed", "cancelled", "error") and job.finished_at is not None]
+        trimmed = finished[:max(len(self.jobs) - self.max_history, 0)]
+        for jid in trimmed:
+            del self.jobs[jid]
+        return trimmed
+
+    @staticmethod
+    def _remove_outputs(job_ids):
+        # Outside the lock: deleting a large HLS directory must not block other requests
+        for job_id in job_ids:
+            remove_job_outputs(job_id)
+
+    def _run(self, job):
+        if job.cancel_event.is_set():
+            job.state = "cancelled"
+            job.finished_at = time.time()
+            job.live.close()
+            return
+        job.state = "running"
+        job.started_at = time.time()
+        try:
+            output_path = run_live(job) if job.options.get("live") else run_detection(job)
+            if output_path is not None:
+                job.file_size_mb = round(os.path.getsize(output_path) / (1024 * 1024), 2)
+            job.state = "cancelled" if job.cancel_event.is_set() else "completed"
+            if job.state == "completed":
+                # Followed uploads and live sources start without a known frame count
+                job.frames_total = job.frames_done
+            if job.state == "completed" and job.cache_key is not None:
+                try:
+                    get_result_cache().store(job.cache_key, job)
+                except OSError as e:
+                    print(f"Result cache store failed: {str(e)}")
+        except Exception as e:
+            print(f"Error: {str(e)}")
+            job.state = "error"
+            job.message = str(e)
+        finally:
+            job.live.close()
+            if job.profiler is not None:
+                with open(job_output_path(job.job_id, "_metrics.json"), "w") as f:
+                    json.dump(job.metrics(), f, indent=2)
+            job.finished_at = time.time()
+
+
+def get_job_manager():
+    """Shared job manager of the server"""
+    global _job_manager
+    with _services_lock:
+        if _job_manager is None:
+            _job_manager = JobManager(
+                max_workers=int(os.environ.get("LANESIGHT_WORKERS", os.cpu_count() or 1)),
+                max_pending=int(os.environ.get("LANESIGHT_MAX_PENDING", 16)),
+                max_history=int(os.environ.get("LANESIGHT_JOB_HISTORY", 100)),
+            )
+        return _job_manager
+
+# Default for the profile option of new jobs
+PROFILE_JOBS = os.environ.get("LANESIGHT_PROFILE", "0") == "1"
+
+@app.get("/start-detection")
+def start_detection(filename: str, workers: int = 1, mode: str = "render", telemetry: str = None,
+                    work_width: int = None, output_width: int = None, detect_every: int = 1,
+                    adaptive_skip: bool = False, profile: bool = None, cache: bool = True,
+                    output: str = "file", detection_profile: str = "accurate", auto_profile: bool = False):
+    input_path = f"uploads/{filename}"
+    if os.path.basename(filename) != filename or not os.path.exists(input_path):
+        return {"status": "error", "message": "Video file not found"}
+
+    # mode=analytics skips drawing and encoding and only writes telemetry
+    if mode not in ("render", "analytics"):
+        return {"status": "error", "message": "mode must be 'render' or 'analytics'"}
+    if mode == "analytics" and telemetry is None:
+        telemetry = "jsonl"
+    if telemetry is not None and telemetry not in TELEMETRY_FORMATS:
+        return {"status": "error", "message": f"telemetry must be one of {', '.join(TELEMETRY_FORMATS)}"}
+
+    # output=hls publishes the video as segments plus a playlist while it is processed
+    if output not in ("file", "hls"):
+        return {"status": "error", "message": "output must be 'file' or 'hls'"}
+    if output == "hls" and mode != "render":
+        return {"status": "error", "message": "output=hls needs mode=render"}
+
+    if detection_profile not in DETECTION_PROFILES:
+        return {"status": "error", "message": f"detection_profile must be one of {', '.join(DETECTION_PROFILES)}"}
+
+    # Lanes are detected at work_width and drawn at output_width, neither above the source width
+    if (work_width is not None and work_width < 64) or (output_width is not None and output_width < 64):
+        return {"status": "error", "message": "work_width and output_width must be at least 64"}
+
+    # detect_every=N runs full detection on every Nth frame (sooner on scene
+    # changes with adaptive_skip) and extrapolates the fits in between
+    # workers > 1 splits the video into frame ranges processed in parallel
+    options = dict(workers=max(1, workers), mode=mode, telemetry=telemetry,
+                   work_width=work_width, output_width=output_width,
+                   detect_every=max(1, detect_every), adaptive_skip=adaptive_skip, output=output,
+                   detection_profile=detection_profile, auto_profile=auto_profile)
+
+    # Detection can start on the part of an upload received so far; it then
+    # runs in one process and cannot be cached before the content is known
+    upload = receiving_upload(filename)
+    if upload is not None:
+        options.update(workers=1, upload_id=upload.upload_id)
+
+    # The same video with the same settings reuses an earlier job's outputs
+    cache_key = None
+    result_cache = get_result_cache()
+    if cache and result_cache is not None and upload is None and output == "file":
+        cache_key = result_cache.key(file_digest(input_path), options)
+
+    job = get_job_manager().submit(filename, cache_key=cache_key,
+                             profile=PROFILE_JOBS if profile is None else profile, **options)
+    if job is None:
+        return {"status": "error", "message": "Too many detection jobs queued, try again later"}
+
+    return {"status": "completed" if job.state == "completed" else "queued", "job_id": job.job_id}
+
+# Replay stand-in for a dashcam when no camera is attached
+DEMO_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "docs", "Inputs", "Lane1.mp4")
+
+def resolve_live_source(source):
+    """(input path, replay) for a camera index, stream URL, upload or 'demo'; None for a missing file"""
+    # Files (uploads or the demo clip) are replayed at their own frame rate
+    if source == "demo":
+        return DEMO_SOURCE, True
+    if source.isdigit() or "://" in source:
+        return source, False
+    input_path = f"uploads/{source}"
+    if os.path.basename(source) != source or not os.path.exists(input_path):
+        return None
+    return input_path, True
+
+@app.get("/start-live")
+def start_live(source: str, budget_ms: float = 100, mode: str = "render", telemetry: str = None,
+               duration: float = None, profile: bool = None, detection_profile: str = "accurate",
+               auto_profile: bool = False):
+    """Run detection on a camera index, stream URL, uploaded file or 'demo' until cancelled"""
+    if mode not in ("render", "analytics"):
+        return {"status": "error", "message": "mode must be 'render' or 'analytics'"}
+    if telemetry is not None and telemetry not in TELEMETRY_FORMATS:
+        return {"status": "error", "message": f"telemetry must be one of {', '.join(TELEMETRY_FORMATS)}"}
+    if detection_profile not in DETECTION_PROFILES:
+        return {"status": "error", "message": f"detection_profile must be one of {', '.join(DETECTION_PROFILES)}"}
+
+    resolved = resolve_live_source(source)
+    if resolved is None:
+        return {"status": "error", "message": "Video file not found"}
+    input_path, replay = resolved
+
+    job = get_job_manager().submit(source, input_path=input_path, live=True, replay=replay, budget_ms=budget_ms,
+                             mode=mode, telemetry=telemetry, duration=duration,
+                             detection_profile=detection_profile, auto_profile=auto_profile,
+                             profile=PROFILE_JOBS if profile is None else profile)
+    if job is None:
+        return {"status": "error", "message": "Too many detection jobs queued, try again later"}
+
+    return {"status": "queued", "job_id": job.job_id}
+
+def get_stream_server():
+    """Shared multi-stream server"""
+    global _stream_server
+    with _services_lock:
+        if _stream_server is None:
+            _stream_server = StreamServer(
+                max_workers=int(os.environ.get("LANESIGHT_STREAM_WORKERS", os.cpu_count() or 1)),
+                max_streams=int(os.environ.get("LANESIGHT_MAX_STREAMS", 64)),
+                idle_seconds=float(os.environ.get("LANESIGHT_STREAM_IDLE_S", 30)),
+            )
+        return _stream_server
+
+@app.post("/streams")
+def add_stream(source: str, mode: str = "render", stream_id: str = None, detection_profile: str = "accurate",
+               auto_profile: bool = False):
+    """Add a feed to the multi-stream server; its detector state lives until it is stopped or idles out"""
+    if mode not in ("render", "analytics"):
+        return {"status": "error", "message": "mode must be 'render' or 'analytics'"}
+    if detection_profile not in DETECTION_PROFILES:
+        return {"status": "error", "message": f"detection_profile must be one of {', '.join(DETECTION_PROFILES)}"}
+    if stream_id is not None and not STREAM_ID.fullmatch(stream_id):
+        return {"status": "error", "message": "stream_id must be 1-64 letters, digits, '-' or '_'"}
+    resolved = resolve_live_source(source)
+    if resolved is None:
+        return {"status": "error", "message": "Video file not found"}
+    input_path, replay = resolved
+
+    try:
+        stream = get_stream_server().add(source, input_path, replay=replay, render=mode == "render",
+                                   stream_id=stream_id,
+                                   options=dict(detection_profile=detection_profile, auto_profile=auto_profile))
+    except RuntimeError as e:
+        return {"status": "error", "message": str(e)}
+    if stream is None:
+        return {"status": "error", "message": "Stream server is full or the stream_id is taken"}
+    return {"status": "running", "stream_id": stream.stream_id}
+
+@app.get("/streams")
+def list_streams():
+    return {"server": get_stream_server().stats(), "streams": [stream.to_dict() for stream in get_stream_server().list()]}
+
+@app.get("/streams/{stream_id}")
+def get_stream(stream_id: str):
+    stream = get_stream_server().get(stream_id)
+    if stream is None:
+        return {"status": "error", "message": "Stream not found"}
+    return stream.to_dict()
+
+@app.post("/streams/{stream_id}/stop")
+def stop_stream(stream_id: str):
+    stream = get_stream_server().remove(stream_id)
+    if stream is None:
+        return {"status": "error", "message": "Stream not found"}
+    return {"status": "stopped", **stream.to_dict()}
+
+@app.get("/streams/{stream_id}/live-video")
+def stream_live_video(stream_id: str):
+    stream = get_stream_server().get(stream_id)
+    if stream is None:
+        return {"status": "error", "message": "Stream not found"}
+    if not stream.render:
+        return {"status": "error", "message": "Live video needs a render stream"}
+    return mjpeg_response(stream.live)
+
+@app.get("/jobs")
+def list_jobs():
+    return {"jobs": [job.to_dict() for job in get_job_manager().list()]}
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return {"status": "error", "message": "Job not found"}
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}/metrics")
+def get_job_metrics(job_id: str):
+    job = get_job_manager().get(job_id)
+    if job is not None:
+        return job.metrics()
+    # Reports of profiled jobs outlive the in-memory job history
+    report_path = job_output_path(job_id, "_metrics.json")
+    if report_path is not None and os.path.exists(report_path):
+        return FileResponse(report_path, media_type="application/json")
+    return {"status": "error", "message": "Job not found"}
+
+def prometheus_metrics(jobs):
+    """Prometheus text exposition of job counters and stage timing histograms"""
+    lines = [
+        "# HELP lanesight_jobs Detection jobs by state",
+        "# TYPE lanesight_jobs gauge",
+    ]
+    states = {}
+    for job in jobs:
+        states[job.state] = states.get(job.state, 0) + 1
+    lines += [f'lanesight_jobs{{state="{state}"}} {n}' for state, n in sorted(states.items())]
+
+    families = [
+        ("lanesight_job_frames_total", "counter", "Frames processed by a job", lambda job: job.frames_done),
+        ("lanesight_job_fps", "gauge", "Average frames per second of a job", lambda job: round(job.fps(), 3)),
+        ("lanesight_job_dropped_frames_total", "counter", "Frames a live job dropped to keep up",
+         lambda job: job.stats.get("dropped_frames", 0)),
+    ]
+    for name, kind, help_text, value in families:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        lines += [f'{name}{{job_id="{job.job_id}"}} {value(job)}' for job in jobs]
+
+    profiled = [job for job in jobs if job.profiler is not None]
+    lines += ["# HELP lanesight_job_detected_frames_total Frames that ran lane detection",
+              "# TYPE lanesight_job_detected_frames_total counter"]
+    lines += [f'lanesight_job_detected_frames_total{{job_id="{job.job_id}"}} {job.profiler.detected}'
+              for job in profiled]
+    lines += ["# HELP lanesight_job_lane_lost_frames_total Detected frames missing a lane",
+              "# TYPE lanesight_job_lane_lost_frames_total counter"]
+    lines += [f'lanesight_job_lane_lost_frames_total{{job_id="{job.job_id}"}} {job.profiler.lane_lost}'
+              for job in profiled]
+
+    lines += ["# HELP lanesight_stage_seconds Time spent in each pipeline stage",
+              "# TYPE lanesight_stage_seconds histogram"]
+    for job in profiled:
+        for stage, histogram in list(job.profiler.stages.items()):
+            labels = f'job_id="{job.job_id}",stage="{stage}"'
+            cumulative = 0
+            for bound, n in zip(STAGE_BUCKETS + ("+Inf",), histogram.counts):
+                cumulative += n
+                lines.append(f'lanesight_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"lanesight_stage_seconds_sum{{{labels}}} {histogram.total:.6f}")
+            lines.append(f"lanesight_stage_seconds_count{{{labels}}} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+def prometheus_stream_metrics(server):
+    """Prometheus text exposition of the multi-stream server"""
+    stats = server.stats()
+    lines = []
+    for name, kind, help_text, key in (
+            ("lanesight_streams", "gauge", "Streams on the multi-stream server", "streams"),
+            ("lanesight_streams_evicted_total", "counter", "Streams evicted after idling or ending",
+             "evicted_streams"),
+            ("lanesight_stream_server_frames_total", "counter", "Frames processed across all streams",
+             "frames_done"),
+            ("lanesight_stream_server_fps", "gauge", "Aggregate frames per second across all streams",
+             "aggregate_fps"),
+            ("lanesight_stream_server_fps_per_core", "gauge", "Aggregate frames per second per worker core",
+             "fps_per_core")):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {stats[key]}"]
+    streams = server.list()
+    lines += ["# HELP lanesight_stream_frames_total Frames processed by a stream",
+              "# TYPE lanesight_stream_frames_total counter"]
+    lines += [f'lanesight_stream_frames_total{{stream_id="{stream.stream_id}"}} {stream.frames_done}'
+              for stream in streams]
+    return "\n".join(lines) + "\n"
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(prometheus_metrics(get_job_manager().list()) + prometheus_stream_metrics(get_stream_server()),
+                             media_type="text/plain; version=0.0.4")
+
+@app.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    job = get_job_manager().cancel(job_id)
+    if job is None:
+        return {"status": "error", "message": "Job not found"}
+    return job.to_dict()
+
+class VideoResponse(FileResponse):
+    """FileResponse reading multi-megabyte videos in larger blocks"""
+    chunk_size = 1 << 20
+
+# Behind nginx (X-Accel-Redirect) or Apache/lighttpd (X-Sendfile) the proxy
+# sends videos itself with sendfile(); the prefix maps output/ to its location
+SENDFILE_HEADER = os.environ.get("LANESIGHT_SENDFILE_HEADER")
+SENDFILE_PREFIX = os.environ.get("LANESIGHT_SENDFILE_PREFIX", "/protected/output/")
+
+def not_modified(request, etag, stat_result):
+    """Whether the client's cached copy (If-None-Match, else If-Modified-Since) is current"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(stat_result.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def serve_video(request, path, filename=None, media_type="video/mp4"):
+    """Job video with ETag/Last-Modified, 304 revalidation and byte ranges (206) for seeking"""
+    stat_result = os.stat(path)
+    headers = {
+        "etag": f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"',
+        "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+        # Cacheable, but revalidated so a re-run job is never served stale
+        "cache-control": "no-cache",
+        "accept-ranges": "bytes",
+    }
+    if not_modified(request, headers["etag"], stat_result):
+        return Response(status_code=304, headers=headers)
+    if SENDFILE_HEADER:
+        if filename:
+            headers["content-disposition"] = f'attachment; filename="{filename}"'
+        headers[SENDFILE_HEADER] = SENDFILE_PREFIX + os.path.relpath(path, "output")
+        return Response(media_type=media_type, headers=headers)
+    return VideoResponse(path, media_type=media_type, filename=filename, headers=headers, stat_result=stat_result)
+
+@app.get("/download-video")
+def download_video(job_id: str, request: Request):
+    output_path = job_output_path(job_id)
+    if output_path is None or not os.path.exists(output_path):
+        return {"status": "error", "message": "Processed video not found"}
+    return serve_video(request, output_path, filename="lanesight_processed_video.mp4")
+
+@app.get("/stream-video")
+def stream_video(job_id: str, request: Request):
+    output_path = job_output_path(job_id)
+    if output_path is None or not os.path.exists(output_path):
+        return {"status": "error", "message": "Processed video not found"}
+    return serve_video(request, output_path)
+
+@app.get("/segments/{job_id}/{name}")
+def get_segment(job_id: str, name: str, request: Request):
+    """HLS playlist (index.m3u8) and segments of an output=hls job, available while it runs"""
+    segment_dir = job_output_path(job_id, "_hls")
+    if segment_dir is None or not (name in ("index.m3u8", HLS_INIT_NAME) or SEGMENT_NAME.fullmatch(name)):
+        return {"status": "error", "message": "Segment not found"}
+    path = os.path.join(segment_dir, name)
+    if not os.path.exists(path):
+        return {"status": "error", "message": "Segment not found"}
+    if name == "index.m3u8":
+        # Rewritten as segments land, so players must always refetch it
+        return FileResponse(path, media_type="application/vnd.apple.mpegurl",
+                            headers={"cache-control": "no-cache"})
+    return serve_video(request, path, media_type="video/mp4" if name == HLS_INIT_NAME else "video/iso.segment")
+
+@app.get("/download-telemetry")
+def download_telemetry(job_id: str):
+    for fmt, (ext, media_type) in TELEMETRY_FORMATS.items():
+        telemetry_path = job_output_path(job_id, ext)
+        if telemetry_path is not None and os.path.exists(telemetry_path):
+            return FileResponse(telemetry_path, media_type=media_type,
+                                filename=f"lanesight_telemetry{ext}")
+    return {"status": "error", "message": "Telemetry not found"}
+
+@app.get("/live-video")
+def live_video(job_id: str):
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return {"status": "error", "message": "Job not found"}
+    if job.options.get("mode", "render") != "render" or job.options.get("workers", 1) > 1:
+        return {"status": "error", "message": "Live video needs a single-process render job"}
+
+    return mjpeg_response(job.live)
+
+def mjpeg_response(feed):
+    """MJPEG stream of a LiveFeed's newest frames"""
+    async def mjpeg():
+        async for _ in feed.updates():
+            jpeg = await asyncio.to_thread(feed.jpeg)
+            if jpeg is None:
+                continue
+            yield (b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: " +
+                   str(len(jpeg)).encode() + b"\r\n\r\n" + jpeg + b"\r\n")
+
+    return StreamingResponse(mjpeg(), media_type="multipart/x-mixed-replace; boundary=frame")
+
+@app.websocket("/live")
+async def live_updates(websocket: WebSocket, job_id: str, frames: bool = False):
+    """Per-frame telemetry as JSON text messages, each optionally followed by the JPEG frame"""
+    await websocket.accept()
+    job = get_job_manager().get(job_id)
+    if job is None:
+        await websocket.send_json({"status": "error", "message": "Job not found"})
+        await websocket.close()
+        return
+
+    try:
+        async for _ in job.live.updates():
+            seq, record = job.live.latest()
+            await websocket.send_json(telemetry_dict(record))
+            if frames:
+                jpeg = await asyncio.to_thread(job.live.jpeg)
+                if jpeg is not None:
+                    await websocket.send_bytes(jpeg)
+        await websocket.send_json(job.to_dict())
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
 
 @app.get("/video-info")
-def get_video_info():
-    output_path = "output/processed.mp4"
-    if os.path.exists(output_path):
+def get_video_info(job_id: str):
+    output_path = job_output_path(job_id)
+    if output_path is not None and os.path.exists(output_path):
         file_size_mb = os.path.getsize(output_path) / (1024 * 1024)
         return {
             "exists": True,
+            "job_id": job_id,
             "file_size_mb": round(file_size_mb, 2),
             "filename": "lanesight_processed_video.mp4"
         }
@@ -0,0 +1,283 @@
+"""Headless batch detection over directories of recordings, without the web stack
+
+Run from the backend directory:
+    python batch.py /data/recordings --out batch_output --processes 4
+    python batch.py --manifest nightly.txt --mode analytics --telemetry npz
+    python batch.py /data/recordings --out batch_output   # resumes an interrupted run
+
+Every video runs through the same run_detection loop as /start-detection,
+one video per worker process. Completed videos are appended to
+checkpoint.jsonl in the output directory as they finish, so a rerun skips
+them; index.json consolidates the outputs and per-video telemetry totals.
+A checkpoint only resumes with the options it was written with; other
+options need another output directory.
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+import app
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".m4v", ".webm")
+CHECKPOINT_NAME = "checkpoint.jsonl"
+INDEX_NAME = "index.json"
+
+
+class TelemetrySummary:
+    """Stands in for a job's LiveFeed, folding every published record into per-video totals"""
+
+    def __init__(self):
+        self.frames = 0
+        self.lane_lost = 0
+        self.departures = 0
+        self.offset_abs_sum = 0.0
+        self.confidence_sum = 0.0
+
+    def publish(self, frame, record):
+        _, left_a, _, _, right_a, _, _, offset, _, departure, confidence = record
+        self.frames += 1
+        self.lane_lost += int(np.isnan(left_a) or np.isnan(right_a))
+        self.departures += int(departure)
+        self.offset_abs_sum += abs(offset)
+        self.confidence_sum += confidence
+
+    def close(self):
+        pass
+
+    def to_dict(self):
+        n = max(self.frames, 1)
+        return {
+            "frames": self.frames,
+            "lane_lost_frames": self.lane_lost,
+            "lane_lost_rate": round(self.lane_lost / n, 4),
+            "departure_frames": self.departures,
+            "mean_abs_offset_m": round(self.offset_abs_sum / n, 4),
+            "mean_confidence": round(self.confidence_sum / n, 4),
+        }
+
+
+def find_videos(paths, manifest=None):
+    """Absolute paths of the videos under paths (walked recursively) and in a manifest, in order"""
+    videos = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                videos += [os.path.join(root, name) for name in sorted(files)
+                           if name.lower().endswith(VIDEO_EXTENSIONS)]
+        else:
+            videos.append(path)
+    if manifest:
+        # One path per line, relative to the manifest; blank lines and # comments are skipped
+        base = os.path.dirname(os.path.abspath(manifest))
+        with open(manifest) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    videos.append(os.path.join(base, line))
+    seen = set()
+    return [v for v in map(os.path.abspath, videos) if not (v in seen or seen.add(v))]
+
+
+def options_digest(options):
+    """Short digest of the job options, part of every checkpoint key"""
+    return hashlib.sha1(json.dumps(options, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def video_key(path, options):
+    """Identity of a result for the checkpoint: path, size, mtime and the options it ran with"""
+    stat = os.stat(path)
+    return f"{path}:{stat.st_size}:{stat.st_mtime_ns}:{options_digest(options)}"
+
+
+def output_stem(path):
+    """Output name of a video, unique across directories holding the same file name"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return f"{stem}_{hashlib.sha1(path.encode()).hexdigest()[:8]}"
+
+
+def load_checkpoint(path):
+    """Entries of completed videos by video_key; a torn last line from a crash is ignored"""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if entry.get("status") == "completed":
+                done[entry["key"]] = entry
+    return done
+
+
+def process_video(path, key, out_dir, options):
+    """Run one video in a worker process and move its outputs into out_dir; returns its checkpoint entry"""
+    job = app.DetectionJob(os.path.basename(path), options, input_path=path)
+    job.live = TelemetrySummary()
+    entry = {"key": key, "video": path}
+    start = time.perf_counter()
+    try:
+        app.run_detection(job)
+    except Exception as e:
+        return {**entry, "status": "error", "message": str(e)}
+    seconds = time.perf_counter() - start
+
+    extensions = {"video": ".mp4"}
+    if options.get("telemetry"):
+        extensions["telemetry"] = app.TELEMETRY_FORMATS[options["telemetry"]][0]
+    outputs = {}
+    for kind, ext in extensions.items():
+        produced = app.job_output_path(job.job_id, ext)
+        if os.path.exists(produced):
+            outputs[kind] = output_stem(path) + ext
+            shutil.move(produced, os.path.join(out_dir, outputs[kind]))
+    return {
+        **entry,
+        "status": "completed",
+        "outputs": outputs,
+        "seconds": round(seconds, 3),
+        "fps": round(job.frames_done / seconds, 2) if seconds > 0 else None,
+        "summary": job.live.to_dict(),
+        **{name: job.stats[name] for name in ("detected_frames", "detection_profile", "profile_switches")
+           if name in job.stats},
+    }
+
+
+def write_index(out_dir, entries, options):
+    """Consolidated index of every completed video, rewritten atomically"""
+    frames = sum(entry["summary"]["frames"] for entry in entries)
+    index = {
+        "options": options,
+        "videos": len(entries),
+        "frames": frames,
+        "lane_lost_frames": sum(entry["summary"]["lane_lost_frames"] for entry in entries),
+        "departure_frames": sum(entry["summary"]["departure_frames"] for entry in entries),
+        "entries": sorted(entries, key=lambda entry: entry["video"]),
+    }
+    path = os.path.join(out_dir, INDEX_NAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump(index, f, indent=2)
+    os.replace(path + ".tmp", path)
+    return index
+
+
+def run_batch(videos, out_dir, options, processes, max_pending=None):
+    """Process videos not yet in the checkpoint; returns (completed entries, failed entries)
+
+    At most max_pending videos (2 per process by default) are queued at a
+    time, so the parent holds a bounded amount of work however long the
+    list is; results go to disk as soon as each video finishes. Raises
+    ValueError when the checkpoint was written with other options.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    checkpoint_path = os.path.join(out_dir, CHECKPOINT_NAME)
+    done = load_checkpoint(checkpoint_path)
+    # Outputs are named per video, so results of other options would be overwritten
+    # while index.json still listed them under these options
+    digest = options_digest(options)
+    if any(not key.endswith(":" + digest) for key in done):
+        raise ValueError(f"{checkpoint_path} was written with different options; use another --out directory")
+    todo = []
+    for path in videos:
+        key = video_key(path, options)
+        if key not in done:
+            todo.append((path, key))
+    print(f"{len(videos)} videos, {len(videos) - len(todo)} already done, {len(todo)} to process")
+
+    failed = []
+    max_pending = max_pending or 2 * processes
+    # Spawn rather than fork: workers start clean of the parent's OpenCV threads
+    pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+    pending = set()
+    queue = iter(todo)
+    try:
+        with open(checkpoint_path, "a") as checkpoint:
+            if checkpoint.tell():
+                with open(checkpoint_path, "rb") as f:
+                    f.seek(-1, os.SEEK_END)
+                    torn = f.read(1) != b"\n"
+                if torn:
+                    # A crash cut the last line short; the next entry must not be glued onto it
+                    checkpoint.write("\n")
+            while True:
+                for path, key in queue:
+                    pending.add(pool.submit(process_video, path, key, out_dir, options))
+                    if len(pending) >= max_pending:
+                        break
+                if not pending:
+                    break
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    entry = future.result()
+                    # One flushed line per video is what makes the run resumable
+                    checkpoint.write(json.dumps(entry) + "\n")
+                    checkpoint.flush()
+                    os.fsync(checkpoint.fileno())
+                    if entry["status"] == "completed":
+                        done[entry["key"]] = entry
+                        print(f"done   {entry['video']} ({entry['summary']['frames']} frames, {entry['fps']} fps)")
+                    else:
+                        failed.append(entry)
+                        print(f"FAILED {entry['video']}: {entry['message']}")
+    finally:
+        # Nothing is pending after a full run; on an interrupt, unfinished videos rerun next time
+        pool.shutdown(wait=False, cancel_futures=True)
+        # A recording changed since an earlier run is listed with its latest result only
+        latest = {entry["video"]: entry for entry in done.values()}
+        write_index(out_dir, list(latest.values()), options)
+    return list(latest.values()), failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="video files or directories to walk")
+    parser.add_argument("--manifest", help="text file listing one video path per line")
+    parser.add_argument("--out", default="batch_output", help="output directory, also holds the checkpoint")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--max-pending", type=int, default=None, help="videos queued at once (2 per process)")
+    parser.add_argument("--mode", choices=("render", "analytics"), default="analytics")
+    parser.add_argument("--telemetry", choices=tuple(app.TELEMETRY_FORMATS), default="jsonl")
+    parser.add_argument("--work-width", type=int, default=None)
+    parser.add_argument("--output-width", type=int, default=None)
+    parser.add_argument("--detect-every", type=int, default=1)
+    parser.add_argument("--adaptive-skip", action="store_true")
+    parser.add_argument("--detection-profile", choices=tuple(app.DETECTION_PROFILES), default="accurate")
+    parser.add_argument("--auto-profile", action="store_true")
+
+    args = parser.parse_args()
+    videos = find_videos(args.paths, args.manifest)
+    missing = [path for path in videos if not os.path.isfile(path)]
+    if missing:
+        parser.error(f"not found: {', '.join(missing)}")
+    if not videos:
+        parser.error("no videos given")
+
+    # Same job options /start-detection builds; each video runs in one process
+    options = dict(workers=1, mode=args.mode, telemetry=args.telemetry, work_width=args.work_width,
+                   output_width=args.output_width, detect_every=max(1, args.detect_every),
+                   adaptive_skip=args.adaptive_skip, detection_profile=args.detection_profile,
+                   auto_profile=args.auto_profile)
+    try:
+        completed, failed = run_batch(videos, args.out, options, max(1, args.processes), args.max_pending)
+    except ValueError as e:
+        parser.error(str(e))
+    except KeyboardInterrupt:
+        print(f"interrupted; rerun the same command to resume from {os.path.join(args.out, CHECKPOINT_NAME)}")
+        sys.exit(130)
+    print(f"{len(completed)} videos indexed in {os.path.join(args.out, INDEX_NAME)}, {len(failed)} failed")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
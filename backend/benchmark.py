@@ -0,0 +1,527 @@
+"""Throughput benchmarks for the LaneSight detection pipeline
+
+Run from the backend directory:
+    python benchmark.py parallel --workers 1 2 4 8
+    python benchmark.py preprocess
+    python benchmark.py ransac
+    python benchmark.py skip --every 2 3 5
+    python benchmark.py suite --output results.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+import app
+
+DEFAULT_VIDEO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "docs", "Inputs", "Lane1.mp4")
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+SYNTHETIC_SIZES = {"480p": (854, 480), "720p": (1280, 720), "1080p": (1920, 1080)}
+
+
+def reference_preprocess(frame):
+    """Original full-frame float64 preprocess, kept as the golden reference for the mask"""
+    # Multiple color spaces for maximum robustness
+    hls = cv2.cvtColor(frame, cv2.COLOR_BGR2HLS)
+    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    lab = cv2.cvtColor(frame, cv2.COLOR_BGR2LAB)
+
+    # Adaptive brightness detection
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    brightness = np.mean(gray)
+    is_dark = brightness < 100
+
+    # Enhanced contrast with adaptive CLAHE
+    l = hls[:,:,1]
+    clahe_limit = 3.0 if is_dark else 2.0
+    clahe = cv2.createCLAHE(clipLimit=clahe_limit, tileGridSize=(8,8))
+    l_enhanced = clahe.apply(l)
+
+    # Gaussian blur before Sobel to reduce noise
+    l_blurred = cv2.GaussianBlur(l_enhanced, (5, 5), 0)
+
+    # Advanced gradient detection with magnitude and direction
+    sobelx = cv2.Sobel(l_blurred, cv2.CV_64F, 1, 0, ksize=5)
+    sobely = cv2.Sobel(l_blurred, cv2.CV_64F, 0, 1, ksize=5)
+    grad_mag = np.sqrt(sobelx**2 + sobely**2)
+    grad_dir = np.arctan2(np.abs(sobely), np.abs(sobelx))
+
+    # Normalize gradients
+    if np.max(grad_mag) > 0:
+        scaled_mag = np.uint8(255 * grad_mag / np.max(grad_mag))
+    else:
+        scaled_mag = np.zeros_like(grad_mag, dtype=np.uint8)
+
+    if np.max(sobelx) > 0:
+        scaled_sobelx = np.uint8(255 * np.abs(sobelx) / np.max(np.abs(sobelx)))
+    else:
+        scaled_sobelx = np.zeros_like(sobelx, dtype=np.uint8)
+
+    # Adaptive thresholds based on brightness
+    if is_dark:
+        grad_thresh = (15, 200)
+        s_thresh = (80, 255)
+        l_thresh = (150, 255)
+    else:
+        grad_thresh = (25, 255)
+        s_thresh = (100, 255)
+        l_thresh = (200, 255)
+
+    # Gradient binaries with magnitude and direction
+    mag_binary = np.zeros_like(scaled_mag)
+    mag_binary[(scaled_mag >= grad_thresh[0]) & (scaled_mag <= grad_thresh[1])] = 1
+
+    dir_binary = np.zeros_like(grad_dir)
+    dir_binary[(grad_dir >= 0.7) & (grad_dir <= 1.3)] = 1
+
+    gradx_binary = np.zeros_like(scaled_sobelx)
+    gradx_binary[(scaled_sobelx >= grad_thresh[0]) & (scaled_sobelx <= grad_thresh[1])] = 1
+
+    # Color detection in multiple spaces
+    s = hls[:,:,2]
+    s_binary = np.zeros_like(s)
+    s_binary[(s >= s_thresh[0]) & (s <= s_thresh[1])] = 1
+
+    # Enhanced yellow detection in HSV
+    yellow_lower = np.array([18, 80 if is_dark else 100, 80 if is_dark else 100])
+    yellow_upper = np.array([35, 255, 255])
+    yellow_mask = cv2.inRange(hsv, yellow_lower, yellow_upper)
+
+    # White detection in HLS and LAB
+    white_hls = np.zeros_like(l)
+    white_hls[(l >= l_thresh[0]) & (s <= 40)] = 1
+
+    # LAB color space for shadows and lighting variations
+    l_lab = lab[:,:,0]
+    white_lab = np.zeros_like(l_lab)
+    white_lab[l_lab >= (160 if is_dark else 180)] = 1
+
+    # Combine all detection methods
+    gradient_combined = np.zeros_like(mag_binary)
+    gradient_combined[(gradx_binary == 1) | ((mag_binary == 1) & (dir_binary == 1))] = 1
+
+    color_combined = np.zeros_like(s_binary)
+    color_combined[(s_binary == 1) | (yellow_mask > 0) | (white_hls == 1) | (white_lab == 1)] = 1
+
+    # Final combination with priority on color detection
+    combined = np.zeros_like(gradient_combined)
+    combined[(color_combined == 1) | (gradient_combined == 1)] = 255
+
+    return combined
+
+
+
+def reference_ransac_polyfit(y, x, max_trials=100, residual_threshold=50):
+    """Original per-trial RANSAC on the global RNG, kept as the reference for speed and fit error"""
+    if len(y) < 10:
+        return None
+
+    best_fit = None
+    best_inliers = 0
+
+    for _ in range(max_trials):
+        # Random sample
+        sample_indices = np.random.choice(len(y), min(10, len(y)//2), replace=False)
+        sample_y = y[sample_indices]
+        sample_x = x[sample_indices]
+
+        try:
+            # Fit polynomial
+            fit = np.polyfit(sample_y, sample_x, 2)
+
+            # Calculate residuals for all points
+            predicted_x = np.polyval(fit, y)
+            residuals = np.abs(x - predicted_x)
+
+            # Count inliers
+            inliers = np.sum(residuals < residual_threshold)
+
+            if inliers > best_inliers:
+                best_inliers = inliers
+                best_fit = fit
+
+        except:
+            continue
+
+    # Fallback to regular polyfit if RANSAC fails
+    if best_fit is None:
+        try:
+            best_fit = np.polyfit(y, x, 2)
+        except:
+            return None
+
+    return best_fit
+
+
+def read_frames(video, limit=None):
+    """Frames of a video resized to the size run_detection detects at"""
+    cap = cv2.VideoCapture(video)
+    (width, height), _, _ = app.output_geometry(cap)
+    frames = []
+    while limit is None or len(frames) < limit:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(cv2.resize(frame, (width, height)))
+    cap.release()
+    return frames
+
+
+def bench_preprocess(video, limit):
+    """Golden-mask equivalence and per-stage timings of preprocess against the reference"""
+    frames = read_frames(video, limit)
+    # Darkened copies exercise the night thresholds
+    variants = {"day": frames, "night": [(frame * 0.4).astype(np.uint8) for frame in frames]}
+    detector = app.AdvancedLaneDetector()
+    stages = {
+        "preprocess (reference)": reference_preprocess,
+        "preprocess": detector.preprocess,
+    }
+
+    mismatched = 0
+    print(f"{'variant':<8} {'stage':<24} {'mean ms':>9} {'p95 ms':>9}")
+    for name, clip in variants.items():
+        timings = {stage: [] for stage in list(stages) + ["adaptive_roi"]}
+        for frame in clip:
+            masks = {}
+            for stage, fn in stages.items():
+                start = time.perf_counter()
+                masks[stage] = fn(frame)
+                timings[stage].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            golden = detector.adaptive_roi(masks["preprocess (reference)"])
+            timings["adaptive_roi"].append(time.perf_counter() - start)
+            mismatched += int(np.count_nonzero(golden != detector.adaptive_roi(masks["preprocess"])))
+        for stage, samples in timings.items():
+            samples = np.array(samples) * 1000
+            print(f"{name:<8} {stage:<24} {samples.mean():>9.2f} {np.percentile(samples, 95):>9.2f}")
+
+    print(f"ROI mask pixels differing from reference: {mismatched}")
+    return mismatched == 0
+
+
+def collect_lane_pixels(frames):
+    """Lane pixel sets that sliding_window hands to ransac_polyfit on these frames"""
+    detector = app.AdvancedLaneDetector()
+    detector.track_lanes = False
+    samples = []
+    fit = detector.ransac_polyfit
+
+    def record(y, x, **kwargs):
+        samples.append((y, x))
+        return fit(y, x, **kwargs)
+
+    detector.ransac_polyfit = record
+    for frame in frames:
+        detector.detect(frame)
+    return samples
+
+
+def fit_error(fit, y, x, residual_threshold=50):
+    """Inlier ratio and median absolute residual of a fit over a pixel set"""
+    if fit is None:
+        return 0.0, float("nan")
+    residuals = np.abs(x - np.polyval(fit, y))
+    return float(np.mean(residuals < residual_threshold)), float(np.median(residuals))
+
+
+def bench_ransac(video, limit):
+    """Batched RANSAC against the original per-trial loop: time and fit error per lane"""
+    samples = collect_lane_pixels(read_frames(video, limit))
+    detector = app.AdvancedLaneDetector()
+    np.random.seed(0)
+    methods = {
+        "reference": reference_ransac_polyfit,
+        "batched": detector.ransac_polyfit,
+    }
+
+    print(f"{len(samples)} lane pixel sets, median size {int(np.median([len(y) for y, _ in samples]))}")
+    print(f"{'method':<10} {'mean ms':>9} {'p95 ms':>9} {'inlier %':>9} {'median |res| px':>16}")
+    for name, fn in methods.items():
+        timings, ratios, medians = [], [], []
+        for y, x in samples:
+            start = time.perf_counter()
+            fit = fn(y, x)
+            timings.append(time.perf_counter() - start)
+            ratio, median = fit_error(fit, y, x)
+            ratios.append(ratio)
+            medians.append(median)
+        timings = np.array(timings) * 1000
+        print(f"{name:<10} {timings.mean():>9.2f} {np.percentile(timings, 95):>9.2f} "
+              f"{100 * np.mean(ratios):>9.1f} {np.nanmean(medians):>16.2f}")
+
+
+def lane_x(records, rows):
+    """Lane x positions at the given rows per frame, NaN where a lane is missing"""
+    coefficients = np.array([record[1:7] for record in records], dtype=np.float64).reshape(-1, 2, 3)
+    powers = np.stack([rows ** 2, rows, np.ones_like(rows)])
+    return coefficients @ powers
+
+
+def bench_skip(video, limit, every_values):
+    """Frame skipping against detecting every frame: time per frame and lane position error"""
+    frames = read_frames(video, limit)
+    height = frames[0].shape[0]
+    # Rows the overlay is drawn over, from the horizon band to the bottom
+    rows = np.linspace(0.6 * height, height - 1, 20)
+    configs = [(1, False)] + [(every, adaptive) for every in every_values for adaptive in (False, True)]
+
+    print(f"{len(frames)} frames at {frames[0].shape[1]}x{height}")
+    print(f"{'every':>6} {'adaptive':>9} {'detected %':>11} {'ms/frame':>9} {'speedup':>8} "
+          f"{'mean |dx| px':>13} {'p95 |dx| px':>12}")
+    reference = baseline = None
+    for every, adaptive in configs:
+        detector = app.AdvancedLaneDetector()
+        skipper = app.FrameSkipper(detector, every, adaptive) if every > 1 else None
+        process = app.frame_processor(detector, render=False, record=True, skipper=skipper)
+        start = time.perf_counter()
+        records = [process(frame)[1] for frame in frames]
+        ms = (time.perf_counter() - start) * 1000 / len(frames)
+        detected = len(frames) if skipper is None else skipper.detected
+
+        xs = lane_x(records, rows)
+        if reference is None:
+            reference, baseline = xs, ms
+        errors = np.abs(xs - reference)
+        errors = errors[~np.isnan(errors)]
+        print(f"{every:>6} {str(adaptive):>9} {100 * detected / len(frames):>11.1f} {ms:>9.2f} "
+              f"{baseline / ms:>7.2f}x {errors.mean():>13.2f} {np.percentile(errors, 95):>12.2f}")
+
+
+def run_job(video, **options):
+    """Run one detection job synchronously and return (frames, seconds)"""
+    job = app.DetectionJob(os.path.basename(video), options)
+    job.input_path = video
+    start = time.perf_counter()
+    output_path = app.run_detection(job)
+    elapsed = time.perf_counter() - start
+    os.remove(output_path)
+    return job.frames_done, elapsed
+
+
+def bench_parallel(video, worker_counts, repeat):
+    """Chunked multi-process throughput for each worker count"""
+    print(f"{'workers':>8} {'frames':>8} {'seconds':>9} {'fps':>8} {'speedup':>8}")
+    baseline = None
+    for workers in worker_counts:
+        best = min((run_job(video, workers=workers) for _ in range(repeat)), key=lambda r: r[1])
+        frames, seconds = best
+        fps = frames / seconds
+        baseline = baseline or fps
+        print(f"{workers:>8} {frames:>8} {seconds:>9.2f} {fps:>8.1f} {fps / baseline:>7.2f}x")
+
+
+def synthetic_frames(width, height, count, seed=0):
+    """Seeded road scenes with two lane lines drifting sideways, for sizes no clip covers"""
+    rng = np.random.default_rng(seed)
+    horizon = int(height * 0.6)
+    background = np.empty((height, width, 3), dtype=np.uint8)
+    background[:horizon] = (190, 160, 120)
+    background[horizon:] = (90, 90, 90)
+    background = np.clip(background + rng.normal(0, 6, background.shape), 0, 255).astype(np.uint8)
+
+    frames = []
+    thickness = max(width // 120, 2)
+    for i in range(count):
+        frame = background.copy()
+        shift = int(width * 0.03 * np.sin(i / 10))
+        left = np.array([[int(width * 0.2) + shift, height - 1], [int(width * 0.46), horizon]])
+        right = np.array([[int(width * 0.85) + shift, height - 1], [int(width * 0.54), horizon]])
+        cv2.polylines(frame, [left], False, (0, 200, 230), thickness)
+        # Dashed right line moving towards the camera
+        for start in np.linspace(0, 1, 8, endpoint=False) + (i % 8) / 64:
+            a = right[0] + (right[1] - right[0]) * start
+            b = right[0] + (right[1] - right[0]) * (start + 1 / 16)
+            cv2.line(frame, tuple(a.astype(int)), tuple(b.astype(int)), (235, 235, 235), thickness)
+        frames.append(frame)
+    return frames
+
+
+def stage_timings(frames, repeat=3, warmup=5):
+    """Per-stage and process_frame timings of a profiled detector, best of repeat passes per stage"""
+    # Untimed warm-up so first-frame allocations and caches do not skew the numbers
+    warm = app.AdvancedLaneDetector()
+    for frame in frames[:warmup]:
+        warm.process_frame(frame)
+
+    best = {}
+    for _ in range(repeat):
+        np.random.seed(0)
+        profiler = app.PipelineProfiler()
+        detector = profiler.instrument(app.AdvancedLaneDetector())
+        process_frame = profiler.timed("process_frame", detector.process_frame)
+        for frame in frames:
+            process_frame(frame)
+        for stage, report in profiler.to_dict()["stages"].items():
+            if report["count"] and (stage not in best or report["mean_ms"] < best[stage]["mean_ms"]):
+                best[stage] = report
+    return best
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+    # VmHWM belongs to this process image alone; ru_maxrss can carry the
+    # parent's peak across exec
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def end_to_end(video, options):
+    """One detection job in this process: throughput and peak RSS"""
+    frames, seconds = run_job(video, **options)
+    return {"frames": frames, "seconds": round(seconds, 3), "fps": round(frames / seconds, 2),
+            "peak_rss_mb": round(peak_rss_mb(), 1)}
+
+
+def bench_suite(video, limit, synthetic_count, repeat):
+    """Stage timings on the clip and synthetic sizes plus end-to-end jobs, as one result dict"""
+    results = {
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+        },
+        "stages": {},
+        "end_to_end": {},
+    }
+
+    # A fresh process per job so peak RSS belongs to that job alone
+    context = multiprocessing.get_context("spawn")
+    for mode in ("render", "analytics"):
+        print(f"end-to-end {mode} job on {os.path.basename(video)}")
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            options = {"mode": mode, "telemetry": "jsonl" if mode == "analytics" else None}
+            results["end_to_end"][mode] = pool.submit(end_to_end, video, options).result()
+
+    datasets = {"lane1": read_frames(video, limit)}
+    for name, (width, height) in SYNTHETIC_SIZES.items():
+        datasets[f"synthetic_{name}"] = synthetic_frames(width, height, synthetic_count)
+    for name, frames in datasets.items():
+        print(f"timing stages on {name} ({len(frames)} frames at {frames[0].shape[1]}x{frames[0].shape[0]})")
+        results["stages"][name] = stage_timings(frames, repeat)
+
+    return results
+
+
+def flatten_metrics(results):
+    """Comparable metrics of a suite result as {dotted name: value}"""
+    # Tail latencies are reported but too noisy on shared machines to gate on
+    metrics = {}
+    for dataset, stages in results["stages"].items():
+        for stage, report in stages.items():
+            metrics[f"stages.{dataset}.{stage}.mean_ms"] = report["mean_ms"]
+    for mode, report in results["end_to_end"].items():
+        for key in ("fps", "peak_rss_mb"):
+            metrics[f"end_to_end.{mode}.{key}"] = report[key]
+    return metrics
+
+
+def compare_results(results, baseline, threshold, min_delta_ms=0.5):
+    """Metrics that regressed by more than threshold against baseline, as printable lines"""
+    if results["machine"] != baseline.get("machine"):
+        print("warning: baseline was recorded on a different machine or library versions")
+    current, previous = flatten_metrics(results), flatten_metrics(baseline)
+    regressions = []
+    for name in sorted(current.keys() & previous.keys()):
+        new, old = current[name], previous[name]
+        if not old:
+            continue
+        # Throughput regresses downwards, times and memory upwards
+        change = (old - new) / old if name.endswith("fps") else (new - old) / old
+        if name.endswith("_ms") and new - old < min_delta_ms:
+            continue
+        if change > threshold:
+            regressions.append(f"{name}: {old} -> {new} ({100 * change:+.1f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    parallel = sub.add_parser("parallel", help="throughput scaling of chunked multi-process detection")
+    parallel.add_argument("--video", default=DEFAULT_VIDEO)
+    parallel.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    parallel.add_argument("--repeat", type=int, default=1)
+
+    preprocess = sub.add_parser("preprocess", help="preprocess golden-mask check and stage timings")
+    preprocess.add_argument("--video", default=DEFAULT_VIDEO)
+    preprocess.add_argument("--frames", type=int, default=None)
+
+    ransac = sub.add_parser("ransac", help="batched RANSAC against the original loop")
+    ransac.add_argument("--video", default=DEFAULT_VIDEO)
+    ransac.add_argument("--frames", type=int, default=None)
+
+    skip = sub.add_parser("skip", help="frame skipping accuracy and speed against full detection")
+    skip.add_argument("--video", default=DEFAULT_VIDEO)
+    skip.add_argument("--frames", type=int, default=None)
+    skip.add_argument("--every", type=int, nargs="+", default=[2, 3, 5, 10])
+
+    suite = sub.add_parser("suite", help="stage timings, end-to-end throughput and peak RSS against a baseline")
+    suite.add_argument("--video", default=DEFAULT_VIDEO)
+    suite.add_argument("--frames", type=int, default=None)
+    suite.add_argument("--synthetic-frames", type=int, default=60)
+    suite.add_argument("--repeat", type=int, default=3, help="passes per dataset, the fastest counts")
+    suite.add_argument("--output", help="write the results as JSON to this path")
+    suite.add_argument("--baseline", default=DEFAULT_BASELINE)
+    suite.add_argument("--threshold", type=float, default=0.25, help="allowed relative regression")
+    suite.add_argument("--update-baseline", action="store_true", help="store these results as the baseline")
+
+    args = parser.parse_args()
+    if args.command == "parallel":
+        worker_counts = sorted(set(args.workers))
+        if max(worker_counts) > app.MAX_CHUNK_PROCESSES:
+            # Let the pool grow to the largest count being measured
+            app.MAX_CHUNK_PROCESSES = max(worker_counts)
+        bench_parallel(args.video, worker_counts, args.repeat)
+    elif args.command == "preprocess":
+        if not bench_preprocess(args.video, args.frames):
+            sys.exit(1)
+    elif args.command == "ransac":
+        bench_ransac(args.video, args.frames)
+    elif args.command == "skip":
+        bench_skip(args.video, args.frames, sorted(set(args.every)))
+    elif args.command == "suite":
+        results = bench_suite(args.video, args.frames, args.synthetic_frames, args.repeat)
+        for dataset, stages in results["stages"].items():
+            print(f"{dataset:<16} process_frame {stages['process_frame']['mean_ms']:>8.2f} ms mean, "
+                  f"{stages['process_frame']['p95_ms']:>8.2f} ms p95")
+        for mode, report in results["end_to_end"].items():
+            print(f"{mode:<16} {report['fps']:>8.1f} fps, peak RSS {report['peak_rss_mb']:.0f} MB")
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+        if args.update_baseline:
+            with open(args.baseline, "w") as f:
+                json.dump(results, f, indent=2)
+            print(f"baseline written to {args.baseline}")
+        elif os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                regressions = compare_results(results, json.load(f), args.threshold)
+            for line in regressions:
+                print(f"REGRESSION {line}")
+            if regressions:
+                sys.exit(1)
+            print(f"no regressions beyond {100 * args.threshold:.0f}% against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
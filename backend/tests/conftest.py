@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import app and benchmark as the backend scripts do
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
@@ -0,0 +1,68 @@
+"""Batch runs resuming from their checkpoint"""
+import json
+import os
+
+import cv2
+import pytest
+
+import batch
+import benchmark
+
+OPTIONS = dict(workers=1, mode="analytics", telemetry="jsonl", work_width=None, output_width=None,
+               detect_every=1, adaptive_skip=False, detection_profile="fast", auto_profile=False)
+
+
+def write_video(path, seed):
+    frames = benchmark.synthetic_frames(320, 180, 8, seed=seed)
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 10, (320, 180))
+    for frame in frames:
+        out.write(frame)
+    out.release()
+    return os.path.abspath(path)
+
+
+@pytest.fixture
+def videos(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return [write_video(f"clip{i}.mp4", i) for i in range(2)]
+
+
+def test_load_checkpoint_ignores_torn_and_failed_lines(tmp_path):
+    path = tmp_path / batch.CHECKPOINT_NAME
+    entries = [{"key": "a", "status": "completed"}, {"key": "b", "status": "error", "message": "bad"}]
+    path.write_text("".join(json.dumps(entry) + "\n" for entry in entries) + '{"key": "c", "sta')
+    assert batch.load_checkpoint(str(path)) == {"a": entries[0]}
+    assert batch.load_checkpoint(str(tmp_path / "missing.jsonl")) == {}
+
+
+def test_rerun_skips_completed_videos_after_a_crash(videos, capsys):
+    completed, failed = batch.run_batch(videos[:1], "out", OPTIONS, processes=1)
+    assert len(completed) == 1 and not failed
+    # The crash left half a line behind
+    with open(os.path.join("out", batch.CHECKPOINT_NAME), "a") as f:
+        f.write('{"key": "' + videos[1])
+    capsys.readouterr()
+
+    completed, failed = batch.run_batch(videos, "out", OPTIONS, processes=1)
+    assert "1 already done, 1 to process" in capsys.readouterr().out
+    assert sorted(entry["video"] for entry in completed) == videos and not failed
+    with open(os.path.join("out", batch.INDEX_NAME)) as f:
+        index = json.load(f)
+    assert index["videos"] == 2 and index["frames"] == 16
+    for entry in completed:
+        assert os.path.exists(os.path.join("out", entry["outputs"]["telemetry"]))
+
+    # The entry written after the torn line survives into the next run
+    batch.run_batch(videos, "out", OPTIONS, processes=1)
+    assert "2 already done, 0 to process" in capsys.readouterr().out
+    # Importing the app for its detection loop leaves no server directories behind
+    assert not os.path.exists("uploads") and not os.path.exists("cache")
+
+
+def test_checkpoint_of_other_options_is_refused(videos):
+    os.makedirs("out")
+    entry = {"key": batch.video_key(videos[0], OPTIONS), "video": videos[0], "status": "completed"}
+    with open(os.path.join("out", batch.CHECKPOINT_NAME), "w") as f:
+        f.write(json.dumps(entry) + "\n")
+    with pytest.raises(ValueError, match="different options"):
+        batch.run_batch(videos, "out", {**OPTIONS, "detect_every": 2}, processes=1)
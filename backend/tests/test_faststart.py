@@ -0,0 +1,66 @@
+"""faststart moves moov ahead of mdat without breaking a single frame"""
+import os
+
+import cv2
+import numpy as np
+
+import app
+import benchmark
+
+
+def read_all(path):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def box_kinds(path):
+    with open(path, "rb") as f:
+        return [kind for kind, _, _ in app._mp4_boxes(f, os.path.getsize(path))]
+
+
+def test_faststart_moves_moov_and_keeps_every_frame(tmp_path):
+    path = str(tmp_path / "clip.mp4")
+    frames = benchmark.synthetic_frames(320, 180, 60)
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 25, (320, 180))
+    for frame in frames:
+        out.write(frame)
+    out.release()
+    before = read_all(path)
+    size = os.path.getsize(path)
+    assert box_kinds(path).index(b"moov") > box_kinds(path).index(b"mdat")
+
+    assert app.faststart(path)
+    assert [kind for kind in box_kinds(path) if kind != b"free"] == [b"ftyp", b"moov", b"mdat"]
+    assert os.path.getsize(path) == size
+    after = read_all(path)
+    assert len(after) == len(before) == len(frames)
+    assert all(np.array_equal(a, b) for a, b in zip(after, before))
+
+    # Already fast-start files are left alone
+    assert not app.faststart(path)
+
+
+def sample_table(kind, offsets, dtype):
+    entries = np.array(offsets, dtype=dtype).tobytes()
+    return app._box(b"moov", app._box(b"trak", app._box(b"mdia", app._box(b"minf", app._box(
+        b"stbl", app._full_box(kind, 0, 0, len(offsets).to_bytes(4, "big"), entries))))))
+
+
+def test_chunk_offsets_shift_in_stco_and_co64():
+    for kind, dtype in ((b"stco", ">u4"), (b"co64", ">u8")):
+        moov = bytearray(sample_table(kind, [48, 1000, 2 ** 31], dtype))
+        assert app._shift_chunk_offsets(moov, 500, 8, len(moov))
+        entries = np.frombuffer(bytes(moov[-24 if kind == b"co64" else -12:]), dtype=dtype)
+        assert entries.tolist() == [548, 1500, 2 ** 31 + 500]
+
+
+def test_stco_overflow_leaves_the_file_to_the_caller():
+    moov = bytearray(sample_table(b"stco", [2 ** 32 - 100], ">u4"))
+    assert not app._shift_chunk_offsets(moov, 500, 8, len(moov))
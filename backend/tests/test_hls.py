@@ -0,0 +1,49 @@
+"""HLS output: fMP4 segments against one init segment, cut the same way by every worker layout"""
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+import app
+import benchmark
+
+
+@pytest.mark.parametrize("frame_total,chunks", [(150, 2), (150, 3), (1000, 7), (40, 4)])
+def test_plan_chunks_aligns_inner_boundaries(frame_total, chunks):
+    ranges = app.plan_chunks(frame_total, chunks, align=50)
+    assert ranges[0][0] == 0 and ranges[-1][1] == frame_total
+    assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+    assert all(start % 50 == 0 for start, _ in ranges)
+
+
+def write_segments(directory, frames, fps, ranges):
+    for start, end in ranges:
+        out = app.SegmentWriter(str(directory), fps, (frames[0].shape[1], frames[0].shape[0]), first_frame=start)
+        for frame in frames[start:end]:
+            out.write(frame)
+        out.release()
+
+
+def test_segments_decode_as_one_stream(tmp_path):
+    fps, total = 10, 45
+    frames = benchmark.synthetic_frames(320, 180, total)
+    write_segments(tmp_path, frames, fps, app.plan_chunks(total, 2, align=app.hls_segment_frames(fps)))
+    names = sorted(name for name in os.listdir(tmp_path) if app.SEGMENT_NAME.fullmatch(name))
+    assert names == ["seg_0000000_20.m4s", "seg_0000020_20.m4s", "seg_0000040_5.m4s"]
+
+    playlist = open(app.write_playlist(str(tmp_path), fps, ended=True)).read()
+    assert '#EXT-X-MAP:URI="init.mp4"' in playlist and playlist.count("#EXTINF") == 3
+
+    # A player appends every media segment to the init segment
+    joined = tmp_path / "joined.mp4"
+    with open(joined, "wb") as f:
+        for name in [app.HLS_INIT_NAME] + names:
+            f.write((tmp_path / name).read_bytes())
+    cap = cv2.VideoCapture(str(joined))
+    timestamps = []
+    while cap.read()[0]:
+        timestamps.append(cap.get(cv2.CAP_PROP_POS_MSEC))
+    cap.release()
+    assert len(timestamps) == total
+    assert np.allclose(np.diff(timestamps), 1000 / fps)
@@ -0,0 +1,38 @@
+"""Job registry: trimmed jobs take their output files with them"""
+import os
+
+import app
+
+
+def finished_job(manager, state="completed"):
+    job = app.DetectionJob("clip.mp4")
+    job.state, job.finished_at = state, 1.0
+    with open(app.job_output_path(job.job_id), "w") as f:
+        f.write("video")
+    with open(app.job_output_path(job.job_id, ".jsonl"), "w") as f:
+        f.write("{}\n")
+    os.makedirs(app.job_output_path(job.job_id, "_hls"))
+    with open(os.path.join(app.job_output_path(job.job_id, "_hls"), "seg_0000000_50.m4s"), "w") as f:
+        f.write("segment")
+    manager.jobs[job.job_id] = job
+    return job
+
+
+def test_trimmed_jobs_lose_their_outputs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("output")
+    manager = app.JobManager(max_history=2)
+    jobs = [finished_job(manager), finished_job(manager, "error"), finished_job(manager, "cancelled")]
+    # A finishing job that has not written its last file yet is never trimmed
+    running = finished_job(manager)
+    running.finished_at = None
+
+    with manager.lock:
+        trimmed = manager._trim_history()
+    manager._remove_outputs(trimmed)
+
+    assert trimmed == [jobs[0].job_id, jobs[1].job_id]
+    assert list(manager.jobs) == [jobs[2].job_id, running.job_id]
+    left = sorted(os.listdir("output"))
+    assert not any(name.startswith((jobs[0].job_id, jobs[1].job_id)) for name in left)
+    assert sum(name.startswith(jobs[2].job_id) for name in left) == 3
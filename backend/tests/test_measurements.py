@@ -0,0 +1,42 @@
+"""Metric lane measurements must not depend on the working resolution"""
+import numpy as np
+import pytest
+
+import app
+
+
+def measure(width, height, left_fit, right_fit):
+    detector = app.AdvancedLaneDetector()
+    return detector.calculate_curvature_and_offset(left_fit, right_fit, width, height)
+
+
+@pytest.mark.parametrize("scale", [0.5, 2 / 3, 1.5])
+def test_offset_and_curvature_independent_of_work_width(scale):
+    width, height = app.AUTO_WORK_WIDTH, 405
+    left_fit = np.array([2e-4, -0.1, 180.0])
+    right_fit = np.array([1e-4, 0.05, 520.0])
+    expected = measure(width, height, left_fit, right_fit)
+    offset, departure, curvature = measure(width * scale, height * scale,
+                                           app.scale_fit(left_fit, scale, scale),
+                                           app.scale_fit(right_fit, scale, scale))
+    assert offset == pytest.approx(expected[0])
+    assert curvature == pytest.approx(expected[2])
+    assert departure == expected[1]
+
+
+def test_histories_stay_on_one_scale_across_a_resolution_drop():
+    # run_live halves the working size at degrade level 2 and rescales the history
+    detector = app.AdvancedLaneDetector()
+    width, height = app.AUTO_WORK_WIDTH, 405
+    left_fit = np.array([2e-4, -0.1, 180.0])
+    right_fit = np.array([1e-4, 0.05, 520.0])
+    for _ in range(5):
+        detector.calculate_curvature_and_offset(left_fit, right_fit, width, height)
+    detector.rescale_history(0.5, 0.5)
+    for _ in range(5):
+        detector.calculate_curvature_and_offset(app.scale_fit(left_fit, 0.5, 0.5),
+                                                app.scale_fit(right_fit, 0.5, 0.5), width // 2, height / 2)
+    offsets = list(detector.offset_history)
+    curvatures = list(detector.curvature_history)
+    assert np.allclose(offsets, offsets[0])
+    assert np.allclose(curvatures, curvatures[0])
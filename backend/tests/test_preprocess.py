@@ -0,0 +1,65 @@
+"""Golden-mask equivalence of preprocess against the original float64 implementation"""
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+import app
+import benchmark
+
+
+def clip_frames(count=4, step=40):
+    cap = cv2.VideoCapture(benchmark.DEFAULT_VIDEO)
+    frames = []
+    for index in range(count * step):
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if index % step == 0:
+            frames.append(frame)
+    cap.release()
+    return frames
+
+
+def golden_frames():
+    frames = benchmark.synthetic_frames(640, 360, 3)
+    if os.path.exists(benchmark.DEFAULT_VIDEO):
+        frames += clip_frames()
+    # Darkened copies exercise the night thresholds
+    return frames + [(frame * 0.4).astype(np.uint8) for frame in frames]
+
+
+@pytest.mark.parametrize("frame", golden_frames())
+def test_preprocess_matches_reference_inside_roi(frame):
+    detector = app.AdvancedLaneDetector()
+    golden = detector.adaptive_roi(benchmark.reference_preprocess(frame))
+    assert np.array_equal(detector.adaptive_roi(detector.preprocess(frame)), golden)
+
+
+def test_preprocess_reuses_mask_without_leaking_between_frames():
+    detector = app.AdvancedLaneDetector()
+    first, second = benchmark.synthetic_frames(640, 360, 2)
+    detector.preprocess(first)
+    expected = app.AdvancedLaneDetector().preprocess(second).copy()
+    assert np.array_equal(detector.preprocess(second), expected)
+
+
+@pytest.mark.parametrize("max_value", [1, 7, 255, 256, 510, 765, 1020, 4080, 12345, 65025])
+def test_scaled_threshold_matches_uint8_scaling(max_value):
+    # Multiples of 255 put 255 * v / max_value exactly on integers, where rounding decides
+    v = np.arange(max_value + 1, dtype=np.float64)
+    scaled = np.uint8(255 * v / np.float64(max_value))
+    for t in range(1, 256):
+        expected = int(np.argmax(scaled >= t)) if scaled[-1] >= t else max_value + 1
+        assert app.AdvancedLaneDetector._scaled_threshold(t, max_value) == expected
+
+
+@pytest.mark.parametrize("max_value", [1, 255, 65025, 260100, 1000003])
+def test_scaled_threshold_squared_matches_magnitude_scaling(max_value):
+    # Perfect squares such as 255**2 and 510**2 make sqrt ratios hit integers exactly
+    v = np.arange(max_value + 1, dtype=np.float64)
+    scaled = np.uint8(255 * np.sqrt(v) / np.sqrt(np.float64(max_value)))
+    for t in range(1, 256):
+        expected = int(np.argmax(scaled >= t))
+        assert app.AdvancedLaneDetector._scaled_threshold(t, max_value, squared=True) == expected
@@ -0,0 +1,81 @@
+"""Result cache hits, LRU eviction under the disk budget, staleness across detector versions"""
+import os
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("output")
+    return tmp_path
+
+
+def finished_job(payload, frames=10):
+    job = app.DetectionJob("clip.mp4", {"mode": "render"})
+    with open(app.job_output_path(job.job_id), "wb") as f:
+        f.write(payload)
+    job.frames_done = frames
+    job.file_size_mb = 0.0
+    job.stats = {"work_size": [720, 405]}
+    return job
+
+
+def test_stored_result_is_restored(workdir):
+    cache = app.ResultCache("cache", 1 << 20)
+    key = cache.key("digest", {"mode": "render"})
+    cache.store(key, finished_job(b"video", frames=42))
+
+    job = app.DetectionJob("clip.mp4", {"mode": "render"})
+    assert cache.restore(key, job)
+    assert job.frames_done == job.frames_total == 42
+    assert job.stats["cache"] == "hit" and job.stats["work_size"] == [720, 405]
+    with open(app.job_output_path(job.job_id), "rb") as f:
+        assert f.read() == b"video"
+    assert not cache.restore(cache.key("other", {"mode": "render"}), app.DetectionJob("clip.mp4"))
+
+
+def test_least_recently_used_entries_are_evicted(workdir):
+    cache = app.ResultCache("cache", 2500)
+    keys = [cache.key(f"digest{i}", {}) for i in range(3)]
+    for age, key in enumerate(keys[:2]):
+        cache.store(key, finished_job(b"x" * 1000))
+        # Older entries carry older meta.json mtimes
+        os.utime(os.path.join("cache", key, "meta.json"), (1000 + age, 1000 + age))
+    # Using the oldest entry makes it the most recent
+    assert cache.restore(keys[0], app.DetectionJob("clip.mp4"))
+
+    cache.store(keys[2], finished_job(b"x" * 1000))
+    assert sorted(os.listdir("cache")) == sorted([keys[0], keys[2]])
+    # An entry larger than the whole budget is never stored
+    cache.store(cache.key("huge", {}), finished_job(b"x" * 3000))
+    assert sorted(os.listdir("cache")) == sorted([keys[0], keys[2]])
+
+
+def test_new_detector_version_misses(workdir, monkeypatch):
+    cache = app.ResultCache("cache", 1 << 20)
+    options = {"mode": "render", "work_width": 640}
+    key = cache.key("digest", options)
+    cache.store(key, finished_job(b"video"))
+    # Options outside CACHE_KEY_OPTIONS do not split the cache
+    assert cache.key("digest", {**options, "profile": True}) == key
+    assert cache.key("digest", {**options, "work_width": 720}) != key
+
+    monkeypatch.setattr(app, "DETECTOR_VERSION", app.DETECTOR_VERSION + 1)
+    assert not cache.restore(cache.key("digest", options), app.DetectionJob("clip.mp4"))
+
+
+def test_file_digests_are_bounded(workdir, monkeypatch):
+    monkeypatch.setattr(app, "_digests", app.OrderedDict())
+    monkeypatch.setattr(app, "DIGESTS_KEPT", 3)
+    paths = []
+    for i in range(5):
+        paths.append(f"output/{i}.bin")
+        with open(paths[-1], "wb") as f:
+            f.write(bytes([i]) * 10)
+        app.file_digest(paths[-1])
+    assert len(app._digests) == 3
+    assert app.file_digest(paths[0]) == app.file_digest(paths[0])
+    assert [memo[0] for memo in app._digests] == [os.path.abspath(p) for p in (paths[3], paths[4], paths[0])]
@@ -0,0 +1,73 @@
+"""Detector checkpoints and the O(1) history means they rely on"""
+import json
+
+import numpy as np
+import pytest
+
+import app
+import benchmark
+
+
+def frames():
+    clip = benchmark.synthetic_frames(640, 360, 40)
+    # A few empty frames lose the lanes, so the lost counters and profile switching are exercised too
+    blank = [np.zeros_like(clip[0])] * 6
+    return clip[:15] + blank + clip[15:]
+
+
+def run(detector, clip):
+    return [detector.detect(frame) for frame in clip]
+
+
+def assert_same(results, expected):
+    assert len(results) == len(expected)
+    for got, want in zip(results, expected):
+        for a, b in zip(got, want):
+            if a is None or b is None:
+                assert a is b
+            else:
+                # Loading recomputes the history sums, which may differ from the running ones in the last bit
+                np.testing.assert_allclose(a, b, rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize("split", [1, 18, 30])
+def test_checkpoint_round_trip_matches_uninterrupted_run(split):
+    clip = frames()
+    expected = run(app.AdvancedLaneDetector(seed=7, auto_profile=True), clip)
+
+    first = app.AdvancedLaneDetector(seed=7, auto_profile=True)
+    head = run(first, clip[:split])
+    state = json.loads(json.dumps(first.state_dict()))
+    resumed = app.AdvancedLaneDetector(seed=123, auto_profile=True).load_state(state)
+    assert resumed.profile_switches == first.profile_switches
+    assert resumed.use_ransac == first.use_ransac
+    assert_same(head + run(resumed, clip[split:]), expected)
+
+
+@pytest.mark.parametrize("shape", [(), (3,)])
+def test_ring_history_means_across_wraparound(shape):
+    rng = np.random.default_rng(0)
+    history = app.RingHistory(8, shape)
+    values = []
+    for _ in range(30):
+        value = rng.normal(size=shape) * 100
+        history.append(value)
+        values.append(value)
+        window = np.array(values[-8:])
+        n = len(window)
+        weights = np.linspace(0.2, 1.0, n)
+        np.testing.assert_allclose(history.mean(), window.mean(axis=0), rtol=1e-9, atol=1e-9)
+        np.testing.assert_allclose(history.weighted_mean(), np.average(window, axis=0, weights=weights),
+                                   rtol=1e-9, atol=1e-9)
+        np.testing.assert_array_equal(history.state(), window)
+
+
+def test_ring_history_loads_lists_and_empty_state():
+    history = app.RingHistory(4, (3,))
+    history.load([])
+    assert len(history) == 0
+    items = np.arange(18.0).reshape(6, 3)
+    history.load(items.tolist())
+    np.testing.assert_array_equal(history.state(), items[-4:])
+    np.testing.assert_allclose(history.weighted_mean(),
+                               np.average(items[-4:], axis=0, weights=np.linspace(0.2, 1.0, 4)))
@@ -0,0 +1,69 @@
+"""Stream server scheduling against fake live sources"""
+import threading
+import time
+
+import numpy as np
+
+import app
+
+
+class FakeSource:
+    """LiveSource stand-in: frames are pushed by the test, release can hang like a stuck camera"""
+
+    def __init__(self, release_seconds=0.0):
+        self.release_seconds = release_seconds
+        self.frame = None
+        self.ended = False
+        self.dropped = 0
+        self.reads = 0
+        self.released = threading.Event()
+
+    def read(self, timeout=1.0):
+        self.reads += 1
+        frame, self.frame = self.frame, None
+        return frame, time.monotonic()
+
+    def release(self):
+        time.sleep(self.release_seconds)
+        self.released.set()
+
+
+def add_stream(server, source):
+    stream = app.DetectorStream(f"{len(server.streams):012x}", "fake", source, render=False)
+    with server.cond:
+        server.streams[stream.stream_id] = stream
+    return stream
+
+
+def test_eviction_does_not_wait_for_a_stuck_source():
+    server = app.StreamServer(max_workers=1)
+    stuck = FakeSource(release_seconds=2.0)
+    stream = add_stream(server, stuck)
+    stuck.ended = True
+
+    started = time.monotonic()
+    server._evict([stream])
+    assert time.monotonic() - started < 0.5
+    assert server.get(stream.stream_id) is None and server.evicted == 1
+    assert stuck.released.wait(5.0)
+
+
+def test_idle_scheduler_sleeps_until_a_frame_arrives():
+    server = app.StreamServer(max_workers=1)
+    sources = [FakeSource() for _ in range(3)]
+    streams = [add_stream(server, source) for source in sources]
+    server.thread = threading.Thread(target=server._schedule, daemon=True)
+    server.thread.start()
+
+    time.sleep(0.5)
+    # One pass over the idle sources, not one every few milliseconds
+    assert all(source.reads <= 3 for source in sources)
+
+    sources[1].frame = np.zeros((180, 320, 3), np.uint8)
+    server._wake()
+    deadline = time.monotonic() + 5.0
+    while streams[1].frames_done == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert streams[1].frames_done == 1
+    for stream in streams:
+        server.remove(stream.stream_id)
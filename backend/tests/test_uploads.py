@@ -0,0 +1,146 @@
+"""Resumable uploads through /uploads, and detection following an upload as it arrives"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import ClientDisconnect, Request
+
+import app
+import benchmark
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("uploads")
+    monkeypatch.setattr(app, "upload_sessions", {})
+    monkeypatch.setattr(app, "upload_files", None)
+    return TestClient(app.app)
+
+
+def create(client, data, filename="clip.mp4"):
+    return client.post("/uploads", params={"filename": filename, "size": len(data)}).json()
+
+
+def test_upload_in_parts_completes_with_digest(client):
+    data = os.urandom(3 * app.UPLOAD_BLOCK + 123)
+    upload = create(client, data)
+    first = client.put(f"/uploads/{upload['upload_id']}", params={"offset": 0}, content=data[:1000000]).json()
+    assert first["offset"] == 1000000 and not first["complete"]
+
+    done = client.put(f"/uploads/{upload['upload_id']}", params={"offset": 1000000}, content=data[1000000:]).json()
+    assert done["complete"] and done["sha256"] == hashlib.sha256(data).hexdigest()
+    with open(f"uploads/{upload['filename']}", "rb") as f:
+        assert f.read() == data
+    # The finished session is retired, its final status still answers
+    assert upload["upload_id"] not in app.upload_sessions
+    assert client.get(f"/uploads/{upload['upload_id']}").json()["complete"]
+    assert app.receiving_upload(upload["filename"]) is None
+
+
+def test_offset_mismatch_is_refused(client):
+    data = os.urandom(5000)
+    upload = create(client, data)
+    client.put(f"/uploads/{upload['upload_id']}", params={"offset": 0}, content=data[:2000])
+    reply = client.put(f"/uploads/{upload['upload_id']}", params={"offset": 1000}, content=data[1000:]).json()
+    assert reply["status"] == "error" and reply["offset"] == 2000
+    assert os.path.getsize(f"uploads/{upload['filename']}") == 2000
+
+
+def test_resume_after_dropped_connection(client):
+    data = os.urandom(2 * app.UPLOAD_BLOCK)
+    upload = create(client, data)
+    received = data[:app.UPLOAD_BLOCK + 777]
+    messages = [{"type": "http.request", "body": received[:5000], "more_body": True},
+                {"type": "http.request", "body": received[5000:], "more_body": True},
+                {"type": "http.disconnect"}]
+
+    async def receive():
+        return messages.pop(0)
+
+    request = Request({"type": "http", "method": "PUT", "headers": []}, receive)
+    with pytest.raises(ClientDisconnect):
+        asyncio.run(app.upload_chunk(upload["upload_id"], 0, request))
+    # Everything received before the drop is on disk and counted
+    status = client.get(f"/uploads/{upload['upload_id']}").json()
+    assert status["offset"] == len(received)
+
+    done = client.put(f"/uploads/{upload['upload_id']}", params={"offset": status["offset"]},
+                      content=data[status["offset"]:]).json()
+    assert done["complete"] and done["sha256"] == hashlib.sha256(data).hexdigest()
+
+
+def test_session_recovered_after_restart(client, monkeypatch):
+    data = os.urandom(4000)
+    upload = create(client, data)
+    client.put(f"/uploads/{upload['upload_id']}", params={"offset": 0}, content=data[:1500])
+    monkeypatch.setattr(app, "upload_sessions", {})
+    monkeypatch.setattr(app, "upload_files", None)
+
+    # Detection finds the unfinished upload by file name from the sidecars alone
+    session = app.receiving_upload(upload["filename"])
+    assert session is not None and session.offset == 1500
+    done = client.put(f"/uploads/{upload['upload_id']}", params={"offset": 1500}, content=data[1500:]).json()
+    assert done["complete"] and done["sha256"] == hashlib.sha256(data).hexdigest()
+
+
+def test_oversized_upload_is_refused(client, monkeypatch):
+    monkeypatch.setattr(app, "UPLOAD_MAX_BYTES", 1000)
+    assert create(client, b"x" * 1001)["status"] == "error"
+    assert client.post("/upload-video", files={"file": ("clip.mp4", b"x" * 1001)}).json()["status"] == "error"
+    assert os.listdir("uploads") == []
+
+
+def write_video(path, frames, faststart):
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 10, frames[0].shape[1::-1])
+    for frame in frames:
+        out.write(frame)
+    out.release()
+    if faststart:
+        app.faststart(path)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def feed(session, data, chunk=8192):
+    with open(session.path, "r+b", buffering=0) as f:
+        for start in range(0, len(data), chunk):
+            session.append(f, data[start:start + chunk])
+            time.sleep(0.002)
+    app.finish_upload(session)
+
+
+@pytest.mark.parametrize("faststart", [True, False])
+def test_growing_capture_reads_every_frame_while_uploading(client, monkeypatch, faststart):
+    monkeypatch.setattr(app, "UPLOAD_REOPEN_BYTES", 16384)
+    frames = benchmark.synthetic_frames(320, 180, 40)
+    data = write_video("source.mp4", frames, faststart)
+    cap = cv2.VideoCapture("source.mp4")
+    expected = [cap.read()[1] for _ in frames]
+    cap.release()
+
+    session = app.UploadSession.create("clip.mp4", len(data))
+    writer = threading.Thread(target=feed, args=(session, data))
+    writer.start()
+    capture = app.GrowingCapture(session, threading.Event())
+    decoded, offsets = [], []
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        decoded.append(frame)
+        offsets.append(session.offset)
+    capture.release()
+    writer.join()
+
+    assert len(decoded) == len(expected)
+    assert all(np.array_equal(a, b) for a, b in zip(decoded, expected))
+    # With moov first decoding overlaps the upload; with moov last it waits for all of it
+    assert (offsets[0] < len(data)) == faststart
+    assert capture.moov_at_end != faststart
@@ -1,12 +1,16 @@
 import React, { useState, useEffect } from "react";
 import axios from "axios";
 
+const UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024;
+
 function App() {
   const [loading, setLoading] = useState(true);
   const [currentPage, setCurrentPage] = useState('home');
   const [uploadedFileName, setUploadedFileName] = useState("");
   const [outputVideo, setOutputVideo] = useState(false);
   const [processing, setProcessing] = useState(false);
+  const [progress, setProgress] = useState(null);
+  const [jobId, setJobId] = useState("");
   const [file, setFile] = useState(null);
 
   useEffect(() => {
@@ -20,13 +24,38 @@ function App() {
       return;
     }
     try {
-      const formData = new FormData();
-      formData.append("file", file);
-      const res = await axios.post("http://localhost:8000/upload-video", formData, {
-        timeout: 60000,
-        headers: { 'Content-Type': 'multipart/form-data' }
+      // Resumable upload in chunks, streamed straight to disk on the server
+      const session = await axios.post("http://localhost:8000/uploads", null, {
+        params: { filename: file.name, size: file.size },
+        timeout: 10000
       });
-      setUploadedFileName(res.data.filename);
+      if (session.data.status === "error") {
+        throw new Error(session.data.message);
+      }
+      const uploadId = session.data.upload_id;
+      let offset = 0;
+      let retries = 0;
+      while (offset < file.size) {
+        try {
+          const res = await axios.put(`http://localhost:8000/uploads/${uploadId}`,
+            file.slice(offset, offset + UPLOAD_CHUNK_SIZE), {
+              params: { offset },
+              headers: { 'Content-Type': 'application/octet-stream' },
+              timeout: 60000
+            });
+          if (res.data.status === "error") {
+            throw new Error(res.data.message);
+          }
+          offset = res.data.offset;
+          retries = 0;
+        } catch (error) {
+          if (++retries > 3) throw error;
+          // Resume from whatever the server already received
+          const status = await axios.get(`http://localhost:8000/uploads/${uploadId}`, { timeout: 10000 });
+          offset = status.data.offset;
+        }
+      }
+      setUploadedFileName(session.data.filename);
     } catch (error) {
       console.error('Upload error:', error);
       alert("Upload failed: " + (error.response?.data?.detail || error.message));
@@ -37,16 +66,32 @@ function App() {
     if (!uploadedFileName) return alert("Upload video first!");
     setProcessing(true);
     setOutputVideo(false);
+    setProgress(null);
+    setJobId("");
     try {
       const processResponse = await axios.get(
         `http://localhost:8000/start-detection?filename=${uploadedFileName}`,
-        { timeout: 120000 }
+        { timeout: 30000 }
       );
-      
+
       if (processResponse.data.status === "error") {
         throw new Error(processResponse.data.message);
       }
-      
+
+      const jobId = processResponse.data.job_id;
+      setJobId(jobId);
+      let job = processResponse.data;
+      while (job.status === "queued" || job.status === "running") {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        const statusResponse = await axios.get(`http://localhost:8000/jobs/${jobId}`, { timeout: 10000 });
+        job = statusResponse.data;
+        setProgress(job);
+      }
+
+      if (job.status !== "completed") {
+        throw new Error(job.message || `Detection ${job.status}`);
+      }
+
       setOutputVideo(true);
     } catch (error) {
       console.error('Processing error:', error);
@@ -57,7 +102,7 @@ function App() {
 
   const handleDownload = () => {
     const link = document.createElement('a');
-    link.href = `http://localhost:8000/download-video?filename=${uploadedFileName}`;
+    link.href = `http://localhost:8000/download-video?job_id=${jobId}`;
     link.download = 'lanesight_processed_video.mp4';
     document.body.appendChild(link);
     link.click();
@@ -920,6 +965,26 @@ function App() {
               WebkitTextFillColor: 'transparent'
             }}>AI Processing</h3>
             <p style={{ color: '#cbd5e1', margin: 0, fontSize: '1.1rem' }}>Neural networks analyzing lane boundaries and vehicle position...</p>
+            {progress && progress.frames_total > 0 && (
+              <p style={{ color: '#94a3b8', margin: '10px 0 0 0', fontSize: '0.95rem' }}>
+                {progress.frames_done} / {progress.frames_total} frames · {progress.fps} FPS
+                {progress.eta_seconds !== null && ` · ~${Math.ceil(progress.eta_seconds)}s left`}
+              </p>
+            )}
+            {jobId && (
+              <img
+                src={`http://localhost:8000/live-video?job_id=${jobId}`}
+                alt="Live lane detection preview"
+                style={{
+                  display: 'block',
+                  width: '100%',
+                  maxWidth: '640px',
+                  margin: '20px auto 0 auto',
+                  borderRadius: '12px',
+                  position: 'relative'
+                }}
+              />
+            )}
             
             {/* Progress Bar */}
             <div style={{
@@ -931,11 +996,11 @@ function App() {
               overflow: 'hidden'
             }}>
               <div style={{
-                width: '60%',
+                width: progress && progress.frames_total > 0 ? `${Math.round(progress.progress * 100)}%` : '60%',
                 height: '100%',
                 background: 'linear-gradient(90deg, #3b82f6, #8b5cf6)',
                 borderRadius: '2px',
-                animation: 'progress 3s ease-in-out infinite'
+                animation: progress && progress.frames_total > 0 ? 'none' : 'progress 3s ease-in-out infinite'
               }}></div>
             </div>
           </div>
@@ -977,7 +1042,7 @@ function App() {
                 backgroundColor: '#000'
               }}
             >
-              <source src={`http://localhost:8000/download-video?t=${Date.now()}`} type="video/mp4" />
+              <source src={`http://localhost:8000/stream-video?job_id=${jobId}`} type="video/mp4" />
               Video not supported
             </video>
           </div>